@@ -1,16 +1,119 @@
+import atexit
 import json
 import os
+import threading
+import time
+import uuid
 import pandas as pd
 import altair as alt
-from datetime import datetime
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from myapp.analytics.sqlite_store import SQLiteAnalyticsStore
+from myapp.core.filelock import FileLock
+from myapp.core.metrics import REGISTRY
+
+# Métricas de /metrics: _record va en el camino de cada petición; flush y compact en segundo plano
+ANALYTICS_SECONDS = REGISTRY.histogram(
+    "analytics_seconds", "AnalyticsData time per operation: record, flush, compact", ("operation",)
+)
+ANALYTICS_EVENTS = REGISTRY.counter(
+    "analytics_events_total", "Analytics events recorded, by type", ("type",)
+)
+
+class TopCounter:
+    """
+    Counter with O(log n) increments and top-N reads that do not sort:
+    keys are grouped in buckets by count and the distinct counts are kept
+    in a sorted list. Keys with the same count keep insertion order.
+    """
+
+    def __init__(self, counts=None):
+        self._counts = {} # key -> count
+        self._buckets = {} # count -> {key: None} (conjunto ordenado)
+        self._levels = [] # counts distintos, ascendente
+        for key, count in (counts or {}).items():
+            self.increment(key, count)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, key):
+        return key in self._counts
+
+    def get(self, key, default=0):
+        return self._counts.get(key, default)
+
+    def increment(self, key, by=1):
+        old = self._counts.get(key)
+        if old is not None:
+            bucket = self._buckets[old]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[old]
+                del self._levels[bisect_left(self._levels, old)]
+        new = (old or 0) + by
+        self._counts[key] = new
+        if new not in self._buckets:
+            self._buckets[new] = {}
+            insort(self._levels, new)
+        self._buckets[new][key] = None
+
+    def top(self, n=None):
+        """[(key, count), ...] ordered by count, descending."""
+        result = []
+        for count in reversed(self._levels):
+            for key in self._buckets[count]:
+                if n is not None and len(result) >= n:
+                    return result
+                result.append((key, count))
+        return result
+
 
 class AnalyticsData:
     """
-    An in memory persistence object that saves to a JSON file.
+    An in memory persistence object backed by an append-only event log.
+
+    Every register_session / save_query_terms / update_click appends one
+    event (JSON Lines) to an in-memory buffer; a background thread flushes
+    the buffer to `log_file` when it reaches `flush_size` events or every
+    `flush_interval` seconds, so requests never wait on disk I/O. Every
+    `compact_every` events the full state is written to `db_file` as a
+    snapshot and the log is replaced by an empty one. On load_data the
+    snapshot is read and the log is replayed on top of it (events carry a
+    sequence number, so a crash between snapshot and log reset never
+    double counts).
+
+    Several processes (e.g. gunicorn workers) can share the same files:
+    every write to the log or the snapshot happens under a cross-process
+    file lock, and before writing each process first applies the events
+    the other workers appended since its last flush, so sequence numbers
+    stay global and a compaction never drops someone else's events.
+    Query ids are reserved in blocks from a shared counter, so they are
+    unique across workers (but not consecutive between them).
+
+    With backend="sqlite" the same buffered events are written to a SQLite
+    database instead (one transaction per flush) and the dashboard
+    aggregates are computed in SQL; the in-memory tables stay empty.
+
+    The dashboard aggregates (clicks per doc, queries per session, queries
+    per hour) are updated incrementally as events are applied, and the
+    chart JSON is cached until the data it plots changes.
     """
     
-    def __init__(self):
-        self.db_file = "data/analytics_db.json"
+    def __init__(self, db_file="data/analytics_db.json", log_file="data/analytics_events.jsonl",
+                 flush_size=100, flush_interval=1.0, compact_every=10000,
+                 backend="json", sqlite_path="data/analytics.sqlite3", id_block_size=100):
+        if backend not in ("json", "sqlite"):
+            raise ValueError(f"Unknown analytics backend '{backend}'")
+        self.backend = backend
+        self.store = SQLiteAnalyticsStore(sqlite_path) if backend == "sqlite" else None
+        self.db_file = db_file
+        self.log_file = log_file
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.id_block_size = id_block_size
         # Initialize tables
         self.fact_clicks = {} # {doc_id: count}
         self.fact_queries = [] # List of dicts
@@ -18,12 +121,62 @@ class AnalyticsData:
 
         # {session_id: {session_id, user_ip, browser, os, start_time, query_count}}
         self.fact_sessions = {}
+        # Sesiones ya registradas en este proceso (backend sqlite)
+        self._known_sessions = set()
+
+        # Agregados incrementales para el dashboard (backend json)
+        self.click_counts = TopCounter() # doc_id -> clicks
+        self.session_counts = TopCounter() # session_id -> queries
+        self.queries_per_hour = {} # "YYYY-MM-DD HH" -> queries
+        # nombre -> (filas dibujadas, JSON de Altair)
+        self._chart_cache = {}
+
+        # Event log state
+        self.last_seq = 0 # último evento aplicado
+        self._buffer = [] # eventos pendientes de escribir
+        self._events_since_compaction = 0
+        self._log_offset = 0 # bytes del log ya aplicados
+        self._log_id = None # cabecera del log: cambia cuando alguien compacta
+        # Bloque de ids de query reservado: [_next_query_id, _query_id_limit)
+        self._next_query_id = 0
+        self._query_id_limit = 0
+        self._lock = threading.RLock() # estado en memoria
+        self._io_lock = threading.Lock() # un solo flush a la vez dentro del proceso
+        self._id_lock = threading.Lock() # bloque de ids de query
+        # Entre procesos: log, snapshot y contador de ids
+        self._file_lock = FileLock(log_file + ".lock")
+        self._id_file = log_file + ".ids"
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
         
         # Load existing data if file exists
         self.load_data()
 
+        self._flusher = threading.Thread(target=self._flush_loop, name="analytics-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # --- Persistencia: snapshot + log de eventos ---
+
     def load_data(self):
-        """Load data from JSON file"""
+        """Load the JSON snapshot and replay the event log on top of it"""
+        if self.store is not None:
+            self.last_query_id = self.store.max_query_id()
+            clicked, sessions = self.store.counts()
+            print(f"Analytics loaded from {self.store.db_path}: {clicked} docs clicked, {sessions} sessions.")
+            return
+
+        with self._file_lock, self._lock:
+            self._load_files()
+            replayed = self._events_since_compaction
+
+        print(f"Analytics loaded: {len(self.fact_clicks)} docs clicked,"
+              f"{len(self.fact_sessions)} sessions, {replayed} events replayed.")
+
+    def _load_files(self):
+        """Reset the tables from the snapshot and the whole log (caller holds both locks)."""
+        self.fact_clicks, self.fact_queries, self.fact_sessions = {}, [], {}
+        self.last_query_id = self.last_seq = 0
         if os.path.exists(self.db_file):
             try:
                 with open(self.db_file, 'r') as f:
@@ -32,28 +185,270 @@ class AnalyticsData:
                     self.fact_queries = data.get('fact_queries', [])
                     self.last_query_id = data.get('last_query_id', 0)
                     self.fact_sessions = data.get('fact_sessions', {})
-                print(f"Analytics loaded: {len(self.fact_clicks)} docs clicked,"
-                      f"{len(self.fact_sessions)} sessions.")
-                
+                    self.last_seq = data.get('last_seq', 0)
             except Exception as e:
                 print(f"Error loading analytics: {e}")
 
-    def save_data(self):
-        """Save data to JSON file"""
-        data = {
-            'fact_clicks': self.fact_clicks,
-            'fact_queries': self.fact_queries,
-            'last_query_id': self.last_query_id,
-            'fact_sessions': self.fact_sessions
-        }
+        self._rebuild_aggregates()
+        self._log_offset = 0
+        self._log_id = None
+        self._events_since_compaction = self._read_log()
+
+    def _rebuild_aggregates(self):
+        """Recompute the dashboard aggregates from the tables (after loading a snapshot)."""
+        self.click_counts = TopCounter(self.fact_clicks)
+        self.session_counts = TopCounter(
+            {sid: sess.get('query_count', 0) for sid, sess in self.fact_sessions.items()}
+        )
+        self.queries_per_hour = {}
+        for query in self.fact_queries:
+            self._count_query_hour(query)
+
+    def _count_query_hour(self, query):
+        hour = query.get('timestamp', '')[:13]
+        self.queries_per_hour[hour] = self.queries_per_hour.get(hour, 0) + 1
+
+    def _read_log(self):
+        """
+        Apply the log events appended after _log_offset (caller holds both locks).
+        Returns the number of events applied.
+        """
+        applied = 0
         try:
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
-            with open(self.db_file, 'w') as f:
-                json.dump(data, f, indent=4)
+            with open(self.log_file, 'rb') as f:
+                f.seek(self._log_offset)
+                valid_bytes = self._log_offset
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break # última línea a medio escribir tras un crash
+                    valid_bytes += len(line)
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if event.get('type') == 'log':
+                        self._log_id = event['id']
+                        continue
+                    if event.get('seq', 0) <= self.last_seq:
+                        continue # ya incluido en el snapshot (o escrito por nosotros)
+                    self._apply_event(event)
+                    applied += 1
+            if valid_bytes < os.path.getsize(self.log_file):
+                # Quitamos la cola corrupta para que los próximos eventos no se peguen a ella
+                with open(self.log_file, 'r+b') as f:
+                    f.truncate(valid_bytes)
+            self._log_offset = valid_bytes
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error replaying analytics log: {e}")
+        return applied
+
+    def _read_log_id(self):
+        """Id in the header line of the log file (None if missing or without header)."""
+        try:
+            with open(self.log_file, 'rb') as f:
+                header = json.loads(f.readline())
+            return header['id'] if header.get('type') == 'log' else None
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+
+    def _catch_up(self, pending):
+        """
+        Apply what other processes wrote since our last flush (caller holds
+        _file_lock). `pending` are our own applied-but-unwritten events.
+        """
+        with self._lock:
+            if self._read_log_id() != self._log_id:
+                # Otro proceso compactó (o creó el log): el snapshot lo contiene todo
+                # salvo nuestros eventos aún sin escribir, que se reaplican
+                self._load_files()
+                for event in pending + self._buffer:
+                    self._apply_event(event)
+            else:
+                self._events_since_compaction += self._read_log()
+
+    def _apply_event(self, event):
+        """Apply one event to the in-memory tables (live path and replay)."""
+        kind = event['type']
+        if self.store is not None:
+            # Las tablas viven en SQLite: solo hace falta el contador de ids
+            if kind == 'session':
+                self._known_sessions.add(event['session']['session_id'])
+            elif kind == 'query':
+                self.last_query_id = max(self.last_query_id, event['query']['id'])
+        elif kind == 'session':
+            sess = event['session']
+            if sess['session_id'] not in self.fact_sessions:
+                # Copia: el evento puede seguir en el buffer mientras la sesión cambia
+                self.fact_sessions[sess['session_id']] = dict(sess)
+                self.session_counts.increment(sess['session_id'], sess.get('query_count', 0))
+        elif kind == 'query':
+            new_query = event['query']
+            session_id = new_query.get('session_id')
+            if session_id and session_id in self.fact_sessions:
+                self.fact_sessions[session_id]['query_count'] = \
+                    self.fact_sessions[session_id].get('query_count', 0) + 1
+                self.session_counts.increment(session_id)
+            self.fact_queries.append(new_query)
+            self._count_query_hour(new_query)
+            self.last_query_id = max(self.last_query_id, new_query['id'])
+        elif kind == 'click':
+            doc_id = event['doc_id']
+            self.fact_clicks[doc_id] = self.fact_clicks.get(doc_id, 0) + 1
+            self.click_counts.increment(doc_id)
+        self.last_seq = max(self.last_seq, event.get('seq', 0))
+
+    def _record(self, event):
+        """Apply an event and queue it for the log (no disk I/O here)."""
+        start = time.perf_counter()
+        with self._lock:
+            # El número de secuencia se asigna al escribir, bajo el lock de fichero
+            self._apply_event(event)
+            self._buffer.append(event)
+            if len(self._buffer) >= self.flush_size:
+                self._wakeup.set()
+        ANALYTICS_SECONDS.observe(time.perf_counter() - start, "record")
+        ANALYTICS_EVENTS.inc(event['type'])
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _write_events(self, events):
+        """Append events to the log (or the SQLite store). Caller holds _io_lock."""
+        try:
+            if self.store is not None:
+                self.store.write_events(events)
+                return True
+            os.makedirs(os.path.dirname(self.log_file) or ".", exist_ok=True)
+            with self._lock:
+                for event in events:
+                    self.last_seq += 1
+                    event['seq'] = self.last_seq
+            with open(self.log_file, 'ab') as f:
+                lines = "".join(json.dumps(e) + "\n" for e in events)
+                if f.tell() == 0:
+                    lines = self._new_log_header() + lines
+                f.write(lines.encode())
+                self._log_offset = f.tell()
         except Exception as e:
             print(f"Error saving analytics: {e}")
+            with self._lock:
+                # Se reintentan en el siguiente flush
+                self._buffer = events + self._buffer
+            return False
+        self._events_since_compaction += len(events)
+        return True
+
+    def _new_log_header(self):
+        self._log_id = uuid.uuid4().hex
+        return json.dumps({'type': 'log', 'id': self._log_id}) + "\n"
+
+    def flush(self, compact=False):
+        """Write buffered events to the log; compact when the log is long."""
+        start = time.perf_counter()
+        with self._io_lock:
+            with self._lock:
+                events, self._buffer = self._buffer, []
+            if self.store is not None:
+                # SQLite serializa a los escritores y no necesita compactación
+                if events:
+                    self._write_events(events)
+                    ANALYTICS_SECONDS.observe(time.perf_counter() - start, "flush")
+                return
+            with self._file_lock:
+                self._catch_up(events)
+                if events and not self._write_events(events):
+                    return
+                if events:
+                    # Los flush vacíos del hilo de fondo no cuentan
+                    ANALYTICS_SECONDS.observe(time.perf_counter() - start, "flush")
+                if compact or self._events_since_compaction >= self.compact_every:
+                    with ANALYTICS_SECONDS.time("compact"):
+                        self._compact()
+
+    def _compact(self):
+        """Write a full snapshot and start an empty log (caller holds _io_lock and _file_lock)."""
+        with self._lock:
+            # Lo que quede en el buffer ya está aplicado en memoria: se escribe
+            # antes para que el snapshot y el log cubran los mismos eventos
+            events, self._buffer = self._buffer, []
+            if events and not self._write_events(events):
+                return
+            data = {
+                'fact_clicks': dict(self.fact_clicks),
+                'fact_queries': list(self.fact_queries),
+                'last_query_id': self.last_query_id,
+                'fact_sessions': {sid: dict(sess) for sid, sess in self.fact_sessions.items()},
+                'last_seq': self.last_seq,
+            }
+        try:
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            tmp_path = self.db_file + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.db_file)
+            # Los eventos del log ya están en el snapshot (seq <= last_seq).
+            # El log nuevo lleva otra cabecera: así los demás procesos
+            # detectan la compactación y recargan el snapshot
+            header = self._new_log_header()
+            with open(self.log_file, 'w') as f:
+                f.write(header)
+            self._log_offset = len(header.encode())
+            self._events_since_compaction = 0
+        except Exception as e:
+            print(f"Error compacting analytics: {e}")
 
+    def save_data(self):
+        """Flush pending events and write a full snapshot to the JSON file"""
+        self.flush(compact=True)
+
+    def close(self):
+        """Stop the background flusher and persist everything."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wakeup.set()
+        self.flush()
+        if self.store is not None:
+            self.store.close()
+
+    def _reserve_query_id(self):
+        """
+        Next unique query id. Ids are taken from a shared counter in blocks
+        of id_block_size, so disk is touched once per block.
+        """
+        # Orden de locks: _id_lock -> _file_lock. No se puede tener _lock aquí,
+        # flush() toma _file_lock -> _lock
+        with self._id_lock:
+            return self._next_id_locked()
+
+    def _next_id_locked(self):
+        if self._next_query_id >= self._query_id_limit:
+            block = self.id_block_size
+            if self.store is not None:
+                first = self.store.reserve_query_ids(block)
+            else:
+                with self._file_lock:
+                    try:
+                        with open(self._id_file, 'r') as f:
+                            next_free = int(f.read().strip() or 0)
+                    except (OSError, ValueError):
+                        next_free = 0
+                    first = max(next_free, self.last_query_id + 1)
+                    tmp_path = self._id_file + ".tmp"
+                    with open(tmp_path, 'w') as f:
+                        f.write(str(first + block))
+                    os.replace(tmp_path, self._id_file)
+            self._next_query_id, self._query_id_limit = first, first + block
+        query_id = self._next_query_id
+        self._next_query_id += 1
+        return query_id
 
     def register_session(self, session_id: str, user_ip: str, agent: dict):
         """
@@ -62,7 +457,9 @@ class AnalyticsData:
         if not session_id:
             return
 
-        if session_id not in self.fact_sessions:
+        with self._lock:
+            if self._has_session(session_id):
+                return
             browser = None
             os_name = None
             try:
@@ -71,65 +468,126 @@ class AnalyticsData:
             except Exception:
                 pass
 
-            self.fact_sessions[session_id] = {
-                "session_id": session_id,
-                "user_ip": user_ip,
-                "browser": browser,
-                "os": os_name,
-                "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "query_count": 0,
-            }
-            self.save_data()            
+            self._record({
+                "type": "session",
+                "session": {
+                    "session_id": session_id,
+                    "user_ip": user_ip,
+                    "browser": browser,
+                    "os": os_name,
+                    "start_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "query_count": 0,
+                },
+            })
+
+    def _has_session(self, session_id):
+        if self.store is None:
+            return session_id in self.fact_sessions
+        if session_id in self._known_sessions:
+            return True
+        if self.store.has_session(session_id):
+            self._known_sessions.add(session_id)
+            return True
+        return False
 
     def save_query_terms(self, terms: str,  session_id: str = None) -> int:
         """
         Saves the user query and returns a unique search_id
         """
-        self.last_query_id += 1
-        
-        new_query = {
-            'id': self.last_query_id,
-            'terms': terms,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-
-        if session_id:
-            new_query['session_id'] = session_id
-            if session_id in self.fact_sessions:
-                self.fact_sessions[session_id]['query_count'] = \
-                    self.fact_sessions[session_id].get('query_count', 0) + 1
-                
-        
-        self.fact_queries.append(new_query)
-        self.save_data() # Persist to disk
-        
-        return self.last_query_id
+        query_id = self._reserve_query_id()
+        with self._lock:
+            new_query = {
+                'id': query_id,
+                'terms': terms,
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+
+            if session_id:
+                new_query['session_id'] = session_id
+            
+            # _apply_event añade la query, actualiza la sesión y last_query_id
+            self._record({'type': 'query', 'query': new_query})
+            
+            return new_query['id']
 
     def update_click(self, doc_id):
         """
-        Increment click count for a document and save.
+        Increment click count for a document (persisted by the event log).
         """
-        if doc_id in self.fact_clicks:
-            self.fact_clicks[doc_id] += 1
-        else:
-            self.fact_clicks[doc_id] = 1
-        
-        self.save_data() # Persist to disk
+        self._record({'type': 'click', 'doc_id': doc_id})
+
+    # --- Agregados para /stats y /dashboard ---
+
+    # flush=True (por defecto) escribe antes el buffer y, con el backend json,
+    # aplica los eventos de los demás procesos, para que el resultado esté al
+    # día. Quien lee varios agregados seguidos (p.ej. /dashboard) hace un solo
+    # flush() y los pide con flush=False.
+
+    def top_clicked_docs(self, limit=None, flush=True):
+        """
+        [(doc_id, clicks), ...] ordered by clicks, descending.
+        With the sqlite backend the aggregate runs in SQL.
+        """
+        if flush:
+            self.flush()
+        if self.store is not None:
+            return self.store.top_clicked_docs(limit)
+        with self._lock:
+            return self.click_counts.top(limit)
 
-    def plot_number_of_views(self):
+    def session_query_counts(self, limit=None, flush=True):
+        """
+        [(session_id, number of queries), ...] ordered by queries, descending.
+        """
+        if flush:
+            self.flush()
+        if self.store is not None:
+            return self.store.session_query_counts(limit)
+        with self._lock:
+            return self.session_counts.top(limit)
+
+    def query_counts_by_hour(self, hours=48, flush=True):
+        """
+        [("YYYY-MM-DD HH", queries), ...] for the last `hours` hours, ascending.
+        """
+        since = (datetime.now() - timedelta(hours=hours - 1)).strftime("%Y-%m-%d %H")
+        if flush:
+            self.flush()
+        if self.store is not None:
+            return self.store.query_counts_by_hour(since)
+        with self._lock:
+            return sorted((hour, n) for hour, n in self.queries_per_hour.items() if hour >= since)
+
+    def _cached_chart(self, name, rows, build):
+        """
+        Chart JSON for `rows`, rebuilt only when the rows differ from the
+        ones of the cached chart.
+        """
+        rows = tuple(rows)
+        with self._lock:
+            cached = self._chart_cache.get(name)
+        if cached is not None and cached[0] == rows:
+            return cached[1]
+        # Altair es lento: se construye fuera del lock. Si dos peticiones lo
+        # construyen a la vez gana la última, y la entrada sigue siendo coherente
+        chart_json = build(rows) if rows else None
+        with self._lock:
+            self._chart_cache[name] = (rows, chart_json)
+        return chart_json
+
+    def plot_number_of_views(self, flush=True):
         """
         Generates a bar chart of document views using Altair.
         Returns JSON spec for Vega-Lite or None if no data.
         """
-        if not self.fact_clicks:
-            return None
+        top_docs = self.top_clicked_docs(limit=20, flush=flush) # Show top 20
+        return self._cached_chart("views", top_docs, self._build_views_chart)
 
-        # Prepare data
-        data = [{'Document ID': k, 'Number of Views': v} for k, v in self.fact_clicks.items()]
+    @staticmethod
+    def _build_views_chart(top_docs):
+        # Prepare data (ya viene ordenado por visitas)
+        data = [{'Document ID': k, 'Number of Views': v} for k, v in top_docs]
         df = pd.DataFrame(data)
-        
-        # Sort by views to make it prettier
-        df = df.sort_values(by='Number of Views', ascending=False).head(20) # Show top 20
 
         # Create Altair chart
         chart = alt.Chart(df).mark_bar().encode(
@@ -144,25 +602,23 @@ class AnalyticsData:
         
         return chart.to_json() # Return JSON specification
 
-    def plot_queries_per_session(self):
+    def plot_queries_per_session(self, flush=True):
         """
         Bar chart del número de queries por sesión (time-based sessions).
         """
-        if not self.fact_sessions:
-            return None
+        top_sessions = self.session_query_counts(limit=20, flush=flush)
+        return self._cached_chart("sessions", top_sessions, self._build_sessions_chart)
 
+    @staticmethod
+    def _build_sessions_chart(top_sessions):
         data = []
-        for sid, sess in self.fact_sessions.items():
+        for sid, n_queries in top_sessions:
             data.append({
                 "Session ID": sid[:8],  # recortamos para que no sea larguísimo
-                "Queries": sess.get("query_count", 0),
+                "Queries": n_queries,
             })
 
-        if not data:
-            return None
-
         df = pd.DataFrame(data)
-        df = df.sort_values(by='Queries', ascending=False).head(20)
 
         chart = alt.Chart(df).mark_bar().encode(
             x=alt.X('Session ID', sort='-y'),
@@ -176,6 +632,29 @@ class AnalyticsData:
 
         return chart.to_json()
 
+    def plot_queries_over_time(self, hours=48, flush=True):
+        """
+        Line chart del número de queries por hora (últimas `hours` horas).
+        """
+        per_hour = self.query_counts_by_hour(hours, flush=flush)
+        return self._cached_chart("queries_over_time", per_hour, self._build_queries_over_time_chart)
+
+    @staticmethod
+    def _build_queries_over_time_chart(per_hour):
+        df = pd.DataFrame([{"Hour": hour + ":00", "Queries": n} for hour, n in per_hour])
+
+        chart = alt.Chart(df).mark_line(point=True).encode(
+            x=alt.X('Hour:T', title='Hour'),
+            y='Queries:Q',
+            tooltip=['Hour', 'Queries']
+        ).properties(
+            title='Queries per Hour',
+            width='container',
+            height=300
+        ).interactive()
+
+        return chart.to_json()
+
 class ClickedDoc:
     def __init__(self, doc_id, description, counter):
         self.doc_id = doc_id
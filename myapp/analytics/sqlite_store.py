@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_ip TEXT,
+    browser TEXT,
+    os TEXT,
+    start_time TEXT
+);
+CREATE TABLE IF NOT EXISTS queries (
+    id INTEGER PRIMARY KEY,
+    terms TEXT,
+    timestamp TEXT,
+    session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_queries_session ON queries(session_id);
+CREATE INDEX IF NOT EXISTS idx_queries_timestamp ON queries(timestamp);
+CREATE TABLE IF NOT EXISTS clicks (
+    doc_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_clicks_count ON clicks(count DESC);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteAnalyticsStore:
+    """
+    SQLite storage for AnalyticsData: one table per fact (sessions, queries,
+    clicks) with indexes for the dashboard aggregates. Events are written in
+    batches, one transaction per batch. Several processes can share the
+    database file: SQLite serializes the writers.
+    """
+
+    def __init__(self, db_path="data/analytics.sqlite3"):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Una conexión compartida, protegida por un lock (la usa también el hilo de flush).
+        # timeout: espera a que otro proceso suelte el lock de escritura
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def write_events(self, events):
+        """Persist a batch of analytics events in a single transaction."""
+        sessions, queries, clicks = [], [], []
+        for event in events:
+            kind = event['type']
+            if kind == 'session':
+                sess = event['session']
+                sessions.append((sess['session_id'], sess.get('user_ip'), sess.get('browser'),
+                                 sess.get('os'), sess.get('start_time')))
+            elif kind == 'query':
+                q = event['query']
+                queries.append((q['id'], q['terms'], q['timestamp'], q.get('session_id')))
+            elif kind == 'click':
+                clicks.append((event['doc_id'],))
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO sessions(session_id, user_ip, browser, os, start_time) "
+                "VALUES (?, ?, ?, ?, ?)", sessions)
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO queries(id, terms, timestamp, session_id) VALUES (?, ?, ?, ?)",
+                queries)
+            self._conn.executemany(
+                "INSERT INTO clicks(doc_id, count) VALUES (?, 1) "
+                "ON CONFLICT(doc_id) DO UPDATE SET count = count + 1", clicks)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def max_query_id(self):
+        return self._query("SELECT COALESCE(MAX(id), 0) FROM queries")[0][0]
+
+    def reserve_query_ids(self, count):
+        """
+        Reserve `count` consecutive query ids and return the first one.
+        The counter lives in the database, so ids are unique across processes.
+        """
+        with self._lock:
+            # BEGIN IMMEDIATE toma el lock de escritura antes de leer el contador
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT value FROM counters WHERE name = 'query_id'").fetchone()
+                max_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM queries").fetchone()[0]
+                first = max(row[0] if row else 0, max_id + 1)
+                self._conn.execute(
+                    "INSERT INTO counters(name, value) VALUES ('query_id', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (first + count,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return first
+
+    def has_session(self, session_id):
+        return bool(self._query("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)))
+
+    def top_clicked_docs(self, limit=None):
+        """[(doc_id, count), ...] ordered by clicks."""
+        sql = "SELECT doc_id, count FROM clicks ORDER BY count DESC, doc_id"
+        if limit is not None:
+            return self._query(sql + " LIMIT ?", (limit,))
+        return self._query(sql)
+
+    def session_query_counts(self, limit=None):
+        """[(session_id, number of queries), ...] ordered by queries."""
+        sql = (
+            "SELECT s.session_id, COUNT(q.id) AS n FROM sessions s "
+            "LEFT JOIN queries q ON q.session_id = s.session_id "
+            "GROUP BY s.session_id ORDER BY n DESC, s.session_id"
+        )
+        if limit is not None:
+            return self._query(sql + " LIMIT ?", (limit,))
+        return self._query(sql)
+
+    def query_counts_by_hour(self, since):
+        """[("YYYY-MM-DD HH", queries), ...] from hour `since` on, ascending."""
+        # El filtro por timestamp usa idx_queries_timestamp: solo se leen las horas pedidas
+        return self._query(
+            "SELECT substr(timestamp, 1, 13) AS hour, COUNT(*) FROM queries "
+            "WHERE timestamp >= ? GROUP BY hour ORDER BY hour", (since,))
+
+    def counts(self):
+        """Number of clicked documents and sessions (for the load message)."""
+        clicked = self._query("SELECT COUNT(*) FROM clicks")[0][0]
+        sessions = self._query("SELECT COUNT(*) FROM sessions")[0][0]
+        return clicked, sessions
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
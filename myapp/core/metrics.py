@@ -0,0 +1,271 @@
+import cProfile
+import functools
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+# Límites (segundos) de los histogramas de latencia: de 50 µs a 10 s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, one series per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, registry, name, help, labels=()):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {} # valores de las etiquetas -> cuenta
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, by=1):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + by
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """
+    Latency histogram (seconds) with fixed buckets, one series per
+    combination of label values. observe() is a bisect and three
+    increments; the cumulative counts are only computed by render().
+    """
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # valores de las etiquetas -> [cuentas por bucket (+Inf al final), suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        if not self._registry.enabled:
+            return
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def time(self, *label_values):
+        """Context manager that observes the time spent inside the block."""
+        return _Timer(self, label_values)
+
+    def snapshot(self, *label_values):
+        """(count, sum) of one series, e.g. for tests or logs."""
+        series = self._series.get(label_values)
+        return (series[2], series[1]) if series else (0, 0.0)
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+
+class _Collector:
+    """Gauges read at scrape time from a callable returning {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels, collect):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"Metrics: collector {self.name} failed: {e!r}")
+            return []
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of counters and histograms, rendered in the
+    Prometheus text format by render() (served at /metrics).
+    With enabled=False observe() / inc() return straight away.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = {} # nombre -> métrica, en orden de registro
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind or existing.labels != metric.labels:
+                    raise ValueError(f"Metric '{metric.name}' already registered with another type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    def collector(self, name, help, collect, labels=()):
+        """
+        Register (or replace) gauges computed when /metrics is scraped, e.g.
+        cache sizes: collect() returns {(label values...): value}.
+        """
+        with self._lock:
+            self._metrics[name] = _Collector(name, help, labels, collect)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Registro global: los módulos declaran sus métricas al importarse
+REGISTRY = MetricsRegistry()
+
+PROFILED_REQUESTS = REGISTRY.counter(
+    "profiled_requests_total", "Requests run under the slow request profiler, by outcome", ("outcome",)
+)
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in sampling profiler: a fraction `sample_rate` of the calls to a
+    wrapped function run under cProfile, and those slower than
+    `threshold_ms` dump their stats (pstats format) to `output_dir`.
+    Only one call is profiled at a time and only the calling thread is
+    seen (work done in thread pools, like the RAG, is not included).
+    """
+
+    def __init__(self, threshold_ms=None, sample_rate=1.0, output_dir="data/profiles"):
+        """
+        :param threshold_ms: minimum duration of a dumped profile; None disables the profiler
+        :param sample_rate: fraction of calls that are profiled (0..1)
+        """
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.threshold_ms is not None and self.sample_rate > 0
+
+    @classmethod
+    def from_env(cls):
+        """PROFILE_SLOW_REQUESTS_MS (off if unset), PROFILE_SAMPLE_RATE and PROFILE_DIR."""
+        threshold = os.getenv("PROFILE_SLOW_REQUESTS_MS")
+        return cls(threshold_ms=float(threshold) if threshold else None,
+                   sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0.1)),
+                   output_dir=os.getenv("PROFILE_DIR", "data/profiles"))
+
+    def profiled(self, func):
+        """Decorator; a no-op call-through while the profiler is disabled."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+                return func(*args, **kwargs)
+            try:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Ya hay otro profiler activo en el proceso (p.ej. un depurador)
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    self._dump(profiler, func.__name__, (time.perf_counter() - start) * 1000)
+            finally:
+                self._busy.release()
+        return wrapper
+
+    def _dump(self, profiler, name, elapsed_ms):
+        if elapsed_ms < self.threshold_ms:
+            PROFILED_REQUESTS.inc("fast")
+            return
+        stamp = time.strftime('%Y%m%d-%H%M%S') + f"-{time.time_ns() // 10**6 % 1000:03d}"
+        path = os.path.join(self.output_dir, f"{stamp}_{name}_{elapsed_ms:.0f}ms.prof")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as e:
+            print(f"Profiler: could not write {path}: {e}")
+            return
+        PROFILED_REQUESTS.inc("dumped")
+        print(f"Profiler: slow request {name} ({elapsed_ms:.0f} ms), stats in {path}")
@@ -1,7 +1,46 @@
 from google import genai
+import json
 import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List
 
+from myapp.core.cache import LRUCache
+from myapp.core.metrics import DEFAULT_BUCKETS, REGISTRY
+
+# Métricas de /metrics: submit (en la petición), prompt y llamada al LLM (en segundo plano)
+RAG_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "RAGGenerator time per stage: submit, prompt, llm", ("stage",),
+    buckets=DEFAULT_BUCKETS + (20.0, 30.0, 60.0),
+)
+RAG_SUMMARIES = REGISTRY.counter(
+    "rag_summaries_total", "RAG summaries by source: quick, cache, manual, queued, llm, error, timeout", ("source",)
+)
+
+
+class FakeGenAIClient:
+    """
+    Local stand-in for genai.Client (same `client.models.generate_content`
+    shape). Useful for tests and for running the app without an API key.
+    """
+
+    def __init__(self, text="<b>Fake summary</b>", delay=0.0, error=None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.calls = []
+        self.models = self
+
+    def generate_content(self, model, contents):
+        self.calls.append((model, contents))
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return type("FakeResponse", (), {"text": self.text})()
+
 
 class RAGGenerator:
     """
@@ -9,7 +48,18 @@ class RAGGenerator:
     Generates a summary answer based on the retrieved documents.
     """
 
-    def __init__(self):
+    def __init__(self, client=None, timeout=None, max_workers=4,
+                 cache_size=512, cache_ttl=24 * 3600, cache_path=None):
+        """
+        :param client: optional client exposing models.generate_content (e.g. FakeGenAIClient);
+                       by default a Gemini client is created from GOOGLE_API_KEY
+        :param timeout: seconds to wait for the LLM in the background before
+                        falling back to the manual summary
+        :param max_workers: threads used for background generation
+        :param cache_size: max LLM responses kept in the response cache (0 disables it)
+        :param cache_ttl: seconds a cached response stays valid
+        :param cache_path: optional JSON Lines file where cached responses are persisted
+        """
         api_key = os.getenv("GOOGLE_API_KEY")
         model = os.getenv("GEMINI_MODEL", "gemini-3-pro-preview")
 
@@ -17,58 +67,156 @@ class RAGGenerator:
         print("[RAG] GEMINI_MODEL:", model)
 
         self.model = model
-        self.client = genai.Client(api_key=api_key) if api_key else None
+        if client is not None:
+            self.client = client
+        else:
+            self.client = genai.Client(api_key=api_key) if api_key else None
 
-    def generate_response(self, query, results):
-        """
-        Generates a natural language response based on the query and top results.
-        
-        :param query: The user's search query
-        :param results: List of ResultItem objects returned by search engine
-        :return: A string containing the generated response
-        """
+        self.timeout = timeout if timeout is not None else float(os.getenv("RAG_TIMEOUT", 20))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag")
+        # job_id -> (future, started_at, query, results, total); las entradas caducan solas
+        self._jobs = LRUCache(maxsize=1000, ttl=600)
 
-        
-        if not results:
-            return f"I'm sorry, but I couldn't find any products related to '{query}' in our catalog."
+        # Caché de respuestas del LLM: misma query + mismos productos => misma respuesta
+        self.response_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self.cache_path = cache_path
+        self._cache_file_lock = threading.Lock()
+        # Contadores de llamadas al LLM (se actualizan desde los hilos del executor)
+        self._stats_lock = threading.Lock()
+        self.llm_calls = 0
+        self.llm_errors = 0
+        self.llm_latency_total = 0.0
+        if cache_path:
+            self._load_response_cache()
 
+    def _select_good_results(self, results):
         top_results = results[:5]
-
-        good_results = [
+        return [
             doc for doc in top_results
             if doc.average_rating is not None and doc.average_rating >= 3.0
         ]
+
+    def _quick_response(self, query, results, good_results):
+        """Respuestas que no necesitan al LLM (sin resultados o sin productos buenos)."""
+        if not results:
+            return f"I'm sorry, but I couldn't find any products related to '{query}' in our catalog."
+
         if not good_results:
             return (
                 f"No he encontrado productos realmente buenos para "
                 f"'<b>{query}</b>' según las valoraciones disponibles. "
                 f"Prueba a reformular la búsqueda o usar otros filtros."
             )
+        return None
 
-        if not self.client:
-            print("[RAG] NO hay cliente Gemini, usando resumen manual")
-            response = (
-                f"Based on your search for '<b>{query}</b>', "
-                f"here are the top recommendations:\n<ul>"
+    def manual_summary(self, query, results, good_results=None, total=None):
+        """
+        Resumen sin LLM a partir de los mejores resultados.
+        total: documentos que cumplen la búsqueda (results puede ser solo una página)
+        """
+        if good_results is None:
+            good_results = self._select_good_results(results)
+        quick = self._quick_response(query, results, good_results)
+        if quick is not None:
+            return quick
+
+        response = (
+            f"Based on your search for '<b>{query}</b>', "
+            f"here are the top recommendations:\n<ul>"
+        )
+        for doc in good_results:
+            snippet = (
+                doc.description.split(".")[0]
+                if doc.description else "No description available"
             )
-            for doc in good_results:
-                snippet = (
-                    doc.description.split(".")[0]
-                    if doc.description else "No description available"
-                )
-                price = f"{doc.actual_price}€" if doc.actual_price is not None else "unknown price"
-                rating = doc.average_rating if doc.average_rating is not None else "N/A"
-                response += (
-                    f"<li><b>{doc.title}</b>: {snippet}. "
-                    f"(Price: {price}, Rating: {rating})</li>"
-                )
-            response += "</ul>"
+            price = f"{doc.actual_price}€" if doc.actual_price is not None else "unknown price"
+            rating = doc.average_rating if doc.average_rating is not None else "N/A"
             response += (
-                f"<br><i>We found {len(results)} items in total. "
-                f"Check the list below for more details!</i>"
+                f"<li><b>{doc.title}</b>: {snippet}. "
+                f"(Price: {price}, Rating: {rating})</li>"
             )
-            return response
+        response += "</ul>"
+        response += (
+            f"<br><i>We found {len(results) if total is None else total} items in total. "
+            f"Check the list below for more details!</i>"
+        )
+        return response
 
+    # --- Caché de respuestas ---
+
+    def _cache_key(self, query, good_results):
+        """Query normalizada + pid, precios y rating de los productos del prompt."""
+        normalized_query = " ".join(str(query).lower().split())
+        products = [
+            [doc.pid, doc.selling_price, doc.actual_price, doc.average_rating]
+            for doc in good_results
+        ]
+        return json.dumps([normalized_query, products], ensure_ascii=False)
+
+    def _load_response_cache(self):
+        """
+        Carga las respuestas persistidas que no han caducado y compacta el
+        fichero (se reescribe solo con las entradas vivas).
+        """
+        if not os.path.exists(self.cache_path):
+            return
+        now = time.time()
+        live = {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # línea a medio escribir
+                    live[entry["key"]] = entry
+        except OSError as e:
+            print("[RAG] Error leyendo la caché de respuestas:", repr(e))
+            return
+
+        kept = []
+        for entry in live.values():
+            age = now - entry["created"]
+            ttl = self.response_cache.ttl
+            if ttl is not None and age >= ttl:
+                continue
+            self.response_cache.put(entry["key"], entry["value"], ttl=None if ttl is None else ttl - age)
+            kept.append(entry)
+
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in kept[-self.response_cache.maxsize:]:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.cache_path)
+        print(f"[RAG] Caché de respuestas cargada: {len(self.response_cache)} entradas")
+
+    def _store_response(self, key, value):
+        self.response_cache.put(key, value)
+        if not self.cache_path:
+            return
+        entry = {"key": key, "value": value, "created": time.time()}
+        try:
+            with self._cache_file_lock:
+                os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+                with open(self.cache_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print("[RAG] Error guardando la caché de respuestas:", repr(e))
+
+    def cache_stats(self):
+        """Hits/misses de la caché y llamadas al LLM (cuántas se han ahorrado)."""
+        stats = self.response_cache.stats()
+        with self._stats_lock:
+            llm_calls, llm_errors, llm_latency_total = self.llm_calls, self.llm_errors, self.llm_latency_total
+        stats.update({
+            "llm_calls": llm_calls,
+            "llm_errors": llm_errors,
+            "llm_calls_saved": stats["hits"],
+            "llm_latency_avg": llm_latency_total / llm_calls if llm_calls else 0.0,
+        })
+        return stats
+
+    def _build_prompt(self, query, good_results):
         context_lines = []
         for doc in good_results:
             snippet = (
@@ -96,7 +244,7 @@ class RAGGenerator:
 
         context_text = "\n".join(context_lines)
 
-        user_content = f"""
+        return f"""
 Consulta del usuario:
 {query}
 
@@ -111,6 +259,40 @@ Tarea:
 - Devuelve la respuesta en HTML simple: uno o dos párrafos (<p>) y, si recomiendas productos concretos, una lista <ul><li>...</li></ul>.
 """
 
+    def generate_response(self, query, results, total=None):
+        """
+        Generates a natural language response based on the query and top results.
+        
+        :param query: The user's search query
+        :param results: List of ResultItem objects returned by search engine
+        :param total: number of documents matching the search, if results is only a page of them
+        :return: A string containing the generated response
+        """
+        good_results = self._select_good_results(results)
+        quick = self._quick_response(query, results, good_results)
+        if quick is not None:
+            return quick
+
+        if not self.client:
+            print("[RAG] NO hay cliente Gemini, usando resumen manual")
+            return self.manual_summary(query, results, good_results, total)
+
+        cache_key = self._cache_key(query, good_results)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            print("[RAG] Respuesta servida desde la caché")
+            return cached
+        return self._call_llm(query, results, good_results, cache_key, total)
+
+    def _call_llm(self, query, results, good_results, cache_key, total=None):
+        """
+        Llamada al LLM y guardado en la caché, sin volver a consultarla: quien
+        llama (generate_response o submit) ya ha comprobado que la clave no está.
+        """
+        with RAG_SECONDS.time("prompt"):
+            user_content = self._build_prompt(query, good_results)
+
+        start = time.perf_counter()
         try:
             print("[RAG] Llamando a Gemini para generar resumen...")
             response = self.client.models.generate_content(
@@ -123,28 +305,76 @@ Tarea:
                 text = str(response)
 
             print("[RAG] Gemini ha respondido correctamente")
-            return f"<p>{text}</p>"
+            html = f"<p>{text}</p>"
+            # Solo se cachean respuestas reales del LLM, nunca el resumen de respaldo
+            self._store_response(cache_key, html)
+            RAG_SUMMARIES.inc("llm")
+            return html
 
         except Exception as e:
+            with self._stats_lock:
+                self.llm_errors += 1
+            RAG_SUMMARIES.inc("error")
             print("[RAG] ERROR llamando a Gemini:", repr(e))
-            response = (
-                f"Based on your search for '<b>{query}</b>', "
-                f"here are the top recommendations:\n<ul>"
-            )
-            for doc in good_results:
-                snippet = (
-                    doc.description.split(".")[0]
-                    if doc.description else "No description available"
-                )
-                price = f"{doc.actual_price}€" if doc.actual_price is not None else "unknown price"
-                rating = doc.average_rating if doc.average_rating is not None else "N/A"
-                response += (
-                    f"<li><b>{doc.title}</b>: {snippet}. "
-                    f"(Price: {price}, Rating: {rating})</li>"
-                )
-            response += "</ul>"
-            response += (
-                f"<br><i>We found {len(results)} items in total. "
-                f"Check the list below for more details!</i>"
-            )
-            return response
+            return self.manual_summary(query, results, good_results, total)
+
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.llm_calls += 1
+                self.llm_latency_total += elapsed
+            RAG_SECONDS.observe(elapsed, "llm")
+
+    # --- Generación asíncrona ---
+
+    def submit(self, query, results, total=None):
+        """
+        Start generating the summary in the background and return a job id.
+        Cases that do not need the LLM (or are already cached) are resolved immediately.
+        :param total: number of documents matching the search, if results is only a page of them
+        """
+        start = time.perf_counter()
+        job_id = uuid.uuid4().hex
+        good_results = self._select_good_results(results)
+        quick = self._quick_response(query, results, good_results)
+        cache_key = cached = None
+        if quick is None and self.client:
+            cache_key = self._cache_key(query, good_results)
+            cached = self.response_cache.get(cache_key)
+        if quick is not None or not self.client or cached is not None:
+            future = Future()
+            if quick is not None:
+                RAG_SUMMARIES.inc("quick")
+            elif cached is not None:
+                RAG_SUMMARIES.inc("cache")
+                quick = cached
+            else:
+                RAG_SUMMARIES.inc("manual")
+                quick = self.manual_summary(query, results, good_results, total)
+            future.set_result(quick)
+        else:
+            RAG_SUMMARIES.inc("queued")
+            # La caché ya se ha consultado aquí: el hilo va directo al LLM
+            future = self._executor.submit(self._call_llm, query, results, good_results, cache_key, total)
+        self._jobs.put(job_id, (future, time.monotonic(), query, results, total))
+        RAG_SECONDS.observe(time.perf_counter() - start, "submit")
+        return job_id
+
+    def poll(self, job_id):
+        """
+        Status of a background job: {'status': 'pending'} while the LLM is
+        working, or {'status': 'done', 'html': ..., 'fallback': bool}. After
+        `timeout` seconds the manual summary is returned instead.
+        Returns None for unknown (or expired) job ids.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future, started_at, query, results, total = job
+        if future.done():
+            return {"status": "done", "html": future.result(), "fallback": False}
+        if time.monotonic() - started_at >= self.timeout:
+            print("[RAG] Timeout esperando a Gemini, usando resumen manual")
+            RAG_SUMMARIES.inc("timeout")
+            return {"status": "done", "html": self.manual_summary(query, results, total=total), "fallback": True}
+        return {"status": "pending"}
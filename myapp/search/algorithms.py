@@ -1,13 +1,19 @@
 import re
 import math
 import collections
+import heapq
 from collections import defaultdict
 from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
 
+from myapp.search.document_store import DocumentStore
+
 # NLTK imports
 import nltk
-from nltk.tokenize import word_tokenize
+from nltk.tokenize import sent_tokenize, word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import PorterStemmer
 
@@ -33,101 +39,556 @@ stop_words.update({
 
 # --- 1. PRE-PROCESAMIENTO ---
 
+# Tamaño de las cachés LRU del análisis (tokens normalizados y queries)
+TOKEN_CACHE_SIZE = 200_000
+QUERY_CACHE_SIZE = 10_000
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def _normalize_token(word):
+    """Filtra stopwords / tokens no alfanuméricos y aplica el stemmer (memoizado)."""
+    if word in stop_words or not word.isalnum():
+        return None
+    return stemmer.stem(word)
+
+
 def build_terms(text):
-    """Preprocess text: lowercase, tokenize, remove stopwords, stem."""
-    if not isinstance(text, str): return []
-    text = re.sub(r'\d+', '', text)
-    word_tokens = word_tokenize(text.lower())
-    textos_limpios = [word for word in word_tokens if word not in stop_words and word.isalnum()]      
-    textos_limpios = [stemmer.stem(word) for word in textos_limpios]
-    return textos_limpios
+    """Preprocess text: lowercase, tokenize, remove stopwords, stem (the default analyzer)."""
+    return get_analyzer().analyze(text)
+
+
+class Analyzer:
+    """
+    Interfaz de un analizador: texto -> lista de términos indexables.
+    Las subclases solo cambian el tokenizer; el filtrado de stopwords y el
+    stemming (_normalize_token) son comunes.
+    """
+    name = None
+
+    def tokenize(self, text):
+        raise NotImplementedError
+
+    def analyze(self, text):
+        if not isinstance(text, str): return []
+        text = re.sub(r'\d+', '', text)
+        word_tokens = self.tokenize(text.lower())
+        return [term for term in map(_normalize_token, word_tokens) if term is not None]
+
+    def config(self):
+        """Configuración que identifica al analizador (va al snapshot del índice)."""
+        return {
+            "analyzer": self.name,
+            "number_filter": r"\d+",
+            "stemmer": "porter",
+            "stop_words": sorted(stop_words),
+        }
+
+
+class NltkAnalyzer(Analyzer):
+    """Analizador original (el de build_terms): nltk.word_tokenize."""
+    name = "nltk"
+
+    def tokenize(self, text):
+        return word_tokenize(text)
+
+
+class RegexAnalyzer(Analyzer):
+    """
+    Misma segmentación en frases que word_tokenize (Punkt, que es barato), pero
+    cada frase se parte con menos regex que el tokenizer Treebank, la mayor
+    parte del coste de word_tokenize. Se aplican en el mismo orden que sus
+    reglas, porque una comilla o un clítico solo se separan si en ese momento
+    van seguidos de un espacio; la puntuación que Treebank aísla se sustituye
+    directamente por espacios (no es alfanumérica, el filtro la descartaría).
+    La paridad con NltkAnalyzer se comprueba en tests/test_analyzers.py.
+    """
+    name = "regex"
+    # Cambia si cambian las reglas: invalida los snapshots construidos con la versión anterior
+    version = 2
+
+    # STARTING_QUOTES: comillas de apertura (se quedan como "`" hasta _CLOSING: impiden
+    # que el punto anterior sea final) y comilla pegada a una sola letra ('x -> ' x)
+    _STARTING_QUOTES = (re.compile(r"[«“‘„`]"), re.compile(r"""^"|(?<=[ (\[{<])(?:"|'')"""))
+    _QUOTED_CHAR = re.compile(r"'(?!re|ve|ll|m|t|s|d|n)(\w)\b")
+    # PUNCTUATION, en su orden: punto final de la frase (y sus cierres), ":" y ",",
+    # resto de signos; después la comilla seguida de espacio
+    _FINAL_PERIOD = re.compile(r"""(?<=[^.])\.([\])}>"'»”’ ]*)\s*$""")
+    _COLON_COMMA = re.compile(r"[:,]([^\d])|[:,]$")
+    _PUNCTUATION = re.compile(r"\.{2,}|[;@#$%&?!]")
+    _QUOTE = re.compile(r"(?<=[^'])' ")
+    # PARENS_BRACKETS, DOUBLE_DASHES y las comillas de cierre de ENDING_QUOTES
+    _CLOSING = re.compile(r"""[*\[\](){}<>»”’"`]|--|''""")
+    # ENDING_QUOTES: clíticos seguidos de espacio (dos pasadas, como en NLTK)
+    _CLITICS = (re.compile(r"(?<=[^' ])(?:'[smd]|') "), re.compile(r"(?<=[^' ])(?:'ll|'re|'ve|n't) "))
+    # CONTRACTIONS2: contracciones que NLTK parte en dos palabras
+    _CONTRACTIONS = re.compile(
+        r"\b(?:(can)(not)|(d)('ye)|(gim)(me)|(gon)(na)|(got)(ta)|(lem)(me)|(more)('n))\b"
+        r"|\b(wan)(na)(?=\s|$)"
+    )
+
+    @staticmethod
+    def _split_contraction(match):
+        return " " + " ".join(part for part in match.groups() if part) + " "
+
+    def tokenize(self, text):
+        return [token for sentence in sent_tokenize(text) for token in self._tokenize_sentence(sentence)]
+
+    def _tokenize_sentence(self, text):
+        # analyze() ya ha pasado el texto a minúsculas y quitado los dígitos
+        quoted = "'" in text
+        for quotes in self._STARTING_QUOTES:
+            text = quotes.sub(" ` ", text)
+        if quoted:
+            text = self._QUOTED_CHAR.sub(r"' \1", text)
+        text = self._FINAL_PERIOD.sub(r" \1 ", text, count=1)
+        text = self._COLON_COMMA.sub(r" \1", text)
+        text = self._PUNCTUATION.sub(" ", text)
+        if quoted:
+            text = self._QUOTE.sub("  ", text)
+        text = self._CLOSING.sub(" ", text)
+        if quoted:
+            text = " " + " ".join(text.split()) + " "
+            for clitic in self._CLITICS:
+                text = clitic.sub("  ", text)
+        text = self._CONTRACTIONS.sub(self._split_contraction, text)
+        return text.split()
+
+    def config(self):
+        return {**super().config(), "version": self.version}
+
+
+ANALYZERS = {
+    NltkAnalyzer.name: NltkAnalyzer(),
+    RegexAnalyzer.name: RegexAnalyzer(),
+}
+DEFAULT_ANALYZER = NltkAnalyzer.name
+
+
+def get_analyzer(name=DEFAULT_ANALYZER):
+    try:
+        return ANALYZERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown analyzer '{name}'. Available: {sorted(ANALYZERS)}")
+
+
+def analyzer_config(analyzer=DEFAULT_ANALYZER):
+    """
+    Describe la configuración del análisis de texto (tokenizer, stopwords,
+    stemmer). Si cambia, cualquier índice persistido deja de ser válido.
+    """
+    return get_analyzer(analyzer).config()
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def analyze_query(query, analyzer=DEFAULT_ANALYZER):
+    """
+    Analiza una query una sola vez y cachea el resultado.
+    Devuelve una tupla (inmutable) para poder compartirla entre peticiones.
+    """
+    return tuple(get_analyzer(analyzer).analyze(query))
+
+
+def analysis_cache_info():
+    """Hits / misses / tamaño de las cachés de análisis, para dimensionarlas."""
+    return {
+        "tokens": _normalize_token.cache_info()._asdict(),
+        "queries": analyze_query.cache_info()._asdict(),
+    }
 
 # --- 2. INDEXACIÓN ---
 
-def create_index_part3(corpus: dict):
+def _index_shard(contents, first_ordinal, analyzer=DEFAULT_ANALYZER, keep_tokens=False):
+    """
+    Indexa un bloque contiguo de documentos (textos ya concatenados).
+    Devuelve (index, doc_lengths, token_lists) con ordinales globales a partir
+    de first_ordinal; token_lists (los términos de cada documento, en orden)
+    solo con keep_tokens=True, si no None.
+    Es la unidad de trabajo tanto del modo serie como del paralelo.
+    """
+    index = {}
+    doc_lengths = array('I')
+    token_lists = [] if keep_tokens else None
+    analyze = get_analyzer(analyzer).analyze
+    
+    for ordinal, content in enumerate(contents, start=first_ordinal):
+        terms = analyze(content)
+        doc_lengths.append(len(terms))
+        if keep_tokens:
+            token_lists.append(terms)
+        
+        _add_postings(index, ordinal, terms)
+    
+    return index, doc_lengths, token_lists
+
+
+def _add_postings(index, ordinal, terms):
+    """Añade el documento `ordinal` (sus términos) a las posting lists de index."""
+    # Contamos frecuencia local (Raw TF)
+    term_counts = collections.Counter(terms)
+    
+    for term, count in term_counts.items():
+        postings = index.get(term)
+        if postings is None:
+            postings = index[term] = (array('I'), array('I'))
+        # Los ordinales crecen con el bucle, así que la lista queda ordenada
+        postings[0].append(ordinal)
+        postings[1].append(count)
+
+
+def _merge_postings(index, shard_index):
+    """Fusiona el índice de un bloque posterior (ordinales mayores) en index."""
+    for term, (shard_ords, shard_tfs) in shard_index.items():
+        postings = index.get(term)
+        if postings is None:
+            index[term] = (shard_ords, shard_tfs)
+        else:
+            postings[0].extend(shard_ords)
+            postings[1].extend(shard_tfs)
+
+
+def create_index_part3(corpus: dict, workers=1, analyzer=DEFAULT_ANALYZER, keep_tokens=False):
     """
     Crea el índice invertido, DF, y longitudes de documentos.
     Recibe el corpus (diccionario de objetos Document).
+
+    Cada documento recibe un ordinal entero (su posición en el corpus) y cada
+    término apunta a una posting list compacta: una tupla
+    (array('I') de ordinales ordenados, array('I') de TF paralela).
+    Devuelve (index, df, doc_lengths, doc_ids), donde doc_lengths es un
+    array('I') indexado por ordinal y doc_ids traduce ordinal -> pid.
+
+    Con workers > 1 el corpus se divide en bloques contiguos que se tokenizan
+    en un ProcessPoolExecutor; los bloques se fusionan en orden, así que el
+    resultado es idéntico al de la indexación en serie.
+    analyzer elige el tokenizer ("nltk" o "regex"); las queries deben
+    analizarse con el mismo.
+    Con keep_tokens=True se devuelve además la lista de términos de cada
+    documento (p.ej. para entrenar word2vec sin volver a tokenizar).
     """
-    index = defaultdict(list)
+    print("Iniciando indexación en algorithms...")
+    
+    doc_ids = list(corpus.keys())
+    contents = index_contents(corpus)
+    
+    index, doc_lengths, token_lists = _index_texts(contents, workers, analyzer, keep_tokens)
+    
     df = defaultdict(int)
-    doc_lengths = {}
+    for term, (doc_ords, _) in index.items():
+        df[term] = len(doc_ords)
     
-    print("Iniciando indexación en algorithms...")
+    if keep_tokens:
+        return index, df, doc_lengths, doc_ids, token_lists
+    return index, df, doc_lengths, doc_ids
 
-    for doc_id, doc_obj in corpus.items():
-        # Usamos title + description
-        content = (doc_obj.title or "") + " " + (doc_obj.description or "")
-        terms = build_terms(content)
-        
-        doc_lengths[doc_id] = len(terms)
-        
-        # Contamos frecuencia local (Raw TF)
-        term_counts = collections.Counter(terms)
+
+def index_contents(corpus):
+    """Texto indexado de cada documento (title + description), en orden de ordinal."""
+    if isinstance(corpus, DocumentStore):
+        # Columnas de texto directamente, sin materializar cada Document
+        return [
+            (title or "") + " " + (description or "")
+            for title, description in zip(corpus.column("title"), corpus.column("description"))
+        ]
+    return [
+        (doc_obj.title or "") + " " + (doc_obj.description or "")
+        for doc_obj in corpus.values()
+    ]
+
+
+def _index_texts(contents, workers=1, analyzer=DEFAULT_ANALYZER, keep_tokens=False):
+    """
+    Indexa una lista de textos (uno por ordinal), en serie o en paralelo.
+    Devuelve (index, doc_lengths, token_lists), ver _index_shard.
+    """
+    if workers <= 1 or len(contents) < 2:
+        index, doc_lengths, token_lists = _index_shard(contents, 0, analyzer, keep_tokens)
+    else:
+        # Más bloques que procesos para repartir mejor la carga
+        n_shards = min(len(contents), workers * 4)
+        shard_size = math.ceil(len(contents) / n_shards)
+        starts = list(range(0, len(contents), shard_size))
         
-        for term, count in term_counts.items():
-            # Guardamos (doc_id, count) en el índice
-            index[term].append((doc_id, count))
-            df[term] += 1
-            
-    return index, df, doc_lengths
+        index = {}
+        doc_lengths = array('I')
+        token_lists = [] if keep_tokens else None
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shards = executor.map(
+                _index_shard,
+                [contents[i:i + shard_size] for i in starts],
+                starts,
+                [analyzer] * len(starts),
+                [keep_tokens] * len(starts),
+            )
+            # executor.map conserva el orden: los ordinales de cada bloque son
+            # mayores que los anteriores y las posting lists siguen ordenadas
+            for shard_index, shard_lengths, shard_tokens in shards:
+                doc_lengths.extend(shard_lengths)
+                if keep_tokens:
+                    token_lists.extend(shard_tokens)
+                _merge_postings(index, shard_index)
+    
+    return index, doc_lengths, token_lists
+
+
+# Campos del índice multi-campo (BM25F). brand / category son cadenas cortas
+# y product_details es el dict aplanado por Document.normalize_product_details
+BM25F_FIELDS = ("title", "description", "brand", "category", "product_details")
+# Peso de cada campo en BM25F; un campo con peso 0 no se indexa ni se consulta
+DEFAULT_FIELD_WEIGHTS = {"title": 2.0, "description": 1.0, "brand": 1.5, "category": 0.5, "product_details": 0.5}
+
+
+def validate_field_weights(weights):
+    """Check a BM25F field weight dict and return a copy without zero weights."""
+    unknown = set(weights) - set(BM25F_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown BM25F fields: {sorted(unknown)}. Available: {', '.join(BM25F_FIELDS)}")
+    if any(float(w) < 0 for w in weights.values()):
+        raise ValueError("BM25F field weights must be >= 0")
+    return {field: float(weights[field]) for field in BM25F_FIELDS if weights.get(field)}
+
+
+def _details_text(details):
+    """product_details ({"Fabric": "Linen", ...}) como texto: claves y valores."""
+    if not details:
+        return ""
+    return " ".join(f"{key} {value}" for key, value in details.items())
+
+
+def field_contents(corpus, field):
+    """Texto del campo `field` de cada documento, en orden de ordinal."""
+    if isinstance(corpus, DocumentStore):
+        if field == "product_details":
+            return [_details_text(corpus.product_details(row)) for row in range(len(corpus))]
+        if field in ("brand", "category"):
+            vocab = corpus.vocabulary(field)
+            return [vocab[code] if code >= 0 else "" for code in corpus.column(field).tolist()]
+        return [text or "" for text in corpus.column(field)]
+    if field == "product_details":
+        return [_details_text(doc.product_details) for doc in corpus.values()]
+    return [getattr(doc, field) or "" for doc in corpus.values()]
+
+
+def create_field_index(corpus: dict, fields, workers=1, analyzer=DEFAULT_ANALYZER):
+    """
+    Índice invertido por campo para BM25F: {campo: (index, field_lengths)},
+    con el mismo formato de posting lists y los mismos ordinales que
+    create_index_part3 (las longitudes son array('I') por ordinal).
+    """
+    return {field: _index_texts(field_contents(corpus, field), workers, analyzer)[:2] for field in fields}
+
 
-# --- 3. FILTRADO (AND) ---
+# Campos con pocos valores distintos (marcas, categorías...): se analiza cada
+# valor una sola vez por bloque
+_REPEATED_FIELDS = ("brand", "category", "product_details")
 
-def find_candidate_docs(query, index):
-    """Encuentra documentos que contienen TODOS los términos (AND)"""
-    query_terms = build_terms(query)
-    if not query_terms: return set()
+
+def _index_fields_shard(columns, first_ordinal, fields, analyzer=DEFAULT_ANALYZER, keep_tokens=False):
+    """
+    Unidad de trabajo de create_indexes: indexa un bloque de documentos a
+    partir de sus columnas de texto ({campo: textos}) analizando cada campo
+    una sola vez. Devuelve (index, doc_lengths, field_index, token_lists).
+    """
+    analyze = get_analyzer(analyzer).analyze
+    index = {}
+    doc_lengths = array('I')
+    field_index = {field: ({}, array('I')) for field in fields}
+    token_lists = [] if keep_tokens else None
+    seen = {field: {} for field in _REPEATED_FIELDS}
+
+    for offset in range(len(columns["title"])):
+        ordinal = first_ordinal + offset
+        terms_by_field = {}
+        for field, texts in columns.items():
+            text = texts[offset]
+            if field in seen:
+                terms = seen[field].get(text)
+                if terms is None:
+                    terms = seen[field][text] = analyze(text)
+            else:
+                terms = analyze(text)
+            terms_by_field[field] = terms
+
+        for field, (f_index, f_lengths) in field_index.items():
+            f_lengths.append(len(terms_by_field[field]))
+            _add_postings(f_index, ordinal, terms_by_field[field])
+
+        # El índice principal (title + description) sale de los términos de
+        # cada campo, sin volver a analizar el texto concatenado
+        terms = terms_by_field["title"] + terms_by_field["description"]
+        doc_lengths.append(len(terms))
+        if keep_tokens:
+            token_lists.append(terms)
+        _add_postings(index, ordinal, terms)
+
+    return index, doc_lengths, field_index, token_lists
+
+
+def create_indexes(corpus: dict, fields, workers=1, analyzer=DEFAULT_ANALYZER, keep_tokens=False):
+    """
+    Índice principal y multi-campo (BM25F) en una sola pasada de análisis:
+    devuelve (index, df, doc_lengths, doc_ids, field_index, token_lists), con
+    los formatos de create_index_part3 y create_field_index (token_lists solo
+    con keep_tokens=True, si no None).
+
+    Cada campo se tokeniza una vez y los términos del índice principal son los
+    del título seguidos de los de la descripción; coinciden con los de
+    analizar "title description" salvo en la frontera entre ambos textos.
+    """
+    doc_ids = list(corpus.keys())
+    names = ("title", "description") + tuple(f for f in fields if f not in ("title", "description"))
+    columns = {name: field_contents(corpus, name) for name in names}
+    n_docs = len(doc_ids)
+
+    if workers <= 1 or n_docs < 2:
+        index, doc_lengths, field_index, token_lists = _index_fields_shard(
+            columns, 0, fields, analyzer, keep_tokens)
+    else:
+        n_shards = min(n_docs, workers * 4)
+        shard_size = math.ceil(n_docs / n_shards)
+        starts = list(range(0, n_docs, shard_size))
+
+        index = {}
+        doc_lengths = array('I')
+        field_index = {field: ({}, array('I')) for field in fields}
+        token_lists = [] if keep_tokens else None
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shards = executor.map(
+                _index_fields_shard,
+                [{name: texts[i:i + shard_size] for name, texts in columns.items()} for i in starts],
+                starts,
+                [fields] * len(starts),
+                [analyzer] * len(starts),
+                [keep_tokens] * len(starts),
+            )
+            # Igual que en _index_texts: los bloques llegan en orden
+            for shard_index, shard_lengths, shard_fields, shard_tokens in shards:
+                doc_lengths.extend(shard_lengths)
+                if keep_tokens:
+                    token_lists.extend(shard_tokens)
+                _merge_postings(index, shard_index)
+                for field, (f_index, f_lengths) in shard_fields.items():
+                    field_index[field][1].extend(f_lengths)
+                    _merge_postings(field_index[field][0], f_index)
+
+    df = defaultdict(int)
+    for term, (doc_ords, _) in index.items():
+        df[term] = len(doc_ords)
+    return index, df, doc_lengths, doc_ids, field_index, token_lists
+
+
+# --- 3. FILTRADO (AND / OR) ---
+
+def _intersect_sorted(candidates, doc_ords):
+    """Intersecta una lista ordenada de ordinales con una posting list ordenada."""
+    result = []
+    pos = 0
+    n = len(doc_ords)
+    for doc in candidates:
+        pos = bisect_left(doc_ords, doc, pos)
+        if pos == n:
+            break
+        if doc_ords[pos] == doc:
+            result.append(doc)
+    return result
+
+
+def find_candidate_docs(query_terms, index, mode="and"):
+    """
+    Encuentra documentos que contienen TODOS los términos (AND) o, con
+    mode="or", al menos uno de ellos.
+    Recibe los términos ya analizados (analyze_query).
+    Devuelve la lista ordenada de ordinales candidatos.
+    """
+    if not query_terms: return []
     
-    candidate_docs = None
-    for term in query_terms:
-        # Extraemos solo los doc_ids de la lista de tuplas [(doc_id, count), ...]
+    if mode == "or":
+        union = set()
+        for term in set(query_terms):
+            if term in index:
+                union.update(index[term][0])
+        return sorted(union)
+    
+    postings = []
+    for term in set(query_terms):
         if term not in index:
-            return set() # AND estricto: si falta uno, adiós
-            
-        term_docs = {posting[0] for posting in index[term]}
-        
-        if candidate_docs is None:
-            candidate_docs = term_docs
-        else:
-            candidate_docs &= term_docs # Intersección
-            
-        if not candidate_docs: return set()
+            return [] # AND estricto: si falta uno, adiós
+        postings.append(index[term][0])
+    
+    # Empezamos por la posting list más corta para que la intersección sea mínima
+    postings.sort(key=len)
+    candidate_docs = list(postings[0])
+    for doc_ords in postings[1:]:
+        candidate_docs = _intersect_sorted(candidate_docs, doc_ords) # Intersección
+        if not candidate_docs: return []
         
-    return candidate_docs if candidate_docs is not None else set()
+    return candidate_docs
+
+def find_candidate_docs_filtered(query_terms, index, allowed):
+    """
+    find_candidate_docs en modo AND restringido a los ordinales con
+    allowed[ordinal] == True (filtros por facetas). La máscara se aplica a
+    la posting list más corta antes de intersectar, así que un filtro
+    selectivo abarata la intersección. Devuelve un array ordenado de ordinales.
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if not query_terms: return empty
+    
+    postings = []
+    for term in set(query_terms):
+        if term not in index:
+            return empty
+        postings.append(_as_np(index[term][0]))
+    
+    postings.sort(key=len)
+    candidates = postings[0][allowed[postings[0]]]
+    for doc_ords in postings[1:]:
+        if not len(candidates): break
+        pos = np.minimum(np.searchsorted(doc_ords, candidates), len(doc_ords) - 1)
+        candidates = candidates[doc_ords[pos] == candidates]
+    return candidates.astype(np.int64)
 
 # --- 4. RANKING (BM25) ---
 
-def rank_documents_bm25(query, docs_to_rank, index, df, N, doc_lengths, avg_doc_length):
-    """Calcula el score BM25 para los documentos candidatos"""
-    query_terms = build_terms(query)
-    
-    K1 = 1.2
-    B = 0.75
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _bm25_idf(N, n_q):
+    """Fórmula IDF estándar para BM25"""
+    return math.log(1 + (N - n_q + 0.5) / (n_q + 0.5))
+
+
+def rank_documents_bm25(query_terms, docs_to_rank, index, df, N, doc_lengths, avg_doc_length):
+    """
+    Calcula el score BM25 para los documentos candidatos.
+    docs_to_rank es una lista ordenada de ordinales; cada posting list se
+    recorre una sola vez avanzando en paralelo con los candidatos.
+    Es la implementación de referencia en Python puro de
+    rank_documents_bm25_vectorized.
+    """
+    K1 = BM25_K1
+    B = BM25_B
     doc_scores = defaultdict(float)
     idf_cache = {}
     
     # Pre-calcular IDF
     for term in query_terms:
         if term not in df: continue
-        n_q = df[term]
-        # Fórmula IDF estándar para BM25
-        idf_cache[term] = math.log(1 + (N - n_q + 0.5) / (n_q + 0.5))
+        idf_cache[term] = _bm25_idf(N, df[term])
 
-    for doc_id in docs_to_rank:
-        doc_len = doc_lengths.get(doc_id, 0)
+    for term in query_terms:
+        if term not in idf_cache: continue
+        doc_ords, tfs = index[term]
+        n = len(doc_ords)
+        pos = 0
         
-        for term in query_terms:
-            if term not in idf_cache: continue
-            
-            # Buscar Raw TF en el índice
-            raw_tf = 0
-            for pid, count in index[term]:
-                if pid == doc_id:
-                    raw_tf = count
-                    break
-            
-            if raw_tf == 0: continue
+        for doc_id in docs_to_rank:
+            # Buscar Raw TF en el índice (avanzando desde la última posición)
+            pos = bisect_left(doc_ords, doc_id, pos)
+            if pos == n: break
+            if doc_ords[pos] != doc_id: continue
+            raw_tf = tfs[pos]
+            doc_len = doc_lengths[doc_id]
             
             # Fórmula BM25
             tf_num = raw_tf * (K1 + 1)
@@ -135,6 +596,362 @@ def rank_documents_bm25(query, docs_to_rank, index, df, N, doc_lengths, avg_doc_
             
             doc_scores[doc_id] += idf_cache[term] * (tf_num / tf_den)
 
-    # Ordenar por score descendente
-    ranked_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-    return ranked_docs # Retorna lista de tuplas (doc_id, score)
\ No newline at end of file
+    # Ordenar por score descendente (empates por ordinal, para que sea determinista)
+    ranked_docs = sorted(doc_scores.items(), key=lambda x: (-x[1], x[0]))
+    return ranked_docs # Retorna lista de tuplas (ordinal, score)
+
+
+# --- 5. RANKING (BM25 vectorizado con NumPy) ---
+
+def compute_length_norm(doc_lengths, avg_doc_length):
+    """
+    Precalcula K1 * (1 - B + B * doc_len / avg_doc_length) para cada ordinal.
+    Las operaciones siguen el mismo orden que rank_documents_bm25 para que los
+    scores coincidan bit a bit.
+    """
+    lengths = np.asarray(doc_lengths, dtype=np.float64)
+    if avg_doc_length == 0:
+        return np.full(len(lengths), BM25_K1 * (1 - BM25_B), dtype=np.float64)
+    return BM25_K1 * (1 - BM25_B + BM25_B * (lengths / avg_doc_length))
+
+
+def _as_np(postings_column):
+    """Vista NumPy (sin copia) de una columna array('I') de una posting list."""
+    return np.frombuffer(postings_column, dtype=np.uint32)
+
+
+def _score_bm25_vectorized(query_terms, index, df, N, length_norm, docs_to_rank=None):
+    """Igual que rank_documents_bm25_vectorized pero sin ordenar el resultado."""
+    K1 = BM25_K1
+    N_docs = len(length_norm)
+    
+    if docs_to_rank is not None:
+        docs_to_rank = np.asarray(docs_to_rank, dtype=np.int64)
+    size = N_docs if docs_to_rank is None else len(docs_to_rank)
+    scores = np.zeros(size, dtype=np.float64)
+    matched = np.zeros(size, dtype=bool)
+    
+    for term in query_terms:
+        if term not in df: continue
+        idf = _bm25_idf(N, df[term])
+        doc_ords = _as_np(index[term][0])
+        tfs = _as_np(index[term][1])
+        
+        if docs_to_rank is None:
+            targets = doc_ords
+            raw_tf = tfs.astype(np.float64)
+            norm = length_norm[doc_ords]
+        else:
+            # Posición de cada candidato dentro de la posting list
+            pos = np.searchsorted(doc_ords, docs_to_rank)
+            pos_clipped = np.minimum(pos, len(doc_ords) - 1)
+            hit = doc_ords[pos_clipped] == docs_to_rank
+            targets = np.flatnonzero(hit)
+            raw_tf = tfs[pos_clipped[hit]].astype(np.float64)
+            norm = length_norm[docs_to_rank[hit]]
+        
+        tf_num = raw_tf * (K1 + 1)
+        tf_den = raw_tf + norm
+        # Cada ordinal aparece una sola vez por posting list: basta con += indexado
+        scores[targets] += idf * (tf_num / tf_den)
+        matched[targets] = True
+    
+    # Igual que la referencia: solo devolvemos documentos con algún término
+    hits = np.flatnonzero(matched)
+    ords = hits if docs_to_rank is None else docs_to_rank[hits]
+    return ords, scores[hits]
+
+
+def rank_documents_bm25_vectorized(query_terms, index, df, N, length_norm, docs_to_rank=None):
+    """
+    BM25 con operaciones NumPy por lotes.
+    - docs_to_rank=None: modo OR, se puntúan todas las postings de los términos
+      con un scatter-add sobre un vector denso de scores.
+    - docs_to_rank=array ordenado de ordinales: solo se puntúan esos candidatos.
+    Devuelve (ordinales, scores) ordenados por score descendente y ordinal.
+    """
+    ords, scores = _score_bm25_vectorized(query_terms, index, df, N, length_norm, docs_to_rank)
+    order = np.lexsort((ords, -scores))
+    return ords[order], scores[order]
+
+# --- 6. TOP-K (heap / MaxScore) ---
+
+# Margen para que el redondeo al sumar cotas nunca descarte un documento válido
+_UPPER_BOUND_SLACK = 1 + 1e-9
+
+
+def top_k_tuples(scored, k):
+    """Top-k de [(ordinal, score), ...] con un heap acotado (mismo orden que sorted)."""
+    return heapq.nsmallest(k, scored, key=lambda x: (-x[1], x[0]))
+
+
+def select_top_k(ords, scores, k):
+    """
+    Top-k de arrays (ordinales, scores) sin ordenar todo el resultado:
+    np.partition localiza el k-ésimo score y solo se ordenan los que lo alcanzan.
+    Los empates se resuelven por ordinal, igual que el camino exhaustivo.
+    """
+    if k <= 0:
+        return ords[:0], scores[:0]
+    if len(scores) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = np.flatnonzero(scores >= kth)
+        ords, scores = ords[keep], scores[keep]
+    order = np.lexsort((ords, -scores))[:k]
+    return ords[order], scores[order]
+
+
+def compute_term_upper_bounds(index, df, N, length_norm):
+    """
+    Máxima contribución BM25 de cada término sobre todas sus postings.
+    Se calcula una vez al indexar y permite descartar documentos que no
+    pueden entrar en el top-k (MaxScore).
+    """
+    K1 = BM25_K1
+    max_scores = {}
+    for term, (doc_ords, tfs) in index.items():
+        idf = _bm25_idf(N, df[term])
+        raw_tf = _as_np(tfs).astype(np.float64)
+        contrib = idf * ((raw_tf * (K1 + 1)) / (raw_tf + length_norm[_as_np(doc_ords)]))
+        max_scores[term] = float(contrib.max())
+    return max_scores
+
+
+def rank_documents_bm25_topk(query_terms, index, df, N, length_norm, max_scores, k, docs_to_rank=None,
+                             allowed=None):
+    """
+    Top-k BM25 con poda dinámica estilo MaxScore.
+    En modo OR se procesan los términos de mayor a menor cota; un documento que
+    solo aparece en los términos restantes no puede superar la suma de sus
+    cotas, así que en cuanto esa suma queda por debajo del k-ésimo score
+    actual se deja de leer postings. Devuelve exactamente el mismo top-k
+    (scores y orden) que el camino exhaustivo.
+    allowed (máscara booleana por ordinal, p.ej. de filtros por facetas) limita
+    el modo OR a esos documentos: el resto nunca se puntúa.
+    """
+    if docs_to_rank is not None:
+        # AND: todos los candidatos contienen todos los términos, no hay nada que podar
+        ords, scores = _score_bm25_vectorized(query_terms, index, df, N, length_norm, docs_to_rank)
+        return select_top_k(ords, scores, k)
+    
+    weights = collections.Counter(t for t in query_terms if t in df)
+    terms = sorted(weights, key=lambda t: (-weights[t] * max_scores[t], t))
+    # remaining_ub[i]: cota del score de un documento que solo contenga terms[i:]
+    remaining_ub = [0.0] * (len(terms) + 1)
+    for i in range(len(terms) - 1, -1, -1):
+        remaining_ub[i] = remaining_ub[i + 1] + weights[terms[i]] * max_scores[terms[i]]
+    
+    top_ords = np.zeros(0, dtype=np.int64)
+    top_scores = np.zeros(0, dtype=np.float64)
+    # Los documentos excluidos por los filtros cuentan como ya vistos
+    seen = np.zeros(len(length_norm), dtype=bool) if allowed is None else ~allowed
+    
+    for i, term in enumerate(terms):
+        if len(top_scores) == k and remaining_ub[i] * _UPPER_BOUND_SLACK < top_scores[-1]:
+            break
+        postings = _as_np(index[term][0])
+        new_docs = postings[~seen[postings]]
+        seen[postings] = True
+        if not len(new_docs): continue
+        
+        # Score completo (todos los términos de la query) de los documentos nuevos
+        ords, scores = _score_bm25_vectorized(query_terms, index, df, N, length_norm, new_docs)
+        top_ords, top_scores = select_top_k(
+            np.concatenate((top_ords, ords)), np.concatenate((top_scores, scores)), k
+        )
+    
+    return top_ords, top_scores
+
+
+# --- 7. BM25F (multi-campo) ---
+
+def compute_field_norm(field_lengths):
+    """1 - B + B * len_f / avg_len_f de cada ordinal para un campo (BM25F)."""
+    lengths = np.asarray(field_lengths, dtype=np.float64)
+    avg = lengths.mean() if len(lengths) else 0.0
+    if avg == 0:
+        return np.ones(len(lengths), dtype=np.float64)
+    return 1 - BM25_B + BM25_B * (lengths / avg)
+
+
+def find_candidate_docs_bm25f(query_terms, fields, mode="and", allowed=None):
+    """
+    Candidatos de BM25F: un documento contiene un término si aparece en
+    alguno de los campos. fields = {campo: (index, norm, peso)}; solo se
+    leen las posting lists de los términos de la query en esos campos.
+    Devuelve (array ordenado de ordinales, {término: df sobre los campos}).
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    term_docs = {}
+    for term in set(query_terms):
+        postings = [_as_np(index[term][0]) for index, _, _ in fields.values() if term in index]
+        if not postings:
+            docs = empty
+        elif len(postings) == 1:
+            docs = postings[0].astype(np.int64)
+        else:
+            docs = np.unique(np.concatenate(postings)).astype(np.int64)
+        term_docs[term] = docs
+    dfs = {term: len(docs) for term, docs in term_docs.items()}
+
+    if not term_docs:
+        return empty, dfs
+    if mode == "or":
+        candidates = np.unique(np.concatenate(list(term_docs.values())))
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+        return candidates, dfs
+
+    postings = sorted(term_docs.values(), key=len)
+    candidates = postings[0] if allowed is None else postings[0][allowed[postings[0]]]
+    for doc_ords in postings[1:]:
+        if not len(candidates) or not len(doc_ords):
+            return empty, dfs
+        pos = np.minimum(np.searchsorted(doc_ords, candidates), len(doc_ords) - 1)
+        candidates = candidates[doc_ords[pos] == candidates]
+    return candidates, dfs
+
+
+def rank_documents_bm25f(query_terms, fields, N, docs_to_rank, dfs):
+    """
+    BM25F (BM25 con frecuencias ponderadas por campo) sobre los candidatos:
+        tf~ = sum_f w_f * tf_f / (1 - B + B * len_f / avg_len_f)
+        score = sum_t idf(t) * tf~ * (K1 + 1) / (tf~ + K1)
+    La saturación se aplica después de sumar los campos, así que repetir un
+    término en varios campos no cuenta como varios términos independientes.
+    fields = {campo: (index, norm, peso)}; dfs viene de find_candidate_docs_bm25f.
+    Devuelve (ordinales, scores) sin ordenar, solo de documentos con algún término.
+    """
+    K1 = BM25_K1
+    docs_to_rank = np.asarray(docs_to_rank, dtype=np.int64)
+    scores = np.zeros(len(docs_to_rank), dtype=np.float64)
+    matched = np.zeros(len(docs_to_rank), dtype=bool)
+
+    for term in query_terms:
+        if not dfs.get(term): continue
+        idf = _bm25_idf(N, dfs[term])
+        tf = np.zeros(len(docs_to_rank), dtype=np.float64)
+        for index, norm, weight in fields.values():
+            if term not in index: continue
+            doc_ords = _as_np(index[term][0])
+            tfs = _as_np(index[term][1])
+            pos = np.minimum(np.searchsorted(doc_ords, docs_to_rank), len(doc_ords) - 1)
+            hit = doc_ords[pos] == docs_to_rank
+            tf[hit] += weight * (tfs[pos[hit]] / norm[docs_to_rank[hit]])
+        present = tf > 0
+        scores[present] += idf * ((tf[present] * (K1 + 1)) / (tf[present] + K1))
+        matched |= present
+
+    return docs_to_rank[matched], scores[matched]
+
+
+# --- 8. TF-IDF (coseno, matriz CSR) ---
+
+def _tfidf_weight(raw_tf, df_term, N):
+    """Peso TF-IDF de los notebooks: (1 + log10 tf) * log10(N / df)."""
+    return (1 + math.log10(raw_tf)) * math.log10(N / df_term)
+
+
+def rank_documents_tfidf(query_terms, docs_to_rank, index, df, N, doc_norms):
+    """
+    Similitud coseno TF-IDF de los candidatos: el rank_documents_tfidf de la
+    parte 3 (producto escalar de pesos (1 + log10 tf) * log10(N / df) de
+    query y documento) dividido por las normas de ambos vectores.
+    Implementación de referencia en Python puro de rank_documents_tfidf_csr.
+    """
+    query_vector = {}
+    for term, count in collections.Counter(query_terms).items():
+        if term not in df: continue
+        query_vector[term] = (1 + math.log10(count)) * math.log10(N / df[term])
+    query_norm = math.sqrt(sum(w * w for w in query_vector.values()))
+
+    candidates = set(docs_to_rank)
+    doc_scores = defaultdict(float)
+    for term, query_weight in query_vector.items():
+        doc_ords, tfs = index[term]
+        for doc_id, raw_tf in zip(doc_ords, tfs):
+            if doc_id in candidates:
+                doc_scores[doc_id] += query_weight * _tfidf_weight(raw_tf, df[term], N)
+
+    for doc_id, score in doc_scores.items():
+        denom = query_norm * doc_norms[doc_id]
+        doc_scores[doc_id] = score / denom if denom > 0 else 0.0
+
+    return sorted(doc_scores.items(), key=lambda x: (-x[1], x[0]))
+
+
+def build_tfidf_matrix(index, df, N, n_docs):
+    """
+    Matriz documento-término CSR con los pesos TF-IDF, construida a partir
+    del índice invertido: (indptr, indices, data, term_ids), donde la fila
+    d ocupa data[indptr[d]:indptr[d + 1]] con sus columnas (ids de término)
+    ordenadas en indices.
+    """
+    term_ids = {term: i for i, term in enumerate(index)}
+    rows, cols, data = [], [], []
+    for term, (doc_ords, tfs) in index.items():
+        ords = _as_np(doc_ords)
+        rows.append(ords)
+        cols.append(np.full(len(ords), term_ids[term], dtype=np.uint32))
+        data.append((1 + np.log10(_as_np(tfs).astype(np.float64))) * math.log10(N / df[term]))
+    if not rows:
+        return np.zeros(n_docs + 1, dtype=np.int64), np.zeros(0, np.uint32), np.zeros(0, np.float64), term_ids
+    rows = np.concatenate(rows)
+    # Los términos ya están en orden de id: ordenar (estable) por fila deja cada fila ordenada por columna
+    order = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n_docs + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_docs), out=indptr[1:])
+    return indptr, np.concatenate(cols)[order], np.concatenate(data)[order], term_ids
+
+
+def compute_tfidf_norms(tfidf_matrix):
+    """Norma L2 del vector TF-IDF de cada documento (fila de la matriz CSR)."""
+    indptr, _, data, _ = tfidf_matrix
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    return np.sqrt(np.bincount(rows, weights=data * data, minlength=len(indptr) - 1))
+
+
+def rank_documents_tfidf_csr(query_terms, docs_to_rank, tfidf_matrix, doc_norms, df, N, index=None):
+    """
+    Coseno TF-IDF como producto disperso de las filas candidatas de la
+    matriz CSR por el vector de la query: se recorren solo las entradas no
+    nulas de esas filas. Si se pasa el índice invertido y las posting lists
+    de los términos de la query tienen menos entradas que esas filas (p.ej.
+    en modo OR, donde los candidatos son su unión) se suma por columnas.
+    Devuelve (ordinales, scores) sin ordenar.
+    """
+    indptr, indices, data, term_ids = tfidf_matrix
+    docs_to_rank = np.asarray(docs_to_rank, dtype=np.int64)
+
+    query_weights = {}
+    for term, count in collections.Counter(query_terms).items():
+        if term not in df: continue
+        query_weights[term] = (1 + math.log10(count)) * math.log10(N / df[term])
+    query_norm = math.sqrt(sum(w * w for w in query_weights.values()))
+    if not len(docs_to_rank) or query_norm == 0:
+        return docs_to_rank, np.zeros(len(docs_to_rank), dtype=np.float64)
+
+    starts = indptr[docs_to_rank]
+    lengths = indptr[docs_to_rank + 1] - starts
+    if index is not None and sum(df[term] for term in query_weights) < lengths.sum():
+        # Por columnas: scatter-add de las posting lists de la query
+        acc = np.zeros(len(indptr) - 1, dtype=np.float64)
+        for term, query_weight in query_weights.items():
+            doc_ords, tfs = index[term]
+            acc[_as_np(doc_ords)] += query_weight * (
+                (1 + np.log10(_as_np(tfs).astype(np.float64))) * math.log10(N / df[term])
+            )
+        dots = acc[docs_to_rank]
+    else:
+        # Por filas: posiciones en data/indices de todas las entradas de las filas candidatas
+        query_vector = np.zeros(len(term_ids), dtype=np.float64)
+        for term, query_weight in query_weights.items():
+            query_vector[term_ids[term]] = query_weight
+        owner = np.repeat(np.arange(len(docs_to_rank)), lengths)
+        positions = np.arange(len(owner)) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        dots = np.bincount(owner, weights=data[positions] * query_vector[indices[positions]],
+                           minlength=len(docs_to_rank))
+
+    denom = query_norm * doc_norms[docs_to_rank]
+    scores = np.divide(dots, denom, out=np.zeros(len(dots)), where=denom > 0)
+    return docs_to_rank, scores
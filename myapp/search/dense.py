@@ -0,0 +1,273 @@
+import json
+import sys
+import time
+
+import numpy as np
+
+from myapp.search.algorithms import DEFAULT_ANALYZER, analyze_query, get_analyzer, index_contents, select_top_k
+
+# Word2Vec (skip-gram), mismos parámetros que el prototipo de la parte 3
+DENSE_DIM = 100
+W2V_WINDOW = 5
+W2V_MIN_COUNT = 2
+W2V_EPOCHS = 10
+W2V_SEED = 42
+
+# Por debajo de este número de documentos basta con la búsqueda exacta
+ANN_MIN_DOCS = 100_000
+DEFAULT_NPROBE = 16
+IVF_ITERATIONS = 10
+IVF_TRAIN_SAMPLE = 100_000 # documentos usados para entrenar los centroides
+_BLOCK = 4096 # filas por bloque al construir vectores / asignar listas
+
+
+def dense_available():
+    """True if gensim (needed to train the Word2Vec vectors) is installed."""
+    try:
+        import gensim # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def train_term_vectors(token_lists, dim=DENSE_DIM, epochs=W2V_EPOCHS, seed=W2V_SEED):
+    """
+    Word2Vec skip-gram sobre los documentos ya analizados.
+    Devuelve (términos, matriz float32 términos x dim).
+    Se entrena con un solo hilo: con varios, el reparto de los lotes entre
+    hilos cambia los vectores de una ejecución a otra aunque la semilla sea
+    la misma, y el ranking de word2vec / hybrid no sería reproducible.
+    """
+    from gensim.models.word2vec import Word2Vec # dependencia opcional
+
+    model = Word2Vec(
+        sentences=token_lists,
+        vector_size=dim,
+        window=W2V_WINDOW,
+        min_count=W2V_MIN_COUNT,
+        workers=1,
+        sg=1,
+        epochs=epochs,
+        seed=seed,
+    )
+    return list(model.wv.index_to_key), np.ascontiguousarray(model.wv.vectors, dtype=np.float32)
+
+
+def _normalize_rows(matrix):
+    """Normaliza cada fila a norma L2 1 (las filas a cero se quedan a cero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over L2-normalized vectors: spherical k-means
+    centroids, and for every centroid the ordinals assigned to it stored
+    contiguously (ords[offsets[c]:offsets[c + 1]]). A query only scores the
+    documents of its `nprobe` closest centroids.
+    """
+
+    def __init__(self, centroids, offsets, ords):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ords = ords
+
+    @classmethod
+    def build(cls, vectors, valid=None, nlist=None, iterations=IVF_ITERATIONS, seed=W2V_SEED):
+        """
+        :param vectors: N x dim L2-normalized float32 matrix
+        :param valid: bool mask of the rows to index (None = all)
+        :param nlist: number of lists (default sqrt(N))
+        """
+        rows = np.arange(len(vectors)) if valid is None else np.flatnonzero(valid)
+        if not len(rows):
+            return cls(np.zeros((0, vectors.shape[1]), dtype=np.float32),
+                       np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint32))
+        nlist = min(len(rows), nlist or max(1, int(np.sqrt(len(rows)))))
+        rng = np.random.default_rng(seed)
+
+        sample = rows if len(rows) <= IVF_TRAIN_SAMPLE else np.sort(rng.choice(rows, IVF_TRAIN_SAMPLE, replace=False))
+        train = np.asarray(vectors[sample], dtype=np.float32)
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = cls._assign(train, centroids)
+            order = np.argsort(assign, kind="stable")
+            starts = np.searchsorted(assign[order], np.arange(nlist))
+            filled = np.diff(np.append(starts, len(order))) > 0
+            # Una lista vacía conserva su centroide anterior
+            centroids[filled] = np.add.reduceat(train[order], starts[filled], axis=0)
+            _normalize_rows(centroids)
+
+        assign = np.concatenate([cls._assign(np.asarray(vectors[rows[i:i + _BLOCK]]), centroids)
+                                 for i in range(0, len(rows), _BLOCK)])
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+        return cls(centroids, offsets, rows[order].astype(np.uint32))
+
+    @staticmethod
+    def _assign(vectors, centroids):
+        """Centroide más cercano (máximo producto escalar) de cada fila."""
+        return np.argmax(vectors @ centroids.T, axis=1)
+
+    def __len__(self):
+        return len(self.centroids)
+
+    def search(self, vectors, query_vector, k, nprobe=DEFAULT_NPROBE, allowed=None):
+        """Top-k (ordinales, scores) aproximado entre las listas de los nprobe centroides más cercanos."""
+        if not len(self.centroids):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        nprobe = min(nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query_vector
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.ords[self.offsets[c]:self.offsets[c + 1]] for c in probe]).astype(np.int64)
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+        return select_top_k(candidates, vectors[candidates] @ query_vector, k)
+
+
+class DenseIndex:
+    """
+    Dense (Word2Vec) retrieval: each document is the L2-normalized sum of
+    the vectors of its analyzed title + description terms, stored as one
+    float32 matrix aligned with the index ordinals (memory-mapped when it
+    comes from the snapshot). Cosine similarity against every document is
+    a single matrix-vector product; with an IVFIndex (large catalogs) only
+    the closest lists are scored.
+    """
+
+    def __init__(self, terms, term_vectors, doc_vectors, has_vector, ivf=None):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.term_vectors = term_vectors
+        self.doc_vectors = doc_vectors
+        self.has_vector = has_vector # documentos sin ningún término con vector: nunca se devuelven
+        self.ivf = ivf
+
+    @property
+    def dim(self):
+        return self.doc_vectors.shape[1]
+
+    @classmethod
+    def build(cls, corpus, analyzer=DEFAULT_ANALYZER, dim=DENSE_DIM, ann_min_docs=ANN_MIN_DOCS, token_lists=None):
+        """
+        Train the term vectors on the corpus and build the document matrix (and IVF if large enough).
+        :param token_lists: analyzed title + description of each document, in ordinal order
+                            (e.g. from create_index_part3(keep_tokens=True)); analyzed here if None
+        """
+        if token_lists is None:
+            analyze = get_analyzer(analyzer).analyze
+            token_lists = [analyze(text) for text in index_contents(corpus)]
+        terms, term_vectors = train_term_vectors(token_lists, dim=dim)
+        term_ids = {term: i for i, term in enumerate(terms)}
+
+        doc_vectors = np.zeros((len(token_lists), dim), dtype=np.float32)
+        for start in range(0, len(token_lists), _BLOCK):
+            ids = [[term_ids[t] for t in tokens if t in term_ids] for tokens in token_lists[start:start + _BLOCK]]
+            lengths = np.fromiter(map(len, ids), dtype=np.int64, count=len(ids))
+            flat = np.fromiter((i for doc in ids for i in doc), dtype=np.int64, count=int(lengths.sum()))
+            if not len(flat):
+                continue
+            # Suma de los vectores de cada documento (la media no cambia tras normalizar):
+            # los términos están agrupados por documento, así que basta un reduceat
+            filled = np.flatnonzero(lengths)
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))[filled]
+            doc_vectors[start + filled] = np.add.reduceat(term_vectors[flat], starts, axis=0)
+        _normalize_rows(doc_vectors)
+        has_vector = doc_vectors.any(axis=1)
+
+        ivf = IVFIndex.build(doc_vectors, has_vector) if len(doc_vectors) >= ann_min_docs else None
+        return cls(terms, term_vectors, doc_vectors, has_vector, ivf)
+
+    def to_arrays(self):
+        """(términos, {nombre: array}) para guardar en el snapshot (ver from_arrays)."""
+        arrays = {
+            "term_vectors": self.term_vectors,
+            "doc_vectors": self.doc_vectors,
+            "has_vector": self.has_vector.astype(np.uint8),
+        }
+        if self.ivf is not None:
+            arrays.update(ivf_centroids=self.ivf.centroids, ivf_offsets=self.ivf.offsets, ivf_ords=self.ivf.ords)
+        return self.terms, arrays
+
+    @classmethod
+    def from_arrays(cls, terms, arrays):
+        ivf = None
+        if "ivf_centroids" in arrays:
+            ivf = IVFIndex(arrays["ivf_centroids"], arrays["ivf_offsets"], arrays["ivf_ords"])
+        return cls(terms, arrays["term_vectors"], arrays["doc_vectors"], arrays["has_vector"].astype(bool), ivf)
+
+    def encode(self, query_terms):
+        """Vector L2-normalizado de la query (suma de sus términos) o None si ninguno tiene vector."""
+        ids = [self.term_ids[t] for t in query_terms if t in self.term_ids]
+        if not ids:
+            return None
+        vector = self.term_vectors[ids].sum(axis=0, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def search(self, query_terms, k, allowed=None, exact=None, nprobe=DEFAULT_NPROBE):
+        """
+        Top-k (ordinales, scores coseno) de la query.
+        exact=None usa el IVF si existe y no hay filtros; con filtros se
+        puntúan solo los documentos permitidos, de forma exacta.
+        """
+        query_vector = self.encode(query_terms)
+        if query_vector is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        if exact is None:
+            exact = self.ivf is None or allowed is not None
+        mask = self.has_vector if allowed is None else self.has_vector & allowed
+        if not exact:
+            ords, scores = self.ivf.search(self.doc_vectors, query_vector, k, nprobe, None if allowed is None else mask)
+        elif allowed is None and mask.all():
+            ords, scores = select_top_k(np.arange(len(mask)), self.doc_vectors @ query_vector, k)
+        else:
+            rows = np.flatnonzero(mask)
+            ords, scores = select_top_k(rows, self.doc_vectors[rows] @ query_vector, k)
+        return ords.astype(np.int64), scores.astype(np.float64)
+
+
+def benchmark_ann(dense, queries, k=20, nprobes=(1, 2, 4, 8, 16, 32), analyzer=DEFAULT_ANALYZER):
+    """
+    Recall@k of the IVF index against exhaustive search and latency per
+    query, for each nprobe. Builds the IVF index if `dense` has none.
+    Returns {"exact": {"ms_per_query"}, "ivf": [{"nprobe", "recall", "ms_per_query"}, ...]}.
+    """
+    if dense.ivf is None:
+        start = time.perf_counter()
+        dense.ivf = IVFIndex.build(dense.doc_vectors, dense.has_vector)
+        print(f"IVF built in {time.perf_counter() - start:.2f}s ({len(dense.ivf)} lists)")
+    query_terms = [analyze_query(q, analyzer) for q in queries]
+    query_terms = [terms for terms in query_terms if dense.encode(terms) is not None]
+
+    start = time.perf_counter()
+    truth = [set(dense.search(terms, k, exact=True)[0].tolist()) for terms in query_terms]
+    exact_ms = (time.perf_counter() - start) / max(1, len(query_terms)) * 1000
+
+    results = {"queries": len(query_terms), "k": k, "documents": len(dense.doc_vectors),
+               "exact": {"ms_per_query": round(exact_ms, 3)}, "ivf": []}
+    for nprobe in nprobes:
+        start = time.perf_counter()
+        found = [dense.search(terms, k, exact=False, nprobe=nprobe)[0].tolist() for terms in query_terms]
+        ms = (time.perf_counter() - start) / max(1, len(query_terms)) * 1000
+        hits = sum(len(expected.intersection(got)) for expected, got in zip(truth, found))
+        recall = hits / max(1, sum(len(expected) for expected in truth))
+        results["ivf"].append({"nprobe": nprobe, "recall": round(recall, 4), "ms_per_query": round(ms, 3)})
+    return results
+
+
+if __name__ == "__main__":
+    # python -m myapp.search.dense data/fashion_products_dataset.json [n_queries]
+    from myapp.search.load_corpus import load_corpus
+
+    corpus = load_corpus(sys.argv[1])
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    start = time.perf_counter()
+    dense = DenseIndex.build(corpus, ann_min_docs=0)
+    print(f"Dense index built in {time.perf_counter() - start:.2f}s")
+    # Títulos de productos al azar como queries
+    rng = np.random.default_rng(0)
+    titles = corpus.column("title")
+    queries = [titles[i] for i in rng.choice(len(titles), min(n_queries, len(titles)), replace=False)]
+    print(json.dumps(benchmark_ann(dense, queries), indent=2))
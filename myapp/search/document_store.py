@@ -0,0 +1,167 @@
+import json
+from array import array
+from collections.abc import Mapping
+from typing import Iterable, List
+
+import numpy as np
+
+from myapp.search.objects import Document
+
+NUMERIC_FIELDS = ("selling_price", "actual_price", "discount", "average_rating")
+CATEGORICAL_FIELDS = ("brand", "category", "sub_category", "seller")
+TEXT_FIELDS = ("title", "description", "url")
+
+
+class DocumentStore(Mapping):
+    """
+    Columnar, read-only corpus: {pid: Document} on the outside, columns inside.
+
+    - numeric fields are float64 NumPy arrays (NaN when missing) and
+      out_of_stock is a bool array, all indexed by row (file order);
+    - brand / category / sub_category / seller are int32 codes into a
+      per-field vocabulary, so each distinct string is stored once
+      (code -1 means missing);
+    - product_details and images are kept as one JSON string per row.
+
+    A full Document is only built when a row is accessed (store[pid]),
+    which is what results.html and doc_details.html need for the top-k.
+    """
+
+    def __init__(self):
+        self.pids: List[str] = [] # row -> pid
+        self._rows = {} # pid -> row
+        self._text = {field: [] for field in TEXT_FIELDS}
+        self._vocab = {field: [] for field in CATEGORICAL_FIELDS} # code -> string
+        self._vocab_codes = {field: {} for field in CATEGORICAL_FIELDS} # string -> code
+        # Mientras se carga se acumula en array(); freeze() lo pasa a NumPy
+        self._codes = {field: array('i') for field in CATEGORICAL_FIELDS}
+        self._numeric = {field: array('d') for field in NUMERIC_FIELDS}
+        self._out_of_stock = array('b')
+        self._extras = [] # JSON [product_details, images] o None
+        self._frozen = False
+
+    @classmethod
+    def from_documents(cls, batches: Iterable[List[Document]]) -> "DocumentStore":
+        """Build a store from batches of Documents (e.g. iter_document_batches)."""
+        store = cls()
+        for batch in batches:
+            for doc in batch:
+                store._append(doc)
+        store.freeze()
+        return store
+
+    def _append(self, doc: Document):
+        if self._frozen:
+            raise RuntimeError("DocumentStore is read-only once frozen")
+        row = self._rows.get(doc.pid)
+        if row is not None:
+            # pid repetido: como en el dict, gana el último
+            self._replace(row, doc)
+            return
+        self._rows[doc.pid] = len(self.pids)
+        self.pids.append(doc.pid)
+        for field in TEXT_FIELDS:
+            self._text[field].append(getattr(doc, field))
+        for field in CATEGORICAL_FIELDS:
+            self._codes[field].append(self._intern(field, getattr(doc, field)))
+        for field in NUMERIC_FIELDS:
+            value = getattr(doc, field)
+            self._numeric[field].append(np.nan if value is None else value)
+        self._out_of_stock.append(bool(doc.out_of_stock))
+        self._extras.append(self._pack_extras(doc))
+
+    def _replace(self, row, doc: Document):
+        for field in TEXT_FIELDS:
+            self._text[field][row] = getattr(doc, field)
+        for field in CATEGORICAL_FIELDS:
+            self._codes[field][row] = self._intern(field, getattr(doc, field))
+        for field in NUMERIC_FIELDS:
+            value = getattr(doc, field)
+            self._numeric[field][row] = np.nan if value is None else value
+        self._out_of_stock[row] = bool(doc.out_of_stock)
+        self._extras[row] = self._pack_extras(doc)
+
+    def _intern(self, field, value):
+        if value is None:
+            return -1
+        codes = self._vocab_codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._vocab[field])
+            self._vocab[field].append(value)
+        return code
+
+    @staticmethod
+    def _pack_extras(doc: Document):
+        if doc.product_details is None and doc.images is None:
+            return None
+        return json.dumps([doc.product_details, doc.images], separators=(",", ":"))
+
+    def freeze(self):
+        """Turn the load buffers into NumPy columns (done by from_documents)."""
+        if self._frozen:
+            return
+        self._codes = {field: np.array(values, dtype=np.int32) for field, values in self._codes.items()}
+        self._numeric = {field: np.array(values, dtype=np.float64) for field, values in self._numeric.items()}
+        self._out_of_stock = np.array(self._out_of_stock, dtype=bool)
+        self._frozen = True
+
+    # --- Mapping: pid -> Document ---
+
+    def __getitem__(self, pid) -> Document:
+        return self.document(self._rows[pid])
+
+    def __iter__(self):
+        return iter(self.pids)
+
+    def __len__(self):
+        return len(self.pids)
+
+    def __contains__(self, pid):
+        return pid in self._rows
+
+    # --- Acceso por fila / columna ---
+
+    def row(self, pid) -> int:
+        """Row of a pid (KeyError if unknown)."""
+        return self._rows[pid]
+
+    def document(self, row) -> Document:
+        """Materialize the Document stored at `row` (values were validated on load)."""
+        fields = {"pid": self.pids[row], "out_of_stock": bool(self._out_of_stock[row])}
+        for field in TEXT_FIELDS:
+            fields[field] = self._text[field][row]
+        for field in CATEGORICAL_FIELDS:
+            code = self._codes[field][row]
+            fields[field] = self._vocab[field][code] if code >= 0 else None
+        for field in NUMERIC_FIELDS:
+            value = self._numeric[field][row]
+            fields[field] = None if np.isnan(value) else float(value)
+        extras = self._extras[row]
+        if extras is not None:
+            fields["product_details"], fields["images"] = json.loads(extras)
+        return Document.model_construct(**fields)
+
+    def product_details(self, row):
+        """product_details dict of `row` (or None), without building the Document."""
+        extras = self._extras[row]
+        return json.loads(extras)[0] if extras is not None else None
+
+    def column(self, field):
+        """
+        Column by field name: NumPy array for numeric fields and out_of_stock,
+        int32 codes for categorical fields (see vocabulary), list for text.
+        """
+        if field in NUMERIC_FIELDS:
+            return self._numeric[field]
+        if field == "out_of_stock":
+            return self._out_of_stock
+        if field in CATEGORICAL_FIELDS:
+            return self._codes[field]
+        if field in TEXT_FIELDS:
+            return self._text[field]
+        raise KeyError(field)
+
+    def vocabulary(self, field) -> List[str]:
+        """Distinct values of a categorical field, indexed by code."""
+        return self._vocab[field]
@@ -0,0 +1,230 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+try:
+    import resource # solo Unix
+except ImportError:
+    resource = None
+
+DEFAULT_K = 10
+
+
+# --- Métricas (las del notebook de la parte 2, sobre vectores de relevancia) ---
+
+def precision_at_k(ranked_relevances, k):
+    """Fraction of the first k positions that are relevant (missing positions count as 0)."""
+    ranked_relevances = np.asarray(ranked_relevances, dtype=np.float64)[:k]
+    return float(np.count_nonzero(ranked_relevances) / k) if k else 0.0
+
+
+def recall_at_k(ranked_relevances, total_relevant_docs, k):
+    """Fraction of the relevant documents found in the first k positions."""
+    ranked_relevances = np.asarray(ranked_relevances, dtype=np.float64)[:k]
+    return float(np.count_nonzero(ranked_relevances) / total_relevant_docs) if total_relevant_docs else 0.0
+
+
+def average_precision_at_k(ranked_relevances, total_relevant_docs, k):
+    """
+    Mean of P@i over the relevant positions i <= k, divided by
+    min(total relevant, k) so that missing relevant documents count.
+    """
+    hits = np.asarray(ranked_relevances, dtype=np.float64)[:k] > 0
+    if not hits.any() or not total_relevant_docs:
+        return 0.0
+    precisions = np.cumsum(hits)[hits] / (np.flatnonzero(hits) + 1)
+    return float(precisions.sum() / min(total_relevant_docs, k))
+
+
+def reciprocal_rank(ranked_relevances, k=None):
+    """1 / position of the first relevant document (0 if there is none)."""
+    hits = np.flatnonzero(np.asarray(ranked_relevances, dtype=np.float64)[:k] > 0)
+    return float(1 / (hits[0] + 1)) if len(hits) else 0.0
+
+
+def ndcg_at_k(ranked_relevances, k, ideal_relevances=None):
+    """
+    DCG@k / ideal DCG@k with graded relevances (rel / log2(i + 1)).
+    :param ideal_relevances: every judged grade of the query; the ideal
+        ranking is built from them (by default, from ranked_relevances)
+    """
+    ranked_relevances = np.asarray(ranked_relevances, dtype=np.float64)[:k]
+    if ideal_relevances is None:
+        ideal_relevances = ranked_relevances
+    ideal = np.sort(np.asarray(ideal_relevances, dtype=np.float64))[::-1][:k]
+    dcg = np.sum(ranked_relevances / np.log2(np.arange(2, len(ranked_relevances) + 2)))
+    ideal_dcg = np.sum(ideal / np.log2(np.arange(2, len(ideal) + 2)))
+    return float(dcg / ideal_dcg) if ideal_dcg > 0 else 0.0
+
+
+# --- Query set ---
+
+def load_query_set(queries_path, judgments_path=None):
+    """
+    Query set as a list of {"query_id", "query", "judgments": {pid: grade}}.
+
+    queries_path is JSON (a list of objects, or {query_id: query}) or JSONL,
+    one object per line with "query_id", "query" and optionally
+    "judgments" ({pid: grade} or a list of relevant pids).
+    judgments_path is a CSV with query_id, pid and labels columns, like
+    validation_labels.csv in the notebooks (labels >= 1 is relevant).
+    Queries without judgments are only used for latency.
+    """
+    with open(queries_path, encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        data = [{"query_id": query_id, "query": query} for query_id, query in data.items()]
+
+    queries = []
+    for i, entry in enumerate(data):
+        judgments = entry.get("judgments") or {}
+        if isinstance(judgments, list):
+            judgments = dict.fromkeys(judgments, 1)
+        queries.append({"query_id": str(entry.get("query_id", i + 1)), "query": entry["query"],
+                        "judgments": {pid: float(grade) for pid, grade in judgments.items()}})
+
+    if judgments_path:
+        by_id = {q["query_id"]: q for q in queries}
+        with open(judgments_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                query = by_id.get(str(row["query_id"]).strip())
+                if query is not None:
+                    query["judgments"][row["pid"].strip()] = float(row["labels"])
+    return queries
+
+
+def evaluate_ranking(ranked_pids, judgments, k):
+    """Quality metrics of one ranking against {pid: grade} judgments."""
+    relevances = [judgments.get(pid, 0.0) for pid in ranked_pids[:k]]
+    total_relevant = sum(1 for grade in judgments.values() if grade > 0)
+    return {
+        "precision": precision_at_k(relevances, k),
+        "recall": recall_at_k(relevances, total_relevant, k),
+        "average_precision": average_precision_at_k(relevances, total_relevant, k),
+        "reciprocal_rank": reciprocal_rank(relevances, k),
+        "ndcg": ndcg_at_k(relevances, k, list(judgments.values())),
+    }
+
+
+# --- Benchmark ---
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB, macOS en bytes
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _latency_stats(times):
+    times = np.asarray(times) * 1000
+    return {"mean_ms": round(float(times.mean()), 3),
+            "p50_ms": round(float(np.percentile(times, 50)), 3),
+            "p95_ms": round(float(np.percentile(times, 95)), 3),
+            "p99_ms": round(float(np.percentile(times, 99)), 3),
+            "max_ms": round(float(times.max()), 3)}
+
+
+def evaluate_algorithm(engine, corpus, queries, algorithm, k=DEFAULT_K, mode="and", repeat=1):
+    """
+    Runs every query through engine.search with `algorithm`, clearing the
+    result cache before each call, so latencies are those of a cold
+    ranking. Quality metrics are averaged over the queries with judgments
+    (MAP, MRR and mean P@k / R@k / NDCG@k).
+    """
+    times, per_query = [], {}
+    with redirect_stdout(io.StringIO()): # search() imprime cada query
+        for _ in range(repeat):
+            for query in queries:
+                engine.result_cache.clear()
+                start = time.perf_counter()
+                results = engine.search(query["query"], 0, corpus, algorithm=algorithm, mode=mode, k=k)
+                times.append(time.perf_counter() - start)
+                per_query[query["query_id"]] = [item.pid for item in results]
+
+    judged = [q for q in queries if q["judgments"]]
+    metrics = [evaluate_ranking(per_query[q["query_id"]], q["judgments"], k) for q in judged]
+    quality = None
+    if metrics:
+        mean = lambda name: round(float(np.mean([m[name] for m in metrics])), 4)
+        quality = {"judged_queries": len(metrics),
+                   f"precision@{k}": mean("precision"), f"recall@{k}": mean("recall"),
+                   "map": mean("average_precision"), "mrr": mean("reciprocal_rank"),
+                   f"ndcg@{k}": mean("ndcg")}
+    return {"quality": quality,
+            "latency": _latency_stats(times),
+            "qps": round(len(times) / sum(times), 1) if sum(times) else None}
+
+
+def run_benchmark(dataset_path, queries, algorithms=None, k=DEFAULT_K, mode="and", repeat=1, **engine_options):
+    """
+    Loads the corpus, builds a SearchEngine index (timed) and evaluates
+    each algorithm (all of engine.algorithms() by default) on `queries`
+    (see load_query_set). engine_options go to SearchEngine.
+    """
+    from myapp.search.load_corpus import load_corpus
+    from myapp.search.search_engine import SearchEngine
+
+    start = time.perf_counter()
+    corpus = load_corpus(dataset_path)
+    load_seconds = time.perf_counter() - start
+    rss_after_load = peak_rss_mb()
+
+    engine = SearchEngine(**engine_options)
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        engine.create_index(corpus)
+    build_seconds = time.perf_counter() - start
+
+    report = {
+        "dataset": str(dataset_path),
+        "documents": len(corpus),
+        "queries": len(queries),
+        "judged_queries": sum(1 for q in queries if q["judgments"]),
+        "k": k, "mode": mode, "repeat": repeat,
+        "load_seconds": round(load_seconds, 3),
+        "index_build_seconds": round(build_seconds, 3),
+        "peak_rss_mb": {"after_load": rss_after_load, "after_index": peak_rss_mb()},
+        "algorithms": {},
+    }
+    for algorithm in algorithms or engine.algorithms():
+        report["algorithms"][algorithm] = evaluate_algorithm(engine, corpus, queries, algorithm,
+                                                             k=k, mode=mode, repeat=repeat)
+    report["peak_rss_mb"]["final"] = peak_rss_mb()
+    return report
+
+
+if __name__ == "__main__":
+    # python -m myapp.search.evaluation data/fashion_products_dataset.json queries.json \
+    #     [--judgments data/validation_labels.csv] [--k 10] [--mode and] [--algorithms bm25 tfidf] [--dense]
+    parser = argparse.ArgumentParser(description="Relevance and speed benchmark of SearchEngine (JSON output)")
+    parser.add_argument("dataset")
+    parser.add_argument("queries", help="JSON / JSONL query set (see load_query_set)")
+    parser.add_argument("--judgments", help="CSV with query_id, pid, labels")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--mode", choices=("and", "or"), default="and")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--algorithms", nargs="+")
+    parser.add_argument("--dense", action="store_true", help="train word2vec (adds the word2vec / hybrid algorithms)")
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.dataset, load_query_set(args.queries, args.judgments), algorithms=args.algorithms,
+                           k=args.k, mode=args.mode, repeat=args.repeat, dense=args.dense)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,166 @@
+import numpy as np
+
+from myapp.search.document_store import DocumentStore
+
+CATEGORICAL_FACETS = ("brand", "category", "sub_category", "seller")
+NUMERIC_FACETS = ("selling_price", "discount", "average_rating")
+STOCK_FACET = "out_of_stock"
+
+
+class FacetIndex:
+    """
+    Facet indexes over the indexed documents, aligned with index ordinals:
+
+    - brand / category / sub_category / seller: int32 code per ordinal
+      plus, for every value, the sorted array of ordinals that have it;
+    - out_of_stock: bool per ordinal plus the sorted ordinals of each side;
+    - selling_price / discount / average_rating: the ordinals sorted by
+      value, so a range filter is two binary searches.
+
+    mask(filters) turns a filter set into a boolean mask over ordinals
+    that the ranking applies before scoring.
+
+    Filters are a dict such as
+        {"brand": ["Nike", "Puma"], "out_of_stock": False, "selling_price": (None, 50)}
+    Values of one field are OR-ed, different fields are AND-ed; ranges are
+    (min, max) with None for an open end and exclude missing values.
+    """
+
+    def __init__(self, codes, vocab, out_of_stock, numeric):
+        self.N = len(out_of_stock)
+        self.codes = codes # campo -> int32 por ordinal (-1 = sin valor)
+        self.vocab = vocab # campo -> [valor por código]
+        self._code_of = {field: {value: code for code, value in enumerate(values)}
+                         for field, values in vocab.items()}
+        self.out_of_stock = out_of_stock
+        self.numeric = numeric # campo -> float64 por ordinal (NaN = sin valor)
+
+        # Listas de ordinales ordenadas por valor de cada faceta categórica
+        self.postings = {}
+        for field, field_codes in codes.items():
+            order = np.argsort(field_codes, kind="stable").astype(np.int32)
+            bounds = np.searchsorted(field_codes[order], np.arange(len(vocab[field]) + 1))
+            self.postings[field] = [order[bounds[c]:bounds[c + 1]] for c in range(len(vocab[field]))]
+        self.stock_postings = {
+            True: np.flatnonzero(out_of_stock).astype(np.int32),
+            False: np.flatnonzero(~out_of_stock).astype(np.int32),
+        }
+        # Columnas numéricas ordenadas (los NaN quedan al final)
+        self._sorted_order = {}
+        self._sorted_values = {}
+        for field, values in numeric.items():
+            order = np.argsort(values, kind="stable")
+            self._sorted_order[field] = order
+            self._sorted_values[field] = values[order]
+
+    @classmethod
+    def from_corpus(cls, corpus, doc_ids):
+        """
+        :param corpus: DocumentStore (codes are reused) or {pid: Document}
+        :param doc_ids: ordinal -> pid of the index
+        """
+        if isinstance(corpus, DocumentStore):
+            if corpus.pids == list(doc_ids):
+                rows = slice(None)
+            else:
+                rows = np.fromiter((corpus.row(pid) for pid in doc_ids), dtype=np.int64, count=len(doc_ids))
+            codes = {field: corpus.column(field)[rows] for field in CATEGORICAL_FACETS}
+            vocab = {field: corpus.vocabulary(field) for field in CATEGORICAL_FACETS}
+            out_of_stock = corpus.column("out_of_stock")[rows]
+            numeric = {field: corpus.column(field)[rows] for field in NUMERIC_FACETS}
+        else:
+            docs = [corpus[pid] for pid in doc_ids]
+            codes, vocab = {}, {}
+            for field in CATEGORICAL_FACETS:
+                code_of = {}
+                field_codes = np.empty(len(docs), dtype=np.int32)
+                for i, doc in enumerate(docs):
+                    value = getattr(doc, field)
+                    field_codes[i] = -1 if value is None else code_of.setdefault(value, len(code_of))
+                codes[field], vocab[field] = field_codes, list(code_of)
+            out_of_stock = np.array([bool(doc.out_of_stock) for doc in docs], dtype=bool)
+            numeric = {
+                field: np.array([np.nan if getattr(doc, field) is None else getattr(doc, field) for doc in docs],
+                                dtype=np.float64)
+                for field in NUMERIC_FACETS
+            }
+        return cls(codes, vocab, out_of_stock, numeric)
+
+    @staticmethod
+    def normalize_filters(filters):
+        """
+        Canonical, hashable form of a filter dict (used in cache keys);
+        empty values are dropped. Raises ValueError for unknown fields.
+        """
+        normalized = []
+        for field, value in (filters or {}).items():
+            if value is None or value == [] or value == ():
+                continue
+            if field in CATEGORICAL_FACETS:
+                values = [value] if isinstance(value, str) else list(value)
+                normalized.append((field, tuple(sorted(set(values)))))
+            elif field == STOCK_FACET:
+                normalized.append((field, bool(value)))
+            elif field in NUMERIC_FACETS:
+                low, high = value
+                if low is None and high is None:
+                    continue
+                normalized.append((field, (None if low is None else float(low),
+                                           None if high is None else float(high))))
+            else:
+                raise ValueError(f"Unknown facet '{field}'")
+        return tuple(sorted(normalized))
+
+    def mask(self, filters):
+        """
+        Boolean mask over ordinals of the documents that pass `filters`
+        (normalized or not), or None when there is nothing to filter.
+        """
+        filters = self.normalize_filters(dict(filters)) if filters else ()
+        if not filters:
+            return None
+        allowed = None
+        for field, value in filters:
+            field_mask = np.zeros(self.N, dtype=bool)
+            if field in CATEGORICAL_FACETS:
+                for item in value:
+                    code = self._code_of[field].get(item)
+                    if code is not None:
+                        field_mask[self.postings[field][code]] = True
+            elif field == STOCK_FACET:
+                field_mask[self.stock_postings[value]] = True
+            else:
+                low, high = value
+                sorted_values = self._sorted_values[field]
+                start = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+                if high is None:
+                    # Los NaN están al final y no pasan un filtro de rango
+                    end = np.searchsorted(sorted_values, np.inf, side="right")
+                else:
+                    end = np.searchsorted(sorted_values, high, side="right")
+                field_mask[self._sorted_order[field][start:end]] = True
+            allowed = field_mask if allowed is None else allowed & field_mask
+        return allowed
+
+    def counts(self, ords, top=10):
+        """
+        Facet counts over the documents `ords` (e.g. every match of a query):
+        {"total": len(ords),
+         field: [(value, count), ...] top values by count,
+         "out_of_stock": {False: n, True: n},
+         numeric field: {"min": v, "max": v} or None}.
+        """
+        ords = np.asarray(ords, dtype=np.int64)
+        result = {"total": len(ords)}
+        for field in CATEGORICAL_FACETS:
+            field_counts = np.bincount(self.codes[field][ords] + 1, minlength=len(self.vocab[field]) + 1)[1:]
+            nonzero = np.flatnonzero(field_counts)
+            best = nonzero[np.lexsort((nonzero, -field_counts[nonzero]))][:top]
+            result[field] = [(self.vocab[field][code], int(field_counts[code])) for code in best]
+        out = int(np.count_nonzero(self.out_of_stock[ords]))
+        result[STOCK_FACET] = {False: len(ords) - out, True: out}
+        for field in NUMERIC_FACETS:
+            values = self.numeric[field][ords]
+            values = values[~np.isnan(values)]
+            result[field] = {"min": float(values.min()), "max": float(values.max())} if len(values) else None
+        return result
@@ -0,0 +1,99 @@
+import numpy as np
+
+from myapp.search.document_store import DocumentStore
+
+PRIOR_NAMES = ("rating", "discount", "in_stock", "price_bucket")
+PRICE_BUCKETS = 5
+
+# Pesos de your_score: BM25 normalizado + priors estáticos.
+# Con estos valores es la fórmula original 0.8 * Norm(BM25) + 0.2 * Norm(Rating)
+DEFAULT_YOUR_SCORE_WEIGHTS = {"bm25": 0.8, "rating": 0.2}
+
+
+def validate_weights(weights):
+    """Check the names of a your_score weight dict and return a copy."""
+    unknown = set(weights) - {"bm25", *PRIOR_NAMES}
+    if unknown:
+        raise ValueError(f"Unknown your_score weights: {sorted(unknown)}. "
+                         f"Available: bm25, {', '.join(PRIOR_NAMES)}")
+    return {name: float(w) for name, w in weights.items()}
+
+
+class FeatureStore:
+    """
+    Static per-document priors, computed once per index and aligned with
+    the index ordinals (priors[name][ordinal]). All of them are in [0, 1]:
+
+    - rating: average_rating / 5 (0 if missing)
+    - discount: discount % / 100 (0 if missing)
+    - in_stock: 1 if the product is in stock
+    - price_bucket: price quantile bucket over the corpus, 0 = cheapest
+      (0 if missing); a negative weight favours cheaper products
+    """
+
+    def __init__(self, priors):
+        self.priors = priors
+
+    def __len__(self):
+        return len(self.priors["rating"])
+
+    @classmethod
+    def from_corpus(cls, corpus, doc_ids, price_buckets=PRICE_BUCKETS):
+        """
+        :param corpus: DocumentStore (columns are read directly) or {pid: Document}
+        :param doc_ids: ordinal -> pid of the index
+        """
+        if isinstance(corpus, DocumentStore):
+            if corpus.pids == list(doc_ids):
+                # Caso normal: el índice (o su snapshot) se construyó con este corpus
+                rows = slice(None)
+            else:
+                rows = np.fromiter((corpus.row(pid) for pid in doc_ids), dtype=np.int64, count=len(doc_ids))
+            rating = corpus.column("average_rating")[rows]
+            discount = corpus.column("discount")[rows]
+            out_of_stock = corpus.column("out_of_stock")[rows]
+            price = corpus.column("selling_price")[rows]
+        else:
+            docs = [corpus[pid] for pid in doc_ids]
+            rating = _float_column(doc.average_rating for doc in docs)
+            discount = _float_column(doc.discount for doc in docs)
+            out_of_stock = np.array([bool(doc.out_of_stock) for doc in docs], dtype=bool)
+            price = _float_column(doc.selling_price for doc in docs)
+
+        priors = {
+            "rating": np.nan_to_num(rating, nan=0.0) / 5.0,
+            "discount": np.clip(np.nan_to_num(discount, nan=0.0) / 100.0, 0.0, 1.0),
+            "in_stock": (~out_of_stock).astype(np.float64),
+            "price_bucket": _price_buckets(price, price_buckets),
+        }
+        return cls(priors)
+
+    def fuse(self, ords, bm25_scores, weights):
+        """
+        your_score of the candidates in one vectorized pass:
+        w_bm25 * bm25 / max(bm25) + sum(w_p * prior_p[ords]).
+        """
+        max_bm25 = bm25_scores.max() if len(bm25_scores) else 1.0
+        if max_bm25 == 0:
+            max_bm25 = 1.0
+        scores = weights.get("bm25", 0.0) * (bm25_scores / max_bm25)
+        for name in PRIOR_NAMES:
+            weight = weights.get(name, 0.0)
+            if weight:
+                scores += weight * self.priors[name][ords]
+        return scores
+
+
+def _float_column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _price_buckets(price, n_buckets):
+    """Quantile bucket of each price scaled to [0, 1]; missing prices get 0."""
+    known = ~np.isnan(price)
+    buckets = np.zeros(len(price), dtype=np.float64)
+    if n_buckets < 2 or not known.any():
+        return buckets
+    edges = np.quantile(price[known], np.linspace(0, 1, n_buckets + 1)[1:-1])
+    buckets[known] = np.searchsorted(edges, price[known], side="left") / (n_buckets - 1)
+    return buckets
@@ -0,0 +1,103 @@
+import io
+import json
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+
+# Constante de RRF (Cormack et al.): amortigua el peso de las primeras posiciones
+RRF_K = 60
+HYBRID_FUSIONS = ("rrf", "weighted")
+
+
+def reciprocal_rank_fusion(rankings, weights, rrf_k=RRF_K):
+    """
+    RRF of several rankings: score(d) = sum_i w_i / (rrf_k + rank_i(d)),
+    with rank starting at 1 and documents missing from a ranking adding 0.
+    :param rankings: list of ordinal arrays, best first
+    :param weights: one weight per ranking
+    Returns (ordinals, fused scores), unsorted.
+    """
+    contributions = [weight / (rrf_k + np.arange(1, len(ords) + 1, dtype=np.float64))
+                     for ords, weight in zip(rankings, weights)]
+    return _sum_by_ordinal(rankings, contributions)
+
+
+def weighted_score_fusion(rankings, weights):
+    """
+    Weighted sum of min-max normalized scores: score(d) = sum_i w_i * norm_i(d).
+    :param rankings: list of (ordinals, scores) pairs
+    Returns (ordinals, fused scores), unsorted.
+    """
+    contributions = []
+    for (_, scores), weight in zip(rankings, weights):
+        scores = np.asarray(scores, dtype=np.float64)
+        if not len(scores):
+            contributions.append(scores)
+            continue
+        low, high = scores.min(), scores.max()
+        normalized = (scores - low) / (high - low) if high > low else np.ones(len(scores))
+        contributions.append(weight * normalized)
+    return _sum_by_ordinal([ords for ords, _ in rankings], contributions)
+
+
+def _sum_by_ordinal(rankings, contributions):
+    """Suma las contribuciones de cada ordinal entre rankings (un solo bincount)."""
+    ords = np.concatenate([np.asarray(r, dtype=np.int64) for r in rankings]) if rankings else np.zeros(0, np.int64)
+    if not len(ords):
+        return ords, np.zeros(0, dtype=np.float64)
+    unique, inverse = np.unique(ords, return_inverse=True)
+    return unique, np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(unique))
+
+
+def benchmark_hybrid(engine, corpus, queries, k=20, repeat=3, mode="and"):
+    """
+    Latency per query (ms: mean, p50, p95) of bm25, word2vec and hybrid,
+    with the hybrid retrievers run concurrently and one after the other.
+    The result cache is cleared before every query. Also reports the p50
+    latency hybrid adds over bm25.
+    """
+    def run(algorithm):
+        times = []
+        with redirect_stdout(io.StringIO()): # search() imprime cada query
+            for _ in range(repeat):
+                for query in queries:
+                    engine.result_cache.clear()
+                    start = time.perf_counter()
+                    engine.search(query, 0, corpus, algorithm=algorithm, mode=mode, k=k)
+                    times.append((time.perf_counter() - start) * 1000)
+        times = np.array(times)
+        return {"mean_ms": round(float(times.mean()), 3),
+                "p50_ms": round(float(np.percentile(times, 50)), 3),
+                "p95_ms": round(float(np.percentile(times, 95)), 3)}
+
+    parallel = engine.hybrid_parallel
+    results = {"queries": len(queries), "k": k, "fusion": engine.hybrid_fusion,
+               "bm25": run("bm25"), "word2vec": run("word2vec")}
+    try:
+        engine.hybrid_parallel = True
+        results["hybrid"] = run("hybrid")
+        engine.hybrid_parallel = False
+        results["hybrid_sequential"] = run("hybrid")
+    finally:
+        engine.hybrid_parallel = parallel
+    results["hybrid_overhead_p50_ms"] = round(results["hybrid"]["p50_ms"] - results["bm25"]["p50_ms"], 3)
+    return results
+
+
+if __name__ == "__main__":
+    # python -m myapp.search.hybrid data/fashion_products_dataset.json [n_queries]
+    from myapp.search.load_corpus import load_corpus
+    from myapp.search.search_engine import SearchEngine
+
+    corpus = load_corpus(sys.argv[1])
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    # word2vec / hybrid necesitan el índice denso, que es opcional
+    engine = SearchEngine(dense=True)
+    engine.create_index(corpus)
+    # Títulos de productos al azar como queries
+    rng = np.random.default_rng(0)
+    titles = corpus.column("title")
+    queries = [titles[i] for i in rng.choice(len(titles), min(n_queries, len(titles)), replace=False)]
+    print(json.dumps(benchmark_hybrid(engine, corpus, queries, mode="or"), indent=2))
@@ -1,15 +1,109 @@
+import json
+import sys
+import time
+import tracemalloc
+
 import pandas as pd
+from pydantic import TypeAdapter
 
+from myapp.search.document_store import DocumentStore
 from myapp.search.objects import Document
-from typing import List, Dict
+from typing import Dict, Iterator, List, Mapping
+
+
+READ_CHUNK_SIZE = 1 << 20 # bytes leídos del fichero en cada paso
+BATCH_SIZE = 1000 # documentos validados de una vez
+
+_documents_adapter = TypeAdapter(List[Document])
+_decoder = json.JSONDecoder()
 
 
-def load_corpus(path) -> List[Document]:
+def load_corpus(path, batch_size=BATCH_SIZE) -> Mapping[str, Document]:
     """
-    Load file and transform to dictionary with each document as an object for easier treatment when needed for displaying
+    Load file and transform to a mapping with each document as an object for easier treatment when needed for displaying
      in results, stats, etc.
+    The file is parsed incrementally (JSON array or JSON Lines) and validated
+    in batches, so the raw records are never all in memory at once; the
+    documents are kept in a columnar DocumentStore.
     :param path:
-    :return:
+    :return: DocumentStore ({pid: Document}, in file order)
+    """
+    return DocumentStore.from_documents(iter_document_batches(path, batch_size))
+
+
+def iter_document_batches(path, batch_size=BATCH_SIZE) -> Iterator[List[Document]]:
+    """
+    Yield lists of up to `batch_size` validated Documents, in file order.
+    """
+    batch = []
+    for record in iter_json_records(path):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield _documents_adapter.validate_python(batch)
+            batch = []
+    if batch:
+        yield _documents_adapter.validate_python(batch)
+
+
+def iter_json_records(path, chunk_size=READ_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Yield the objects of a JSON array file ("[{...}, {...}]") or of a JSON
+    Lines file ("{...}\\n{...}\\n") one at a time, reading `chunk_size`
+    characters at a time.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        pos = 0
+        eof = not buffer
+        in_array = None
+
+        while True:
+            # Saltar separadores entre objetos
+            n = len(buffer)
+            while pos < n and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == n:
+                if eof:
+                    break
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+
+            char = buffer[pos]
+            if in_array is None:
+                # El primer carácter decide el formato
+                in_array = char == '['
+                if in_array:
+                    pos += 1
+                    continue
+            if char == ']' and in_array:
+                break
+
+            try:
+                record, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Objeto cortado al final del bloque: leemos más y reintentamos
+                more = f.read(chunk_size)
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            if end == len(buffer) and not eof:
+                # Un número al final del bloque puede estar incompleto
+                more = f.read(chunk_size)
+                eof = not more
+                if more:
+                    buffer, pos = buffer[pos:] + more, 0
+                    continue
+            yield record
+            pos = end
+
+
+def load_corpus_pandas(path) -> Dict[str, Document]:
+    """
+    Previous loader (pd.read_json + iterrows), kept as the baseline for
+    benchmark_loaders.
     """
     df = pd.read_json(path)
     corpus = _build_corpus(df)
@@ -27,3 +121,39 @@ def _build_corpus(df: pd.DataFrame) -> Dict[str, Document]:
         corpus[doc.pid] = doc
     return corpus
 
+
+def benchmark_loaders(path, repeat=3):
+    """
+    Wall-clock time (best of `repeat`) and peak traced memory of the
+    streaming loader (DocumentStore) vs the pandas one (dict of Documents).
+    Returns {loader_name: {"seconds", "peak_mb", "retained_mb", "documents"}},
+    where retained_mb is the memory still held by the loaded corpus.
+    """
+    results = {}
+    for name, loader in (("pandas", load_corpus_pandas), ("streaming", load_corpus)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            corpus = loader(path)
+            best = min(best, time.perf_counter() - start)
+            del corpus
+
+        # La memoria se mide en una pasada aparte: tracemalloc ralentiza la carga
+        tracemalloc.start()
+        corpus = loader(path)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            "seconds": round(best, 3),
+            "peak_mb": round(peak / 2**20, 1),
+            "retained_mb": round(retained / 2**20, 1),
+            "documents": len(corpus),
+        }
+        del corpus
+    return results
+
+
+if __name__ == "__main__":
+    # python -m myapp.search.load_corpus data/fashion_products_dataset.json
+    print(json.dumps(benchmark_loaders(sys.argv[1]), indent=2))
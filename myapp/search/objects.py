@@ -114,4 +114,23 @@ class ResultItem(BaseModel):
         return self.model_dump_json(indent=2)
     
     def to_json(self):
-        return self.model_dump_json()
\ No newline at end of file
+        return self.model_dump_json()
+
+
+class SearchPage(BaseModel):
+    """
+    One page of a ranking: results[offset:offset + limit].
+    total is the number of ranked documents when known (None if the
+    ranking was cut at the cursor depth and there may be more).
+    """
+    results: List[ResultItem]
+    offset: int
+    limit: int
+    total: Optional[int] = None
+    has_more: bool = False
+
+    def __str__(self) -> str:
+        return self.model_dump_json(indent=2)
+
+    def to_json(self):
+        return self.model_dump_json()
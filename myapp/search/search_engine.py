@@ -1,101 +1,289 @@
-from myapp.search.objects import ResultItem
-from myapp.search.algorithms import create_index_part3, find_candidate_docs, rank_documents_bm25
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from myapp.core.cache import LRUCache
+from myapp.core.metrics import REGISTRY
+from myapp.search.dense import ANN_MIN_DOCS, DEFAULT_NPROBE, DENSE_DIM, DenseIndex, dense_available
+from myapp.search.facets import FacetIndex
+from myapp.search.hybrid import HYBRID_FUSIONS, RRF_K, reciprocal_rank_fusion, weighted_score_fusion
+from myapp.search.features import DEFAULT_YOUR_SCORE_WEIGHTS, FeatureStore, validate_weights
+from myapp.search.objects import ResultItem, SearchPage
+from myapp.search.snapshot import SnapshotError, file_hash, config_hash, save_snapshot, load_snapshot
+from myapp.search.algorithms import (
+    DEFAULT_ANALYZER, analysis_cache_info, analyzer_config, analyze_query, get_analyzer,
+    create_indexes, find_candidate_docs, find_candidate_docs_filtered, rank_documents_bm25,
+    compute_length_norm, rank_documents_bm25_vectorized,
+    compute_term_upper_bounds, rank_documents_bm25_topk, top_k_tuples, select_top_k,
+    DEFAULT_FIELD_WEIGHTS, validate_field_weights, compute_field_norm,
+    find_candidate_docs_bm25f, rank_documents_bm25f,
+    build_tfidf_matrix, compute_tfidf_norms, rank_documents_tfidf, rank_documents_tfidf_csr,
+)
+
+# Métricas de /metrics: tiempo total por algoritmo y por etapa del pipeline
+SEARCH_SECONDS = REGISTRY.histogram(
+    "search_request_seconds", "SearchEngine.search_page latency by algorithm", ("algorithm",)
+)
+SEARCH_STAGE_SECONDS = REGISTRY.histogram(
+    "search_stage_seconds",
+    "Time per search stage: analyze, filter, rank (cursor misses), candidates, score, fusion, format",
+    ("stage",)
+)
+SEARCH_CURSOR_CACHE = REGISTRY.counter(
+    "search_cursor_cache_total", "Ranking cursor lookups: hit, miss or extend (deeper page)", ("result",)
+)
 
 class SearchEngine:
     """
     Orchestrator class. Holds the state (index) and calls algorithms.
     """
 
-    def __init__(self):
+    def __init__(self, vectorized=True, analyzer=DEFAULT_ANALYZER,
+                 result_cache_size=1024, result_cache_ttl=300, your_score_weights=None,
+                 cursor_depth=100, max_results=1000, field_weights=None,
+                 dense=False, ann_min_docs=ANN_MIN_DOCS, ann_nprobe=DEFAULT_NPROBE,
+                 hybrid_fusion="rrf", hybrid_weights=None, hybrid_depth=200, hybrid_parallel=True):
+        # vectorized=False usa el BM25 y el TF-IDF de referencia en Python puro
+        self.vectorized = vectorized
+        # Mismo analizador para indexar y para las queries ('nltk' o 'regex')
+        self.analyzer = get_analyzer(analyzer).name
         self.index = {}
         self.df = {}
-        self.doc_lengths = {}
+        self.doc_lengths = []
+        self.doc_ids = [] # ordinal -> pid
         self.avg_doc_length = 0
+        self.length_norm = None # K1 * (1 - B + B * len/avg) por ordinal
+        self.max_scores = {} # cota superior BM25 por término (MaxScore)
+        # TF-IDF: matriz CSR documento-término (indptr, indices, data, term_ids) y normas L2 por ordinal
+        self.tfidf_matrix = None
+        self.tfidf_norms = None
+        # Índice por campos para BM25F: campo -> (index, longitudes por ordinal)
+        self.field_index = {}
+        self.field_norm = {} # campo -> 1 - B + B * len_f / avg_f por ordinal
+        # p.ej. {"title": 2.0, "description": 1.0, "brand": 1.5}; solo se indexan los campos con peso
+        self.field_weights = validate_field_weights(
+            DEFAULT_FIELD_WEIGHTS if field_weights is None else field_weights
+        )
+        # Índice denso (word2vec): opcional (entrenarlo alarga la indexación),
+        # solo si dense=True y gensim está instalado
+        self.dense_enabled = dense and dense_available()
+        self.dense = None
+        self.ann_min_docs = ann_min_docs # a partir de aquí se construye el IVF (ANN)
+        self.ann_nprobe = ann_nprobe
+        # Híbrido BM25 + word2vec: 'rrf' (reciprocal rank fusion) o 'weighted' (scores normalizados)
+        if hybrid_fusion not in HYBRID_FUSIONS:
+            raise ValueError(f"Unknown hybrid fusion '{hybrid_fusion}'. Available: {', '.join(HYBRID_FUSIONS)}")
+        self.hybrid_fusion = hybrid_fusion
+        self.hybrid_weights = dict(hybrid_weights or {"bm25": 0.5, "word2vec": 0.5})
+        if set(self.hybrid_weights) - {"bm25", "word2vec"}:
+            raise ValueError("hybrid_weights only accepts 'bm25' and 'word2vec'")
+        # Candidatos de cada lado antes de fusionar. Es fijo (no depende de k): la lista
+        # fusionada es el ranking híbrido completo y todas las páginas salen de ella
+        self.hybrid_depth = hybrid_depth
+        self.hybrid_parallel = hybrid_parallel
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search")
         self.N = 0
         self.is_indexed = False
+        # Cambia cada vez que se (re)carga el índice; invalida la caché de resultados
+        self.index_version = 0
+        # Cursores por query: (términos, algoritmo, modo, filtros, ajustes, versión) ->
+        # (profundidad, ordinales, scores). Solo ids y scores, nunca ResultItems
+        self.result_cache = LRUCache(result_cache_size, result_cache_ttl)
+        # Primer corte del ranking; se dobla cuando se pide una página más allá
+        self.cursor_depth = cursor_depth
+        # Límite de offset + limit (paginación profunda)
+        self.max_results = max_results
+        # Priors estáticos por ordinal (rating, descuento, stock, precio) para your_score
+        self.features = None
+        # Índices de facetas (marca, categoría, stock, rangos de precio...) por ordinal
+        self.facets = None
+        self._features_key = None
+        # filtros normalizados -> máscara de ordinales permitidos
+        self._filter_masks = LRUCache(256)
+        # p.ej. {"bm25": 0.7, "rating": 0.2, "in_stock": 0.1}; ver myapp/search/features.py
+        self.your_score_weights = validate_weights(your_score_weights or DEFAULT_YOUR_SCORE_WEIGHTS)
 
-    def create_index(self, corpus: dict):
+    def create_index(self, corpus: dict, workers=1):
+        """
+        Build the index from the corpus.
+        :param workers: number of processes used to tokenize the corpus
+        """
         print("SearchEngine: Indexing corpus...")
         self.N = len(corpus)
-        self.index, self.df, self.doc_lengths = create_index_part3(corpus)
+        # Índice principal y BM25F en una sola pasada de análisis. Con el índice
+        # denso se guardan los términos de cada documento para entrenar
+        # word2vec sin volver a tokenizar el corpus
+        (self.index, self.df, self.doc_lengths, self.doc_ids, self.field_index,
+         token_lists) = create_indexes(corpus, self.field_weights, workers=workers, analyzer=self.analyzer,
+                                       keep_tokens=self.dense_enabled)
         
         if self.N > 0:
-            self.avg_doc_length = sum(self.doc_lengths.values()) / self.N
+            self.avg_doc_length = sum(self.doc_lengths) / self.N
         else:
             self.avg_doc_length = 0
+        self.length_norm = compute_length_norm(self.doc_lengths, self.avg_doc_length)
+        self.max_scores = compute_term_upper_bounds(self.index, self.df, self.N, self.length_norm)
+        self._compute_tfidf()
+        self._compute_field_norms()
+        if self.dense_enabled:
+            self.dense = DenseIndex.build(corpus, self.analyzer, ann_min_docs=self.ann_min_docs,
+                                          token_lists=token_lists)
             
         self.is_indexed = True
+        self._bump_index_version()
+        self.build_features(corpus)
         print(f"SearchEngine: Index created for {self.N} documents.")
 
-    def search(self, search_query, search_id, corpus, algorithm="bm25"):
+    def _compute_tfidf(self):
+        self.tfidf_matrix = build_tfidf_matrix(self.index, self.df, self.N, len(self.doc_ids))
+        self.tfidf_norms = compute_tfidf_norms(self.tfidf_matrix)
+
+    def _compute_field_norms(self):
+        self.field_norm = {field: compute_field_norm(lengths) for field, (_, lengths) in self.field_index.items()}
+
+    def _ranking_settings(self):
+        """
+        Ajustes del ranking que pueden cambiar sin reindexar (pesos, fusión...);
+        forman parte de las claves de la caché de resultados.
+        """
+        return (self.vectorized, tuple(sorted(self.your_score_weights.items())),
+                tuple(sorted(self.field_weights.items())), self.hybrid_fusion,
+                tuple(sorted(self.hybrid_weights.items())), self.hybrid_depth, self.ann_nprobe)
+
+    def _bump_index_version(self):
+        self.index_version += 1
+        self.result_cache.clear()
+
+    def algorithms(self):
+        """Algorithms this engine can run ('word2vec' needs the dense index)."""
+        names = ["bm25", "bm25f", "tfidf", "your_score"]
+        if self.dense is not None or (self.dense_enabled and not self.is_indexed):
+            names.extend(["word2vec", "hybrid"])
+        return names
+
+    def cache_stats(self):
+        """Hit/miss counters of the search caches."""
+        return {"analysis": analysis_cache_info(), "results": self.result_cache.stats()}
+
+    def _snapshot_metadata(self, dataset_path):
+        return {
+            "dataset_hash": file_hash(dataset_path),
+            "analyzer": self.analyzer,
+            "analyzer_config": config_hash(analyzer_config(self.analyzer)),
+            "fields": sorted(self.field_weights),
+            "dense": {"model": "word2vec", "dim": DENSE_DIM, "ann_min_docs": self.ann_min_docs}
+                     if self.dense_enabled else None,
+        }
+
+    def save_index(self, snapshot_path, dataset_path):
+        """Persist the index to a binary snapshot tied to the dataset file."""
+        save_snapshot(
+            snapshot_path,
+            self.index,
+            self.doc_lengths,
+            self.doc_ids,
+            self.avg_doc_length,
+            self.max_scores,
+            self._snapshot_metadata(dataset_path),
+            fields=self.field_index,
+            dense=self.dense.to_arrays() if self.dense is not None else None,
+        )
+        print(f"SearchEngine: Index snapshot saved to {snapshot_path}.")
+
+    def load_index(self, snapshot_path, dataset_path):
+        """
+        Memory-map a snapshot written by save_index.
+        Raises SnapshotError if it is missing, corrupt, or was built from a
+        different dataset file or analyzer configuration. With dense=True the
+        snapshot must hold a matching dense index; otherwise a dense index in
+        the snapshot is loaded too (word2vec / hybrid become available).
+        """
+        if not os.path.exists(snapshot_path):
+            raise SnapshotError(f"{snapshot_path} does not exist")
+        expected_metadata = self._snapshot_metadata(dataset_path)
+        if not self.dense_enabled:
+            # Sin dense=True vale cualquier snapshot: si trae el índice denso se
+            # carga igualmente (memmap, no cuesta nada) en lugar de reconstruirlo
+            del expected_metadata["dense"]
+        (self.index, self.df, self.doc_lengths, self.doc_ids,
+         self.avg_doc_length, self.max_scores, self.field_index, dense, _) = load_snapshot(
+            snapshot_path, expected_metadata=expected_metadata
+        )
+        self.dense = DenseIndex.from_arrays(*dense) if dense is not None else None
+        self.N = len(self.doc_ids)
+        self.length_norm = compute_length_norm(self.doc_lengths, self.avg_doc_length)
+        self._compute_tfidf()
+        self._compute_field_norms()
+        self.is_indexed = True
+        self._bump_index_version()
+        print(f"SearchEngine: Index loaded from {snapshot_path} ({self.N} documents).")
+
+    def load_or_create_index(self, corpus: dict, dataset_path, snapshot_path, workers=1):
+        """
+        Load the index snapshot if it matches the dataset and analyzer;
+        otherwise rebuild it from the corpus and write a fresh snapshot.
+        """
+        try:
+            self.load_index(snapshot_path, dataset_path)
+            if self.N == len(corpus):
+                self.build_features(corpus)
+                return
+            print("SearchEngine: Snapshot does not match the loaded corpus.")
+        except SnapshotError as e:
+            print(f"SearchEngine: Snapshot not usable ({e}), rebuilding index.")
+
+        self.create_index(corpus, workers=workers)
+        try:
+            self.save_index(snapshot_path, dataset_path)
+        except OSError as e:
+            print(f"SearchEngine: Could not save index snapshot: {e}")
+
+    def search(self, search_query, search_id, corpus, algorithm="bm25", mode="and", k=20, filters=None):
         """
         Main search method.
-        :param algorithm: 'bm25' or 'your_score'
+        :param algorithm: 'bm25', 'bm25f' (multi-field, see field_weights), 'tfidf' (cosine), 'your_score',
+            'word2vec' (dense) or 'hybrid' (bm25 + word2vec, see hybrid_fusion); see algorithms()
+        :param mode: 'and' (all query terms) or 'or' (any query term)
+        :param k: number of results to return
+        :param filters: facet filters applied before scoring, e.g.
+            {"brand": ["Nike"], "out_of_stock": False, "selling_price": (None, 50)}
+            (see FacetIndex)
+        """
+        return self.search_page(search_query, search_id, corpus, algorithm=algorithm, mode=mode,
+                                offset=0, limit=k, filters=filters).results
+
+    def search_page(self, search_query, search_id, corpus, algorithm="bm25", mode="and",
+                    offset=0, limit=20, filters=None) -> SearchPage:
+        """
+        Results [offset, offset + limit) of the ranking.
+
+        The ranking of each query is kept for a while as a cursor of
+        ordinals and scores, cut at cursor_depth; later pages slice it and
+        only build the ResultItems of the page. A page past the cut ranks
+        again with twice the depth. offset + limit is capped at max_results.
         """
         print(f"SearchEngine: Searching for '{search_query}' using [{algorithm}]")
 
         if not self.is_indexed:
             self.create_index(corpus)
+        started = time.perf_counter()
 
-        # 1. Filtrar (AND)
-        candidate_docs = find_candidate_docs(search_query, self.index)
-        
-        if not candidate_docs:
-            return []
-
-        # 2. Ranking Base (BM25)
-        # Calculamos siempre BM25 primero porque YourScore lo necesita como base
-        ranked_tuples = rank_documents_bm25(
-            search_query, 
-            candidate_docs, 
-            self.index, 
-            self.df, 
-            self.N, 
-            self.doc_lengths, 
-            self.avg_doc_length
-        )
+        offset = max(0, min(int(offset), self.max_results))
+        limit = max(0, min(int(limit), self.max_results - offset))
 
-        # 3. Aplicar Algoritmo Seleccionado
-        final_ranking = []
-        
-        if algorithm == "your_score":
-            # --- Lógica de Your Score (Híbrido) ---
-            # Formula: Score = 0.8 * Norm(BM25) + 0.2 * Norm(Rating)
-            
-            # Convertir tuplas a dict para acceso rápido
-            scores_bm25 = dict(ranked_tuples)
-            
-            # Encontrar max score para normalizar
-            max_bm25 = ranked_tuples[0][1] if ranked_tuples else 1
-            if max_bm25 == 0: max_bm25 = 1
-            
-            hybrid_scores = {}
-            
-            for doc_id, bm25_score in ranked_tuples:
-                # Recuperar rating del corpus (objeto Document)
-                doc_obj = corpus[doc_id]
-                rating = doc_obj.average_rating if doc_obj.average_rating else 0
-                
-                # Normalizar
-                norm_bm25 = bm25_score / max_bm25
-                norm_rating = rating / 5.0 # Rating maximo es 5
-                
-                # Calcular Score Híbrido
-                # Puedes ajustar los pesos aquí (0.8 / 0.2)
-                final_score = (0.8 * norm_bm25) + (0.2 * norm_rating)
-                hybrid_scores[doc_id] = final_score
-            
-            # Reordenar por nuevo score
-            final_ranking = sorted(hybrid_scores.items(), key=lambda x: x[1], reverse=True)
-            
-        else:
-            # Si es BM25, usamos el resultado directo
-            final_ranking = ranked_tuples
+        # 0. Analizar la query una sola vez para todo el pipeline
+        query_terms = analyze_query(search_query, self.analyzer)
+        filters = FacetIndex.normalize_filters(filters)
+        SEARCH_STAGE_SECONDS.observe(time.perf_counter() - started, "analyze")
+        ords, scores, complete = self._cursor(query_terms, corpus, algorithm, mode, filters, offset + limit)
 
-        # 4. Formatear resultados (ResultItem)
+        # 4. Formatear resultados (ResultItem), solo los de la página
+        format_started = time.perf_counter()
         results = []
-        for doc_id, score in final_ranking[:20]: # Top 20
-            doc_original = corpus[doc_id]
+        for doc_ord, score in zip(ords[offset:offset + limit].tolist(), scores[offset:offset + limit].tolist()):
+            doc_original = corpus[self.doc_ids[doc_ord]]
             
             result = ResultItem(
                 pid=doc_original.pid,
@@ -112,4 +300,276 @@ class SearchEngine:
             )
             results.append(result)
 
-        return results
\ No newline at end of file
+        finished = time.perf_counter()
+        SEARCH_STAGE_SECONDS.observe(finished - format_started, "format")
+        SEARCH_SECONDS.observe(finished - started, algorithm)
+
+        end = offset + limit
+        has_more = (end < len(ords) or not complete) and end < self.max_results
+        return SearchPage(results=results, offset=offset, limit=limit,
+                          total=len(ords) if complete else None, has_more=has_more)
+
+    def _cursor(self, query_terms, corpus, algorithm, mode, filters, needed):
+        """
+        (ordinales, scores, completo) del ranking de la query con al menos
+        `needed` posiciones (o todas si hay menos). completo = no hay más
+        documentos que los del cursor.
+        """
+        # La caché guarda solo ordinales y scores: los datos de la petición
+        # (search_id, offset) se aplican después, así las entradas se comparten
+        cache_key = (query_terms, algorithm, mode, filters, self._ranking_settings(), self.index_version)
+        cursor = self.result_cache.get(cache_key)
+        if cursor is not None:
+            depth, ords, scores = cursor
+            complete = len(ords) < depth
+            if complete or needed <= depth:
+                SEARCH_CURSOR_CACHE.inc("hit")
+                return ords, scores, complete
+            SEARCH_CURSOR_CACHE.inc("extend")
+            depth = max(needed, 2 * depth)
+        else:
+            SEARCH_CURSOR_CACHE.inc("miss")
+            depth = max(needed, self.cursor_depth)
+        depth = min(depth, self.max_results + 1) # +1: saber si hay más allá del límite
+
+        started = time.perf_counter()
+        allowed = self._filter_mask(corpus, filters)
+        ranking_started = time.perf_counter()
+        SEARCH_STAGE_SECONDS.observe(ranking_started - started, "filter")
+        ords, scores = self._rank(query_terms, corpus, algorithm, mode, depth, allowed)
+        SEARCH_STAGE_SECONDS.observe(time.perf_counter() - ranking_started, "rank")
+        if algorithm == "hybrid":
+            # El híbrido devuelve la lista fusionada entera: el cursor ya está completo
+            depth = len(ords) + 1
+        self.result_cache.put(cache_key, (depth, ords, scores))
+        return ords, scores, len(ords) < depth
+
+    def facet_counts(self, search_query, corpus, mode="and", filters=None, top=10, algorithm="bm25"):
+        """
+        Facet counts (see FacetIndex.counts) over every document that
+        matches the query and the filters, not only the top-k.
+        With algorithm='bm25f' a document matches if the terms appear in
+        any of the weighted fields; with 'word2vec' / 'hybrid' every document
+        with a vector matches if the query has one.
+        """
+        if not self.is_indexed:
+            self.create_index(corpus)
+        query_terms = analyze_query(search_query, self.analyzer)
+        filters = FacetIndex.normalize_filters(filters)
+
+        # bm25 y your_score comparten los documentos que cumplen la query
+        matching = {"bm25f": "fields", "word2vec": "dense", "hybrid": "dense"}.get(algorithm, "terms")
+        cache_key = ("facets", query_terms, mode, filters, top, matching, self._ranking_settings(),
+                     self.index_version)
+        counts = self.result_cache.get(cache_key)
+        if counts is None:
+            allowed = self._filter_mask(corpus, filters)
+            if matching == "fields":
+                ords, _ = find_candidate_docs_bm25f(query_terms, self._bm25f_fields(), mode, allowed)
+            elif matching == "dense":
+                matched = self.dense.has_vector
+                if self.dense.encode(query_terms) is None:
+                    matched = np.zeros(self.N, dtype=bool)
+                ords = np.flatnonzero(matched if allowed is None else matched & allowed)
+            else:
+                ords = self._matching_docs(query_terms, mode, allowed)
+            counts = self._features_for(corpus)[1].counts(ords, top)
+            self.result_cache.put(cache_key, counts)
+        return counts
+
+    def _filter_mask(self, corpus, filters):
+        """Máscara booleana por ordinal de los filtros normalizados (None = sin filtros)."""
+        if not filters:
+            return None
+        key = (filters, self.index_version)
+        allowed = self._filter_masks.get(key)
+        if allowed is None:
+            allowed = self._features_for(corpus)[1].mask(filters)
+            self._filter_masks.put(key, allowed)
+        return allowed
+
+    def _matching_docs(self, query_terms, mode, allowed=None):
+        """Array de ordinales que cumplen la query (AND / OR) y los filtros."""
+        if mode == "or":
+            matched = np.zeros(self.N, dtype=bool)
+            for term in set(query_terms):
+                if term in self.index:
+                    matched[np.asarray(self.index[term][0], dtype=np.int64)] = True
+            if allowed is not None:
+                matched &= allowed
+            return np.flatnonzero(matched)
+        if allowed is not None:
+            return find_candidate_docs_filtered(query_terms, self.index, allowed)
+        return np.asarray(find_candidate_docs(query_terms, self.index, mode=mode), dtype=np.int64)
+
+    def _rank(self, query_terms, corpus, algorithm, mode, k, allowed=None):
+        """Devuelve el ranking final (top-k) del algoritmo como arrays (ordinales, scores)."""
+        # 1 + 2. Filtrar (AND / OR + facetas) y Ranking Base (BM25)
+        # Calculamos siempre BM25 primero porque YourScore lo necesita como base.
+        # Con BM25 puro basta con el top-k; YourScore necesita todos los candidatos.
+        if algorithm == "bm25f":
+            return self._rank_bm25f(query_terms, mode, k, allowed)
+        if algorithm == "tfidf":
+            return self._rank_tfidf(query_terms, mode, k, allowed)
+        if algorithm in ("word2vec", "hybrid") and self.dense is None:
+            if not dense_available():
+                raise ValueError(f"{algorithm} needs the dense index, which needs gensim (pip install gensim)")
+            raise ValueError(f"{algorithm} needs the dense index, which is disabled: "
+                             f"create the SearchEngine with dense=True (DENSE_INDEX=1 in the web app)")
+        if algorithm == "word2vec":
+            # Recuperación densa: todo el catálogo (filtros aparte), sin exigir los términos
+            return self.dense.search(query_terms, k, allowed, nprobe=self.ann_nprobe)
+        if algorithm == "hybrid":
+            return self._rank_hybrid(query_terms, mode, allowed)
+        if algorithm != "your_score":
+            # Si es BM25, usamos el resultado directo
+            return self._rank_bm25_arrays(query_terms, mode, k=k, allowed=allowed)
+
+        ords, scores = self._rank_bm25_arrays(query_terms, mode, allowed=allowed)
+        if not len(ords):
+            return ords, scores
+
+        # 3. Your Score (Híbrido): w_bm25 * Norm(BM25) + suma de w_p * prior_p,
+        # con los priors estáticos precalculados al indexar (FeatureStore)
+        with SEARCH_STAGE_SECONDS.time("fusion"):
+            features, _ = self._features_for(corpus)
+            hybrid_scores = features.fuse(ords, scores, self.your_score_weights)
+
+            # Reordenar por nuevo score (solo el top-k)
+            return select_top_k(ords, hybrid_scores, k)
+
+    def build_features(self, corpus):
+        """
+        Compute the per-document data of the indexed documents: static
+        priors (FeatureStore) and facet indexes (FacetIndex).
+        """
+        self.features = FeatureStore.from_corpus(corpus, self.doc_ids)
+        self.facets = FacetIndex.from_corpus(corpus, self.doc_ids)
+        self._filter_masks.clear()
+        self._features_key = (id(corpus), self.index_version)
+
+    def _features_for(self, corpus):
+        """(FeatureStore, FacetIndex), recalculados si cambia el índice o el corpus."""
+        if self.features is None or self._features_key != (id(corpus), self.index_version):
+            self.build_features(corpus)
+        return self.features, self.facets
+
+    def _bm25f_fields(self):
+        """campo -> (index, norm, peso) de los campos con peso (el resto no se lee)."""
+        return {field: (self.field_index[field][0], self.field_norm[field], weight)
+                for field, weight in self.field_weights.items() if field in self.field_index}
+
+    def _rank_bm25f(self, query_terms, mode, k, allowed=None):
+        """Top-k BM25F (ordinales, scores) sobre los campos del índice multi-campo."""
+        fields = self._bm25f_fields()
+        docs_to_rank, dfs = find_candidate_docs_bm25f(query_terms, fields, mode, allowed)
+        ords, scores = rank_documents_bm25f(query_terms, fields, self.N, docs_to_rank, dfs)
+        return select_top_k(ords, scores, k)
+
+    def _rank_tfidf(self, query_terms, mode, k, allowed=None):
+        """Top-k coseno TF-IDF (ordinales, scores) de los documentos que cumplen la query."""
+        if not self.vectorized:
+            docs_to_rank = find_candidate_docs(query_terms, self.index, mode=mode)
+            if allowed is not None:
+                docs_to_rank = [doc_ord for doc_ord in docs_to_rank if allowed[doc_ord]]
+            ranked = top_k_tuples(rank_documents_tfidf(
+                query_terms, docs_to_rank, self.index, self.df, self.N, self.tfidf_norms
+            ), k)
+            ords = np.fromiter((doc_ord for doc_ord, _ in ranked), dtype=np.int64, count=len(ranked))
+            scores = np.fromiter((score for _, score in ranked), dtype=np.float64, count=len(ranked))
+            return ords, scores
+
+        docs_to_rank = self._matching_docs(query_terms, mode, allowed)
+        ords, scores = rank_documents_tfidf_csr(query_terms, docs_to_rank, self.tfidf_matrix,
+                                                self.tfidf_norms, self.df, self.N, self.index)
+        return select_top_k(ords, scores, k)
+
+    def _rank_hybrid(self, query_terms, mode, allowed=None):
+        """
+        Ranking híbrido completo: top-hybrid_depth de BM25 y de word2vec (en
+        paralelo en el pool de hilos; NumPy suelta el GIL en el producto
+        matriz-vector) fusionados con RRF o con la suma ponderada de scores
+        normalizados. La profundidad no depende de k, así que la fusión (y el
+        orden) es la misma para todas las páginas.
+        """
+        depth = self.hybrid_depth
+        if self.hybrid_parallel:
+            dense_future = self._executor.submit(self.dense.search, query_terms, depth, allowed, None, self.ann_nprobe)
+            sparse = self._rank_bm25_arrays(query_terms, mode, depth, allowed)
+            dense = dense_future.result()
+        else:
+            sparse = self._rank_bm25_arrays(query_terms, mode, depth, allowed)
+            dense = self.dense.search(query_terms, depth, allowed, nprobe=self.ann_nprobe)
+
+        weights = (self.hybrid_weights.get("bm25", 0.0), self.hybrid_weights.get("word2vec", 0.0))
+        with SEARCH_STAGE_SECONDS.time("fusion"):
+            if self.hybrid_fusion == "rrf":
+                ords, scores = reciprocal_rank_fusion([sparse[0], dense[0]], weights, RRF_K)
+            else:
+                ords, scores = weighted_score_fusion([sparse, dense], weights)
+            return select_top_k(ords, scores, len(ords))
+
+    def _rank_bm25_arrays(self, query_terms, mode, k=None, allowed=None):
+        """
+        BM25 (ordinales, scores) ordenado por score.
+        Con k se devuelve solo el top-k, sin puntuar ni ordenar todo.
+        allowed: máscara booleana por ordinal (filtros); el resto no se puntúa.
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        started = time.perf_counter()
+        if self.vectorized and mode == "or":
+            # En modo OR el scatter-add ya recorre todas las postings: no hace falta filtrar
+            docs_to_rank = None
+        elif self.vectorized and allowed is not None:
+            # Los filtros se aplican antes de puntuar (y de intersectar): menos candidatos
+            docs_to_rank = find_candidate_docs_filtered(query_terms, self.index, allowed)
+        else:
+            docs_to_rank = find_candidate_docs(query_terms, self.index, mode=mode)
+            if allowed is not None:
+                docs_to_rank = [doc_ord for doc_ord in docs_to_rank if allowed[doc_ord]]
+        scoring_started = time.perf_counter()
+        if docs_to_rank is not None:
+            SEARCH_STAGE_SECONDS.observe(scoring_started - started, "candidates")
+            if not len(docs_to_rank):
+                return empty
+
+        if not self.vectorized:
+            ranked = rank_documents_bm25(
+                query_terms, 
+                docs_to_rank, 
+                self.index, 
+                self.df, 
+                self.N, 
+                self.doc_lengths, 
+                self.avg_doc_length
+            )
+            if k is not None:
+                ranked = top_k_tuples(ranked, k)
+            ords = np.fromiter((doc_ord for doc_ord, _ in ranked), dtype=np.int64, count=len(ranked))
+            scores = np.fromiter((score for _, score in ranked), dtype=np.float64, count=len(ranked))
+        elif k is None:
+            ords, scores = rank_documents_bm25_vectorized(
+                query_terms,
+                self.index,
+                self.df,
+                self.N,
+                self.length_norm,
+                docs_to_rank
+            )
+            if allowed is not None and docs_to_rank is None:
+                keep = allowed[ords]
+                ords, scores = ords[keep], scores[keep]
+        else:
+            ords, scores = rank_documents_bm25_topk(
+                query_terms,
+                self.index,
+                self.df,
+                self.N,
+                self.length_norm,
+                self.max_scores,
+                k,
+                docs_to_rank,
+                allowed
+            )
+        SEARCH_STAGE_SECONDS.observe(time.perf_counter() - scoring_started, "score")
+        return ords, scores
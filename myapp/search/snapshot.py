@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# Formato del snapshot del índice (little-endian):
+#   [magic 8B][versión uint32][longitud cabecera uint32][cabecera JSON][padding]
+#   [payload: secciones binarias alineadas a 8 bytes]
+# La cabecera guarda los metadatos (hash del dataset, analizador, offsets de
+# cada sección) y el CRC32 del payload. Las secciones numéricas se leen con
+# np.memmap, así que cargar el índice no copia las posting lists a memoria.
+# Desde la versión 2 el snapshot incluye también el índice por campos (BM25F):
+# por cada campo, sus longitudes y posting lists con el mismo formato.
+# Si hay índice denso (word2vec), sus matrices float32 van en secciones
+# "dense:*" con su forma, y también se leen con memmap.
+
+SNAPSHOT_MAGIC = b"IRWAIDX\0"
+SNAPSHOT_VERSION = 2
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 8
+
+
+class SnapshotError(Exception):
+    """El snapshot no existe, está corrupto o no corresponde al dataset actual."""
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 del fichero del dataset, leído por bloques."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def config_hash(config):
+    """Hash estable de una configuración serializable a JSON."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _padding(n):
+    return (-n) % _ALIGN
+
+
+def _postings_sections(index, prefix=""):
+    """Secciones (offsets por término, ordinales, TF) de un índice invertido."""
+    terms = sorted(index)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+    for i, term in enumerate(terms):
+        term_offsets[i + 1] = term_offsets[i] + len(index[term][0])
+    sections = {
+        prefix + "term_offsets": term_offsets,
+        prefix + "postings_ords": np.concatenate(
+            [np.asarray(index[t][0], dtype=np.uint32) for t in terms]
+        ) if terms else np.zeros(0, dtype=np.uint32),
+        prefix + "postings_tfs": np.concatenate(
+            [np.asarray(index[t][1], dtype=np.uint32) for t in terms]
+        ) if terms else np.zeros(0, dtype=np.uint32),
+    }
+    return terms, sections
+
+
+def _postings_from_sections(terms, section, prefix=""):
+    """Índice {término: (ordinales, TF)} con vistas sobre el fichero mapeado."""
+    term_offsets = section(prefix + "term_offsets").tolist()
+    postings_ords = section(prefix + "postings_ords")
+    postings_tfs = section(prefix + "postings_tfs")
+    index = {}
+    for i, term in enumerate(terms):
+        start, end = term_offsets[i], term_offsets[i + 1]
+        # Vistas sobre el fichero mapeado: no se copian las posting lists
+        index[term] = (postings_ords[start:end], postings_tfs[start:end])
+    return index
+
+
+def save_snapshot(path, index, doc_lengths, doc_ids, avg_doc_length, max_scores, metadata, fields=None,
+                  dense=None):
+    """
+    Serializa el índice a `path`. Se escribe a un fichero temporal y se
+    renombra al final, para que otro proceso nunca lea un snapshot a medias.
+    fields: índice por campos {campo: (index, field_lengths)} (BM25F), opcional.
+    dense: (términos, {nombre: array}) del índice denso (DenseIndex.to_arrays), opcional.
+    """
+    terms, sections = _postings_sections(index)
+    sections["doc_lengths"] = np.asarray(doc_lengths, dtype=np.uint32)
+    sections["max_scores"] = np.asarray([max_scores[t] for t in terms], dtype=np.float64)
+
+    field_terms = {}
+    for field, (field_index, field_lengths) in (fields or {}).items():
+        field_terms[field], field_sections = _postings_sections(field_index, prefix=f"field:{field}:")
+        sections.update(field_sections)
+        sections[f"field:{field}:lengths"] = np.asarray(field_lengths, dtype=np.uint32)
+
+    dense_terms = None
+    if dense is not None:
+        dense_terms, dense_arrays = dense
+        sections.update({f"dense:{name}": arr for name, arr in dense_arrays.items()})
+
+    strings = json.dumps({"terms": terms, "doc_ids": list(doc_ids), "field_terms": field_terms,
+                          "dense_terms": dense_terms}).encode("utf-8")
+
+    payload_layout = {}
+    blobs = []
+    offset = 0
+    for name, arr in sections.items():
+        data = np.ascontiguousarray(arr).astype(arr.dtype.newbyteorder("<"), copy=False).tobytes()
+        payload_layout[name] = {"offset": offset, "count": arr.size, "shape": list(arr.shape),
+                                "dtype": arr.dtype.newbyteorder("<").str}
+        blobs.append(data + b"\0" * _padding(len(data)))
+        offset += len(data) + _padding(len(data))
+    payload_layout["strings"] = {"offset": offset, "nbytes": len(strings)}
+    blobs.append(strings)
+
+    crc = 0
+    for blob in blobs:
+        crc = zlib.crc32(blob, crc)
+
+    header = dict(metadata)
+    header.update({
+        "N": len(doc_ids),
+        "avg_doc_length": avg_doc_length,
+        "sections": payload_layout,
+        "crc32": crc,
+    })
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * _padding(_PREFIX.size + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot_header(path):
+    """Lee y valida solo la cabecera (sin tocar el payload)."""
+    try:
+        with open(path, "rb") as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) != _PREFIX.size:
+                raise SnapshotError("snapshot truncado")
+            magic, version, header_len = _PREFIX.unpack(prefix)
+            if magic != SNAPSHOT_MAGIC:
+                raise SnapshotError("no es un snapshot de índice")
+            if version != SNAPSHOT_VERSION:
+                raise SnapshotError(f"versión de snapshot {version} no soportada")
+            header = json.loads(f.read(header_len).decode("utf-8"))
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"no se puede leer el snapshot: {e}")
+    header["payload_offset"] = _PREFIX.size + header_len
+    return header
+
+
+def load_snapshot(path, expected_metadata=None, verify=True):
+    """
+    Carga el snapshot con np.memmap. Si `expected_metadata` no coincide con la
+    cabecera (otro dataset u otro analizador) se lanza SnapshotError.
+    Devuelve (index, df, doc_lengths, doc_ids, avg_doc_length, max_scores, fields, dense, header),
+    con fields = {campo: (index, field_lengths)} (vacío si no se guardó) y
+    dense = (términos, {nombre: array}) o None.
+    """
+    header = read_snapshot_header(path)
+    for key, value in (expected_metadata or {}).items():
+        if header.get(key) != value:
+            raise SnapshotError(f"el snapshot no corresponde a la configuración actual ({key})")
+
+    payload = np.memmap(path, dtype=np.uint8, mode="r", offset=header["payload_offset"])
+    if verify and zlib.crc32(payload) != header["crc32"]:
+        raise SnapshotError("checksum del snapshot incorrecto")
+
+    layout = header["sections"]
+
+    def section(name):
+        info = layout[name]
+        dtype = np.dtype(info["dtype"])
+        start = info["offset"]
+        data = payload[start:start + info["count"] * dtype.itemsize].view(dtype)
+        return data.reshape(info.get("shape", [info["count"]]))
+
+    strings_info = layout["strings"]
+    strings = json.loads(bytes(
+        payload[strings_info["offset"]:strings_info["offset"] + strings_info["nbytes"]]
+    ).decode("utf-8"))
+    terms = strings["terms"]
+    doc_ids = strings["doc_ids"]
+
+    doc_lengths = section("doc_lengths")
+    index = _postings_from_sections(terms, section)
+    max_score_values = section("max_scores").tolist()
+
+    df = {}
+    max_scores = {}
+    for i, term in enumerate(terms):
+        df[term] = len(index[term][0])
+        max_scores[term] = max_score_values[i]
+
+    fields = {
+        field: (_postings_from_sections(field_terms, section, prefix=f"field:{field}:"),
+                section(f"field:{field}:lengths"))
+        for field, field_terms in strings.get("field_terms", {}).items()
+    }
+
+    dense = None
+    if strings.get("dense_terms") is not None:
+        dense = (strings["dense_terms"],
+                 {name[len("dense:"):]: section(name) for name in layout if name.startswith("dense:")})
+
+    return index, df, doc_lengths, doc_ids, header["avg_doc_length"], max_scores, fields, dense, header
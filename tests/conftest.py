@@ -0,0 +1,65 @@
+import json
+import random
+
+import pytest
+
+from myapp.search.load_corpus import load_corpus
+from myapp.search.search_engine import SearchEngine
+
+WORDS = ("shirt cotton men women kurta jeans slim fit blue black red printed casual formal round neck "
+         "sleeve solid dress top saree silk denim jacket hoodie track pants shorts linen polo collar "
+         "striped checked regular comfortable soft fabric stretch party wear ethnic").split()
+BRANDS = ("Nike", "Puma", "Reebok", "ARBO", "Roadster", "")
+SUB_CATEGORIES = ("Topwear", "Bottomwear", "Winter Wear", "Innerwear")
+
+
+def make_catalog(n=800, seed=0):
+    """Registros con el formato de fashion_products_dataset.json (precios y rating como texto)."""
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        title = " ".join(rng.choices(WORDS, k=rng.randint(3, 8))).title()
+        description = " ".join(rng.choices(WORDS, k=rng.randint(0, 40)))
+        if i % 7 == 0:
+            description += " 100% cotton. Don't wash!"
+        actual_price = rng.randint(300, 3000)
+        records.append({
+            "_id": f"id{i}", "pid": f"P{i:06d}", "title": title, "description": description,
+            "brand": rng.choice(BRANDS), "category": rng.choice(("Clothing and Accessories", "Footwear")),
+            "sub_category": rng.choice(SUB_CATEGORIES),
+            "product_details": [{"Fabric": rng.choice(("Cotton", "Linen", "Silk"))},
+                                {"Pattern": rng.choice(("Solid", "Printed"))}],
+            "seller": rng.choice(("RetailNet", "SandSMarketing", "Vyom")),
+            "out_of_stock": rng.random() < 0.1,
+            "selling_price": f"{int(actual_price * 0.7):,}", "discount": f"{rng.randint(0, 70)}% off",
+            "actual_price": f"{actual_price:,}",
+            "average_rating": rng.choice(("", "3.9", "4.2", "2.5", "5")),
+            "url": f"https://example.com/p/{i}", "images": [f"https://img/{i}.jpg"],
+            "crawled_at": "2021-02-10 20:11:51",
+        })
+    return records
+
+
+@pytest.fixture(scope="session")
+def catalog():
+    return make_catalog()
+
+
+@pytest.fixture(scope="session")
+def catalog_path(tmp_path_factory, catalog):
+    path = tmp_path_factory.mktemp("data") / "catalog.json"
+    path.write_text(json.dumps(catalog), encoding="utf-8")
+    return path
+
+
+@pytest.fixture(scope="session")
+def corpus(catalog_path):
+    return load_corpus(catalog_path)
+
+
+@pytest.fixture(scope="session")
+def engine(corpus):
+    """Motor indexado (sin índice denso) compartido por los tests que solo leen."""
+    search_engine = SearchEngine(dense=False)
+    search_engine.create_index(corpus)
+    return search_engine
@@ -0,0 +1,52 @@
+import pytest
+
+from myapp.analytics.analytics_data import AnalyticsData
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def analytics(tmp_path, request):
+    data = AnalyticsData(db_file=str(tmp_path / "analytics_db.json"), log_file=str(tmp_path / "events.jsonl"),
+                         backend=request.param, sqlite_path=str(tmp_path / "analytics.sqlite3"),
+                         flush_interval=60)
+    yield data
+    data.close()
+
+
+def _count_flushes(analytics, monkeypatch):
+    calls = []
+    flush = analytics.flush
+    monkeypatch.setattr(analytics, "flush", lambda *args, **kwargs: (calls.append(1), flush(*args, **kwargs))[1])
+    return calls
+
+
+def test_dashboard_aggregates_read_after_a_single_flush(analytics, monkeypatch):
+    analytics.register_session("s1", "127.0.0.1", {})
+    analytics.save_query_terms("cotton shirt", "s1")
+    analytics.update_click("P1")
+    flushes = _count_flushes(analytics, monkeypatch)
+
+    # Lo que hace /dashboard
+    analytics.flush()
+    assert analytics.top_clicked_docs(flush=False) == [("P1", 1)]
+    assert analytics.plot_number_of_views(flush=False) is not None
+    assert analytics.plot_queries_per_session(flush=False) is not None
+    assert analytics.plot_queries_over_time(flush=False) is not None
+    assert len(flushes) == 1
+
+    # Por defecto cada accesor sigue leyendo datos al día
+    analytics.update_click("P1")
+    assert analytics.top_clicked_docs() == [("P1", 2)]
+    assert len(flushes) == 2
+
+
+def test_chart_is_rebuilt_only_when_its_rows_change(analytics):
+    builds = []
+
+    def build(rows):
+        builds.append(rows)
+        return f"chart {len(builds)}"
+
+    assert analytics._cached_chart("views", [("P1", 1)], build) == "chart 1"
+    assert analytics._cached_chart("views", [("P1", 1)], build) == "chart 1"
+    assert analytics._cached_chart("views", [("P1", 2)], build) == "chart 2"
+    assert len(builds) == 2
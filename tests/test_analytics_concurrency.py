@@ -0,0 +1,63 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from myapp.analytics.analytics_data import AnalyticsData
+
+PROCESSES, THREADS, QUERIES = 4, 8, 100
+
+
+def _open(directory, backend, **options):
+    return AnalyticsData(db_file=str(directory / "analytics_db.json"), log_file=str(directory / "events.jsonl"),
+                         backend=backend, sqlite_path=str(directory / "analytics.sqlite3"), **options)
+
+
+def _worker(directory, backend, worker, results):
+    # Buffers, compactaciones y bloques de ids pequeños para que los procesos se crucen a menudo
+    analytics = _open(directory, backend, flush_size=17, flush_interval=0.01, compact_every=250, id_block_size=10)
+    query_ids = []
+
+    def run(thread):
+        session_id = f"s{worker}-{thread}"
+        analytics.register_session(session_id, "127.0.0.1", {})
+        for i in range(QUERIES):
+            query_ids.append(analytics.save_query_terms("cotton shirt", session_id))
+            analytics.update_click(f"doc{i % 7}")
+
+    threads = [threading.Thread(target=run, args=(thread,)) for thread in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    analytics.close()
+    results.put(query_ids)
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_workers_sharing_the_store_lose_no_events(tmp_path, backend):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(tmp_path, backend, worker, results))
+                 for worker in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    query_ids = [query_id for _ in processes for query_id in results.get(timeout=120)]
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    total = PROCESSES * THREADS * QUERIES
+    assert len(query_ids) == total
+    assert len(set(query_ids)) == total
+
+    analytics = _open(tmp_path, backend)
+    try:
+        assert sum(count for _, count in analytics.top_clicked_docs()) == total
+        sessions = dict(analytics.session_query_counts())
+        assert len(sessions) == PROCESSES * THREADS
+        assert set(sessions.values()) == {QUERIES}
+        if backend == "json":
+            assert sorted(query["id"] for query in analytics.fact_queries) == sorted(query_ids)
+    finally:
+        analytics.close()
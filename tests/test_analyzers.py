@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from myapp.search.algorithms import NltkAnalyzer, RegexAnalyzer, build_terms
+from tests.conftest import WORDS
+
+# Textos de catálogo con la puntuación que separa a los dos tokenizers
+# (comillas, clíticos, abreviaturas, tallas y medidas pegadas a letras)
+CATALOG_TEXTS = [
+    "'premium'x5",
+    "Size:M5.5 shirt",
+    "Men's slim fit t-shirt (pack of 2).",
+    "Women's 'Classic' kurta - don't bleach; wash with like colours.",
+    "100% cotton. Approx. size: 38\". Fit's true to size!",
+    "Rs. 499 only... Hurry!!",
+    "Roadster men's' jeans.'",
+    "o'neil 'n' co. \"super-soft\" hoodie (XL/XXL)",
+    "Can't shrink? Cannot fade - gonna last, wanna buy",
+    "Pack of 3 {socks} [free size] <unisex> #bestseller @ARBO $10 & more",
+    "«Premium» “linen” ‘shirt’ „blend“ shorts.",
+    "e.g. polo, i.e. collar; etc. Mr. Rao's pick.",
+    "Details:\n'Fabric':Cotton\n'Pattern':'Solid'",
+]
+
+
+@pytest.fixture(scope="module")
+def analyzers():
+    return NltkAnalyzer(), RegexAnalyzer()
+
+
+@pytest.mark.parametrize("text", CATALOG_TEXTS)
+def test_regex_analyzer_matches_nltk_on_punctuation(analyzers, text):
+    nltk_analyzer, regex_analyzer = analyzers
+    assert regex_analyzer.analyze(text) == nltk_analyzer.analyze(text)
+
+
+def test_regex_analyzer_matches_nltk_on_catalog(analyzers, catalog):
+    nltk_analyzer, regex_analyzer = analyzers
+    for product in catalog:
+        for text in (product["title"], product["description"]):
+            assert regex_analyzer.analyze(text) == nltk_analyzer.analyze(text), text
+
+
+def test_regex_analyzer_matches_nltk_on_random_punctuation(analyzers):
+    nltk_analyzer, regex_analyzer = analyzers
+    pieces = list(WORDS) + ["x", "s", "men's", "can't", "cannot", "wanna", "e.g", "approx.", "5.5",
+                            "'", "''", '"', ".", "..", ",", ":", ";", "!", "?", "(", ")", "[", "]",
+                            "*", "-", "--", "&", "#", "%", "`", "«", "»", "“", "”", "‘", "’",
+                            "'s", "n't", "'ll", "'d", " ", " ", " ", "\n"]
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = "".join(rng.choices(pieces, k=rng.randint(1, 20)))
+        assert regex_analyzer.analyze(text) == nltk_analyzer.analyze(text), text
+
+
+def test_regex_analyzer_version_is_part_of_the_config():
+    # Un snapshot construido con reglas anteriores no debe reutilizarse
+    assert RegexAnalyzer().config()["version"] == RegexAnalyzer.version
+    assert "version" not in NltkAnalyzer().config()
+
+
+def test_build_terms_is_the_default_analyzer(analyzers):
+    nltk_analyzer, _ = analyzers
+    for text in CATALOG_TEXTS + [None]:
+        assert build_terms(text) == nltk_analyzer.analyze(text)
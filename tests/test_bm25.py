@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from myapp.search.algorithms import (
+    analyze_query, find_candidate_docs, rank_documents_bm25, rank_documents_bm25_topk,
+    rank_documents_bm25_vectorized,
+)
+
+QUERIES = ["cotton shirt", "shirt shirt cotton", "slim fit blue jeans", "women silk saree party wear",
+           "don't wash", "hoodie zzz", "soft", "men"]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("mode", ["and", "or"])
+def test_vectorized_bm25_is_bit_exact(engine, query, mode):
+    query_terms = analyze_query(query, engine.analyzer)
+    docs_to_rank = find_candidate_docs(query_terms, engine.index, mode=mode)
+    reference = rank_documents_bm25(query_terms, docs_to_rank, engine.index, engine.df, engine.N,
+                                    engine.doc_lengths, engine.avg_doc_length)
+
+    # Con candidatos (AND / OR explícito) y sin ellos (OR sobre todas las postings)
+    candidate_sets = [np.asarray(docs_to_rank, dtype=np.int64)] + ([None] if mode == "or" else [])
+    for candidates in candidate_sets:
+        ords, scores = rank_documents_bm25_vectorized(query_terms, engine.index, engine.df, engine.N,
+                                                      engine.length_norm, candidates)
+        assert ords.tolist() == [doc_ord for doc_ord, _ in reference]
+        # Igualdad exacta de floats, no aproximada
+        assert scores.tolist() == [score for _, score in reference]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("k", [1, 10, 50, 10_000])
+def test_maxscore_top_k_equals_full_sort(engine, query, k):
+    query_terms = analyze_query(query, engine.analyzer)
+    args = (query_terms, engine.index, engine.df, engine.N, engine.length_norm)
+    # Filtro por facetas: la mitad de los documentos
+    allowed = np.arange(engine.N) % 2 == 0
+
+    ords, scores = rank_documents_bm25_vectorized(*args)
+    top_ords, top_scores = rank_documents_bm25_topk(*args, engine.max_scores, k)
+    assert top_ords.tolist() == ords[:k].tolist()
+    assert top_scores.tolist() == scores[:k].tolist()
+
+    keep = allowed[ords]
+    top_ords, top_scores = rank_documents_bm25_topk(*args, engine.max_scores, k, allowed=allowed)
+    assert top_ords.tolist() == ords[keep][:k].tolist()
+    assert top_scores.tolist() == scores[keep][:k].tolist()
+
+    docs_to_rank = np.asarray(find_candidate_docs(query_terms, engine.index), dtype=np.int64)
+    ords, scores = rank_documents_bm25_vectorized(*args, docs_to_rank)
+    top_ords, top_scores = rank_documents_bm25_topk(*args, engine.max_scores, k, docs_to_rank)
+    assert top_ords.tolist() == ords[:k].tolist()
+    assert top_scores.tolist() == scores[:k].tolist()
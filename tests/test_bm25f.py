@@ -0,0 +1,86 @@
+import collections
+import math
+from array import array
+
+import numpy as np
+import pytest
+
+from myapp.search.algorithms import (
+    BM25_B, BM25_K1, analyze_query, compute_field_norm, field_contents, find_candidate_docs_bm25f,
+    get_analyzer, rank_documents_bm25f,
+)
+
+QUERIES = ["cotton shirt", "shirt shirt cotton", "nike slim fit jeans", "footwear", "linen printed",
+           "don't wash", "hoodie zzz"]
+
+
+def _postings(pairs):
+    return array('I', [doc_ord for doc_ord, _ in pairs]), array('I', [tf for _, tf in pairs])
+
+
+def test_bm25f_matches_hand_computed_scores():
+    # 3 documentos; title (peso 2) con longitudes 2, 1, 3 y description (peso 1) de 4 términos
+    title = {"shirt": _postings([(0, 1), (1, 1)])}
+    description = {"shirt": _postings([(1, 2)]), "cotton": _postings([(0, 1), (2, 1)])}
+    fields = {
+        "title": (title, compute_field_norm(array('I', [2, 1, 3])), 2.0),
+        "description": (description, compute_field_norm(array('I', [4, 4, 4])), 1.0),
+    }
+    # norm del título = 1 - 0.75 + 0.75 * len / 2 -> [1.0, 0.625, 1.375]
+    np.testing.assert_allclose(fields["title"][1], [1.0, 0.625, 1.375])
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5)) # df = 2 en ambos términos
+
+    docs, dfs = find_candidate_docs_bm25f(["shirt"], fields, "or")
+    ords, scores = rank_documents_bm25f(["shirt"], fields, 3, docs, dfs)
+    # doc 0: tf~ = 2 * 1 / 1.0 = 2;  doc 1: tf~ = 2 * 1 / 0.625 + 1 * 2 / 1 = 5.2
+    assert ords.tolist() == [0, 1]
+    np.testing.assert_allclose(scores, [idf * 2 * 2.2 / 3.2, idf * 5.2 * 2.2 / 6.4])
+
+    docs, dfs = find_candidate_docs_bm25f(["shirt", "cotton"], fields, "and")
+    ords, scores = rank_documents_bm25f(["shirt", "cotton"], fields, 3, docs, dfs)
+    # Solo el doc 0 tiene los dos; cotton: tf~ = 1 -> idf * 1 * 2.2 / 2.2
+    assert ords.tolist() == [0]
+    np.testing.assert_allclose(scores, [idf * 2 * 2.2 / 3.2 + idf])
+
+
+@pytest.fixture(scope="module")
+def field_terms(corpus, engine):
+    """Por campo con peso, el Counter de términos de cada documento (por ordinal)."""
+    analyze = get_analyzer(engine.analyzer).analyze
+    return {field: [collections.Counter(analyze(text)) for text in field_contents(corpus, field)]
+            for field in engine.field_weights}
+
+
+def _reference_bm25f(query_terms, field_terms, weights, mode):
+    """BM25F término a término, directamente sobre el texto de cada campo."""
+    n_docs = len(next(iter(field_terms.values())))
+    avg = {field: sum(sum(c.values()) for c in counts) / n_docs for field, counts in field_terms.items()}
+    df = {term: sum(any(term in field_terms[f][d] for f in field_terms) for d in range(n_docs))
+          for term in set(query_terms)}
+    ranking = []
+    for d in range(n_docs):
+        present = [term for term in set(query_terms) if any(term in field_terms[f][d] for f in field_terms)]
+        if not present or mode == "and" and len(present) < len(set(query_terms)):
+            continue
+        score = 0.0
+        for term in query_terms:
+            tf = 0.0
+            for field, counts in field_terms.items():
+                length = sum(counts[d].values())
+                tf += weights[field] * counts[d][term] / (1 - BM25_B + BM25_B * length / avg[field])
+            if tf > 0:
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+        ranking.append((d, score))
+    return sorted(ranking, key=lambda pair: (-pair[1], pair[0]))
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("mode", ["and", "or"])
+def test_vectorized_bm25f_matches_a_reference_implementation(engine, corpus, field_terms, query, mode):
+    query_terms = analyze_query(query, engine.analyzer)
+    reference = _reference_bm25f(query_terms, field_terms, engine.field_weights, mode)
+
+    page = engine.search_page(query, 0, corpus, algorithm="bm25f", mode=mode, limit=1000)
+    assert [item.pid for item in page.results] == [engine.doc_ids[d] for d, _ in reference]
+    assert [item.ranking for item in page.results] == pytest.approx([score for _, score in reference], rel=1e-12)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from myapp.search.algorithms import create_index_part3, get_analyzer, index_contents
+from myapp.search.search_engine import SearchEngine
+
+pytest.importorskip("gensim")
+
+from myapp.search.dense import DenseIndex  # noqa: E402
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_index_build_keeps_the_analyzed_tokens(corpus, workers):
+    *_, token_lists = create_index_part3(corpus, workers=workers, keep_tokens=True)
+    analyze = get_analyzer().analyze
+    assert token_lists == [analyze(text) for text in index_contents(corpus)]
+
+
+def test_dense_index_is_reproducible_and_reuses_the_index_tokens(corpus):
+    *_, token_lists = create_index_part3(corpus, keep_tokens=True)
+    reused = DenseIndex.build(corpus, token_lists=token_lists)
+    analyzed = DenseIndex.build(corpus)
+    assert reused.terms == analyzed.terms
+    np.testing.assert_array_equal(reused.term_vectors, analyzed.term_vectors)
+    np.testing.assert_array_equal(reused.doc_vectors, analyzed.doc_vectors)
+
+
+def test_dense_index_is_opt_in(corpus):
+    assert "word2vec" not in SearchEngine().algorithms()
+    engine = SearchEngine(dense=True)
+    engine.create_index(corpus)
+    assert engine.dense is not None
+    assert {"word2vec", "hybrid"} <= set(engine.algorithms())
+
+
+def test_disabled_dense_index_error_says_how_to_enable_it(engine):
+    with pytest.raises(ValueError, match="disabled.*dense=True.*DENSE_INDEX=1"):
+        engine.search_page("cotton shirt", 0, None, algorithm="word2vec")
+
+
+def test_default_engine_reuses_a_dense_snapshot(tmp_path, corpus, catalog_path):
+    snapshot = tmp_path / "index.bin"
+    dense_engine = SearchEngine(dense=True)
+    dense_engine.load_or_create_index(corpus, catalog_path, snapshot)
+    written = snapshot.stat().st_mtime_ns
+
+    engine = SearchEngine()
+    engine.load_or_create_index(corpus, catalog_path, snapshot)
+    assert snapshot.stat().st_mtime_ns == written # cargado, no reconstruido
+    assert "word2vec" in engine.algorithms()
+    expected = dense_engine.search_page("cotton shirt", 0, corpus, algorithm="word2vec", limit=20)
+    got = engine.search_page("cotton shirt", 0, corpus, algorithm="word2vec", limit=20)
+    assert [item.pid for item in got.results] == [item.pid for item in expected.results]
@@ -0,0 +1,92 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from myapp.search.evaluation import (
+    average_precision_at_k, evaluate_algorithm, evaluate_ranking, ndcg_at_k, precision_at_k, recall_at_k,
+    reciprocal_rank,
+)
+
+RANKED = [1, 0, 1, 0, 0] # relevantes en las posiciones 1 y 3
+
+
+@pytest.mark.parametrize("k, expected", [(1, 1.0), (3, 2 / 3), (5, 0.4), (10, 0.2), (0, 0.0)])
+def test_precision_at_k(k, expected):
+    # Con k mayor que el ranking las posiciones que faltan cuentan como no relevantes
+    assert precision_at_k(RANKED, k) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("total, k, expected", [(4, 5, 0.5), (4, 1, 0.25), (2, 10, 1.0), (0, 5, 0.0)])
+def test_recall_at_k(total, k, expected):
+    assert recall_at_k(RANKED, total, k) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("total, k, expected", [
+    (4, 5, (1 + 2 / 3) / 4), # los relevantes que no aparecen cuentan
+    (2, 10, (1 + 2 / 3) / 2), # k mayor que el ranking: se divide por min(total, k)
+    (4, 2, 1 / 2), # solo la posición 1 entra en el top-2
+    (0, 5, 0.0), # sin relevantes
+])
+def test_average_precision_at_k(total, k, expected):
+    assert average_precision_at_k(RANKED, total, k) == pytest.approx(expected)
+    assert average_precision_at_k([0, 0, 0], total, k) == 0.0
+    assert average_precision_at_k([], total, k) == 0.0
+
+
+def test_reciprocal_rank():
+    assert reciprocal_rank([0, 0, 1, 1]) == pytest.approx(1 / 3)
+    assert reciprocal_rank([0, 0, 1], k=2) == 0.0
+    assert reciprocal_rank([]) == 0.0
+
+
+def test_ndcg_at_k():
+    dcg = 3 + 2 / math.log2(3) + 0 + 1 / math.log2(5)
+    assert ndcg_at_k([3, 2, 0, 1], 4) == pytest.approx(dcg / (3 + 2 / math.log2(3) + 1 / 2))
+    # El ideal sale de todos los juicios de la query, no solo de los recuperados
+    ideal = 3 + 3 / math.log2(3) + 2 / 2 + 1 / math.log2(5)
+    assert ndcg_at_k([3, 2, 0, 1], 4, [3, 3, 2, 1, 0]) == pytest.approx(dcg / ideal)
+    # Con k mayor que el ranking
+    assert ndcg_at_k([1], 10, [1, 1]) == pytest.approx(1 / (1 + 1 / math.log2(3)))
+    assert ndcg_at_k([3, 2], 10) == pytest.approx(1.0)
+
+
+def test_ndcg_without_relevant_documents_is_zero():
+    assert ndcg_at_k([], 5) == 0.0
+    assert ndcg_at_k([0, 0], 5) == 0.0
+    assert ndcg_at_k([0, 0], 5, []) == 0.0
+
+
+def test_evaluate_ranking():
+    judgments = {"a": 2, "c": 1, "d": 1, "e": 0}
+    metrics = evaluate_ranking(["a", "b", "c"], judgments, 5)
+    assert metrics["precision"] == pytest.approx(2 / 5)
+    assert metrics["recall"] == pytest.approx(2 / 3)
+    assert metrics["average_precision"] == pytest.approx((1 + 2 / 3) / 3)
+    assert metrics["reciprocal_rank"] == 1.0
+    assert metrics["ndcg"] == pytest.approx((2 + 1 / 2) / (2 + 1 / math.log2(3) + 1 / 2))
+
+    assert evaluate_ranking(["a", "b"], {}, 5) == {
+        "precision": 0.0, "recall": 0.0, "average_precision": 0.0, "reciprocal_rank": 0.0, "ndcg": 0.0,
+    }
+
+
+def test_evaluate_algorithm_averages_over_judged_queries():
+    rankings = {"q1": ["a", "b", "c"], "q2": ["x", "y"], "q3": ["a"]}
+    engine = SimpleNamespace(
+        result_cache=SimpleNamespace(clear=lambda: None),
+        search=lambda query, *args, **kwargs: [SimpleNamespace(pid=pid) for pid in rankings[query]],
+    )
+    queries = [
+        {"query_id": "1", "query": "q1", "judgments": {"a": 1, "c": 1}}, # AP = (1 + 2/3) / 2
+        {"query_id": "2", "query": "q2", "judgments": {"y": 1, "z": 1}}, # AP = (1/2) / 2
+        {"query_id": "3", "query": "q3", "judgments": {}}, # solo latencia
+    ]
+    report = evaluate_algorithm(engine, None, queries, "bm25", k=3)
+    quality = report["quality"]
+    assert quality["judged_queries"] == 2
+    assert quality["map"] == round(((1 + 2 / 3) / 2 + 1 / 4) / 2, 4)
+    assert quality["mrr"] == round((1 + 1 / 2) / 2, 4)
+    assert quality["precision@3"] == round((2 / 3 + 1 / 3) / 2, 4)
+    assert quality["recall@3"] == round((1 + 1 / 2) / 2, 4)
+    assert report["latency"]["max_ms"] >= 0
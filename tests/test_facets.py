@@ -0,0 +1,98 @@
+import collections
+
+import pytest
+
+from myapp.search.algorithms import analyze_query, get_analyzer, index_contents
+
+QUERY = "cotton shirt"
+
+
+@pytest.fixture(scope="module")
+def documents(corpus):
+    """(Document, términos del texto indexado) por ordinal, para filtrar a mano."""
+    analyze = get_analyzer().analyze
+    return [(corpus[pid], set(analyze(text))) for pid, text in zip(corpus, index_contents(corpus))]
+
+
+def _brute_force(documents, query, mode="and", brand=None, category=None, out_of_stock=None):
+    query_terms = set(analyze_query(query))
+    matched = []
+    for doc, terms in documents:
+        if mode == "and" and not query_terms <= terms or mode == "or" and not query_terms & terms:
+            continue
+        if brand is not None and doc.brand not in brand:
+            continue
+        if category is not None and doc.category not in category:
+            continue
+        if out_of_stock is not None and bool(doc.out_of_stock) != out_of_stock:
+            continue
+        matched.append(doc)
+    return matched
+
+
+def _all_pages(engine, corpus, query, filters, limit, algorithm="bm25", mode="and"):
+    pids, offset = [], 0
+    while True:
+        page = engine.search_page(query, 0, corpus, algorithm=algorithm, mode=mode,
+                                  offset=offset, limit=limit, filters=filters)
+        assert len(page.results) <= limit
+        pids.extend(item.pid for item in page.results)
+        if not page.has_more:
+            return pids, page
+        offset += limit
+
+
+@pytest.mark.parametrize("mode", ["and", "or"])
+def test_facet_counts_match_a_brute_force_count(engine, corpus, documents, mode):
+    matched = _brute_force(documents, QUERY, mode)
+    counts = engine.facet_counts(QUERY, corpus, mode=mode)
+
+    for field in ("brand", "category", "sub_category", "seller"):
+        expected = collections.Counter(getattr(doc, field) for doc in matched if getattr(doc, field) is not None)
+        assert dict(counts[field]) == dict(expected), field
+        assert [count for _, count in counts[field]] == sorted(expected.values(), reverse=True)
+    out = sum(bool(doc.out_of_stock) for doc in matched)
+    assert counts["out_of_stock"] == {False: len(matched) - out, True: out}
+    assert counts["total"] == len(matched)
+    prices = [doc.selling_price for doc in matched if doc.selling_price is not None]
+    assert counts["selling_price"] == {"min": min(prices), "max": max(prices)}
+
+
+@pytest.mark.parametrize("filters", [
+    {"brand": ["Nike"]},
+    {"brand": ["Nike", "Puma"]},
+    {"category": "Footwear"},
+    {"out_of_stock": True},
+    {"out_of_stock": False},
+])
+def test_filtered_search_matches_a_brute_force_filter(engine, corpus, documents, filters):
+    brand = filters.get("brand")
+    category = [filters["category"]] if "category" in filters else None
+    expected = {doc.pid for doc in _brute_force(documents, QUERY, brand=brand, category=category,
+                                                out_of_stock=filters.get("out_of_stock"))}
+    assert expected
+
+    results = engine.search_page(QUERY, 0, corpus, limit=1000, filters=filters).results
+    assert {item.pid for item in results} == expected
+    counts = engine.facet_counts(QUERY, corpus, filters=filters)
+    assert counts["total"] == len(expected)
+
+
+@pytest.mark.parametrize("algorithm", ["bm25", "bm25f", "tfidf", "your_score"])
+def test_combined_filters_page_through_every_match(engine, corpus, documents, algorithm):
+    filters = {"brand": ["Nike", "Roadster"], "category": ["Clothing and Accessories"], "out_of_stock": False}
+    mode = "or" if algorithm == "bm25f" else "and"
+    pids, last_page = _all_pages(engine, corpus, QUERY, filters, limit=7, algorithm=algorithm, mode=mode)
+    full = engine.search_page(QUERY, 0, corpus, algorithm=algorithm, mode=mode, limit=1000, filters=filters)
+
+    assert pids == [item.pid for item in full.results]
+    assert len(set(pids)) == len(pids)
+    assert len(pids) > 7 # varias páginas
+    assert last_page.total == len(pids)
+    if algorithm != "bm25f":
+        expected = _brute_force(documents, QUERY, mode, brand=filters["brand"], category=filters["category"],
+                                out_of_stock=False)
+        assert set(pids) == {doc.pid for doc in expected}
+    docs = [corpus[pid] for pid in pids]
+    assert all(doc.brand in filters["brand"] and doc.category in filters["category"] and not doc.out_of_stock
+               for doc in docs)
@@ -0,0 +1,65 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from myapp.search.hybrid import benchmark_hybrid
+from myapp.search.search_engine import SearchEngine
+
+pytest.importorskip("gensim")
+
+
+@pytest.fixture(scope="module")
+def dense_engine(corpus):
+    search_engine = SearchEngine(dense=True)
+    search_engine.create_index(corpus)
+    return search_engine
+
+
+@pytest.mark.parametrize("fusion", ["rrf", "weighted"])
+@pytest.mark.parametrize("mode", ["and", "or"])
+def test_hybrid_pages_match_a_single_deep_query(dense_engine, corpus, fusion, mode):
+    dense_engine.hybrid_fusion = fusion
+    paged, offset = [], 0
+    while True:
+        page = dense_engine.search_page("cotton shirt", 0, corpus, algorithm="hybrid", mode=mode,
+                                        offset=offset, limit=20)
+        paged.extend((item.pid, item.ranking) for item in page.results)
+        if not page.has_more:
+            break
+        offset += 20
+
+    pids = [pid for pid, _ in paged]
+    assert len(pids) > 20
+    assert len(pids) == len(set(pids))
+
+    dense_engine.result_cache.clear()
+    deep = dense_engine.search_page("cotton shirt", 0, corpus, algorithm="hybrid", mode=mode,
+                                    offset=0, limit=dense_engine.max_results)
+    assert paged == [(item.pid, item.ranking) for item in deep.results]
+
+
+def test_changed_fusion_is_not_served_from_the_cache(dense_engine, corpus):
+    rankings = {}
+    for fusion in ("rrf", "weighted", "rrf"):
+        dense_engine.hybrid_fusion = fusion
+        page = dense_engine.search_page("cotton shirt", 0, corpus, algorithm="hybrid", mode="or", limit=20)
+        rankings.setdefault(fusion, []).append([(item.pid, item.ranking) for item in page.results])
+    assert rankings["rrf"][0] == rankings["rrf"][1]
+    assert rankings["weighted"][0] != rankings["rrf"][0]
+
+
+def test_benchmark_hybrid_reports_every_retriever(dense_engine, corpus):
+    report = benchmark_hybrid(dense_engine, corpus, ["cotton shirt", "blue jeans", "silk saree"], k=10, repeat=1)
+    for name in ("bm25", "word2vec", "hybrid", "hybrid_sequential"):
+        assert report[name]["p50_ms"] >= 0
+    assert report["queries"] == 3
+    assert dense_engine.hybrid_parallel is True
+
+
+def test_hybrid_benchmark_cli_runs(catalog_path):
+    output = subprocess.run([sys.executable, "-m", "myapp.search.hybrid", str(catalog_path), "3"],
+                            capture_output=True, text=True, check=True, timeout=300).stdout
+    report = json.loads(output[output.index("{"):])
+    assert report["queries"] == 3 and "hybrid" in report
@@ -0,0 +1,53 @@
+import pytest
+
+from myapp.search.algorithms import DEFAULT_FIELD_WEIGHTS, create_field_index, create_index_part3, create_indexes
+
+
+@pytest.fixture(scope="module")
+def serial_index(corpus):
+    return create_index_part3(corpus)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_index_equals_serial_build(corpus, serial_index, workers):
+    index, df, doc_lengths, doc_ids = create_index_part3(corpus, workers=workers)
+    serial, serial_df, serial_lengths, serial_doc_ids = serial_index
+
+    assert doc_ids == serial_doc_ids
+    assert doc_lengths == serial_lengths
+    assert dict(df) == dict(serial_df)
+    # Mismos términos en el mismo orden (el id de columna de la matriz TF-IDF depende de él)
+    assert list(index) == list(serial)
+    for term, (doc_ords, tfs) in serial.items():
+        assert index[term] == (doc_ords, tfs), term
+
+
+def test_parallel_field_index_equals_serial_build(corpus):
+    serial = create_field_index(corpus, DEFAULT_FIELD_WEIGHTS)
+    parallel = create_field_index(corpus, DEFAULT_FIELD_WEIGHTS, workers=3)
+    assert list(parallel) == list(serial)
+    for field, (index, field_lengths) in serial.items():
+        assert parallel[field][1] == field_lengths, field
+        assert list(parallel[field][0]) == list(index), field
+        assert parallel[field][0] == index, field
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_single_pass_build_equals_separate_builds(corpus, serial_index, workers):
+    index, df, doc_lengths, doc_ids, field_index, token_lists = create_indexes(
+        corpus, DEFAULT_FIELD_WEIGHTS, workers=workers, keep_tokens=True)
+    serial, serial_df, serial_lengths, serial_doc_ids = serial_index
+
+    assert doc_ids == serial_doc_ids
+    assert doc_lengths == serial_lengths
+    assert dict(df) == dict(serial_df)
+    assert list(index) == list(serial)
+    assert index == serial
+    assert len(token_lists) == len(doc_ids)
+
+    fields = create_field_index(corpus, DEFAULT_FIELD_WEIGHTS)
+    assert list(field_index) == list(fields)
+    for field, (f_index, field_lengths) in fields.items():
+        assert field_index[field][1] == field_lengths, field
+        assert list(field_index[field][0]) == list(f_index), field
+        assert field_index[field][0] == f_index, field
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from myapp.search.load_corpus import iter_json_records, load_corpus, load_corpus_pandas
+
+from tests.conftest import make_catalog
+
+
+@pytest.fixture(scope="module")
+def records():
+    records = make_catalog(40, seed=1)
+    # Cadenas con separadores, escapes y caracteres no ASCII; números al final de un objeto
+    records[3]["title"] = 'Kurta "Ethnic" [Set], {Blue}\\ – ₹ 1,299 ñ 👕'
+    records[5]["product_details"] = [{"Size": "M, L ]"}, {"Care": "Don't wash\n"}]
+    records.append({"pid": "P999999", "nested": {"a": [1, 2.5, -3e2, None, True]}, "n": 12345})
+    return records
+
+
+@pytest.fixture(scope="module", params=["array", "array_pretty", "jsonl"])
+def records_path(tmp_path_factory, records, request):
+    path = tmp_path_factory.mktemp("records") / f"{request.param}.json"
+    if request.param == "array":
+        text = json.dumps(records, ensure_ascii=False)
+    elif request.param == "array_pretty":
+        text = "\n" + json.dumps(records, ensure_ascii=False, indent=2) + "\n"
+    else:
+        text = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+def test_iter_json_records_reads_every_record(records_path, records, chunk_size):
+    assert list(iter_json_records(records_path, chunk_size=chunk_size)) == records
+
+
+@pytest.mark.parametrize("text", ["", "[]", " [ ] ", "\n\n"])
+def test_iter_json_records_handles_empty_files(tmp_path, text):
+    path = tmp_path / "empty.json"
+    path.write_text(text, encoding="utf-8")
+    assert list(iter_json_records(path, chunk_size=1)) == []
+
+
+def test_iter_json_records_raises_on_a_truncated_file(tmp_path):
+    path = tmp_path / "truncated.json"
+    path.write_text(json.dumps(make_catalog(3))[:-20], encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_records(path, chunk_size=7))
+
+
+def test_load_corpus_matches_the_pandas_loader(catalog_path):
+    corpus = load_corpus(catalog_path, batch_size=64)
+    baseline = load_corpus_pandas(catalog_path)
+    assert list(corpus) == list(baseline)
+    for pid, doc in baseline.items():
+        assert corpus[pid] == doc, pid
+
+
+def test_load_corpus_reads_json_lines(tmp_path, catalog, catalog_path):
+    path = tmp_path / "catalog.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in catalog), encoding="utf-8")
+    corpus = load_corpus(path)
+    baseline = load_corpus_pandas(catalog_path)
+    assert list(corpus) == list(baseline)
+    assert all(corpus[pid] == doc for pid, doc in baseline.items())
@@ -0,0 +1,132 @@
+import importlib
+import re
+import time
+
+import pytest
+
+from myapp.core import metrics
+from myapp.core.metrics import MetricsRegistry, SlowRequestProfiler
+
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"'
+                         r'(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? -?([0-9.e+-]+|\+Inf)$')
+
+
+def test_counter_exposition_format():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests, by route", ("route", "method"))
+    requests.inc("/search", "GET")
+    requests.inc("/search", "GET", by=2)
+    requests.inc('/a"b\\c\nd', "POST")
+    registry.counter("plain_total", "Without labels").inc()
+
+    assert registry.render() == (
+        "# HELP requests_total Requests, by route\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{route="/a\\"b\\\\c\\nd",method="POST"} 1\n'
+        'requests_total{route="/search",method="GET"} 3\n'
+        "# HELP plain_total Without labels\n"
+        "# TYPE plain_total counter\n"
+        "plain_total 1\n"
+    )
+
+
+def test_histogram_exposition_format():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 0.5, 1.0))
+    for seconds in (0.05, 0.1, 0.3, 2.0):
+        latency.observe(seconds, "rank")
+
+    assert latency.snapshot("rank") == (4, pytest.approx(2.45))
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP latency_seconds Latency", "# TYPE latency_seconds histogram"]
+    # Buckets acumulados, "le" inclusivo, +Inf igual al total
+    assert lines[2:6] == [
+        'latency_seconds_bucket{stage="rank",le="0.1"} 2',
+        'latency_seconds_bucket{stage="rank",le="0.5"} 3',
+        'latency_seconds_bucket{stage="rank",le="1.0"} 3',
+        'latency_seconds_bucket{stage="rank",le="+Inf"} 4',
+    ]
+    assert re.fullmatch(r'latency_seconds_sum\{stage="rank"\} 2\.45\d*', lines[6])
+    assert lines[7] == 'latency_seconds_count{stage="rank"} 4'
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    counter = registry.counter("events_total", "Events")
+    histogram = registry.histogram("seconds", "Seconds")
+    counter.inc()
+    with histogram.time():
+        pass
+    assert counter.value() == 0
+    assert histogram.snapshot() == (0, 0.0)
+
+
+def test_metric_names_are_registered_once():
+    registry = MetricsRegistry()
+    counter = registry.counter("events_total", "Events", ("type",))
+    assert registry.counter("events_total", "Events", ("type",)) is counter
+    with pytest.raises(ValueError):
+        registry.histogram("events_total", "Events", ("type",))
+
+
+def _sleep(ms):
+    time.sleep(ms / 1000)
+    return ms
+
+
+@pytest.mark.parametrize("threshold_ms, dumped", [(1000, False), (5, True)])
+def test_profiler_dumps_only_requests_over_the_threshold(tmp_path, threshold_ms, dumped):
+    profiler = SlowRequestProfiler(threshold_ms=threshold_ms, sample_rate=1.0, output_dir=str(tmp_path / "profiles"))
+    before = {outcome: metrics.PROFILED_REQUESTS.value(outcome) for outcome in ("fast", "dumped")}
+
+    assert profiler.profiled(_sleep)(20) == 20
+    files = list((tmp_path / "profiles").glob("*__sleep_*ms.prof")) if dumped else []
+    assert len(files) == int(dumped)
+    assert (tmp_path / "profiles").exists() == dumped
+    outcome = "dumped" if dumped else "fast"
+    assert metrics.PROFILED_REQUESTS.value(outcome) == before[outcome] + 1
+
+
+def test_disabled_profiler_only_calls_through(tmp_path):
+    for profiler in (SlowRequestProfiler(threshold_ms=None, output_dir=str(tmp_path)),
+                     SlowRequestProfiler(threshold_ms=0, sample_rate=0, output_dir=str(tmp_path))):
+        assert not profiler.enabled
+        assert profiler.profiled(_sleep)(1) == 1
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory, catalog_path):
+    """Cliente de pruebas de la app, con el dataset, el índice y la analítica en un directorio temporal."""
+    workdir = tmp_path_factory.mktemp("app")
+    (workdir / "data").mkdir()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(workdir)
+        mp.setenv("DATA_FILE_PATH", str(catalog_path))
+        mp.setenv("INDEX_SNAPSHOT_PATH", str(workdir / "data" / "index_snapshot.bin"))
+        mp.setenv("RAG_CACHE_PATH", str(workdir / "data" / "rag_cache.jsonl"))
+        mp.setenv("ANALYTICS_BACKEND", "json")
+        mp.setenv("DENSE_INDEX", "0")
+        mp.setenv("METRICS_ENABLED", "1")
+        mp.delenv("GOOGLE_API_KEY", raising=False)
+        mp.delenv("PROFILE_SLOW_REQUESTS_MS", raising=False)
+        web_app = importlib.import_module("web_app")
+        yield web_app.app.test_client()
+        web_app.analytics_data.close()
+        web_app.rag_generator._executor.shutdown(wait=True)
+
+
+def test_metrics_endpoint_serves_the_prometheus_text_format(client):
+    assert client.get("/search?search-query=cotton+shirt&algorithm=bm25").status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert "version=0.0.4" in response.headers["Content-Type"]
+
+    text = response.get_data(as_text=True)
+    assert "# TYPE search_stage_seconds histogram" in text
+    assert re.search(r'^search_stage_seconds_count\{stage="rank"\} [1-9]', text, re.M)
+    assert re.search(r'^cache_stats\{cache="search_results",stat="misses"\} [1-9]', text, re.M)
+    for line in text.splitlines():
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or SAMPLE_LINE.match(line), line
@@ -0,0 +1,83 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from myapp.generation.rag import FakeGenAIClient, RAGGenerator
+
+
+def _results(n=3):
+    return [SimpleNamespace(pid=f"P{i}", title=f"Cotton shirt {i}", description="Soft cotton. Slim fit.",
+                            selling_price=499.0, actual_price=999.0, average_rating=4.2) for i in range(n)]
+
+
+def _wait(rag, job_id):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        status = rag.poll(job_id)
+        if status["status"] == "done":
+            return status
+        time.sleep(0.005)
+    pytest.fail("RAG job did not finish")
+
+
+@pytest.fixture
+def rag():
+    generator = RAGGenerator(client=FakeGenAIClient(), timeout=10)
+    yield generator
+    generator._executor.shutdown(wait=True)
+
+
+def test_submit_looks_the_cache_up_once_per_summary(rag):
+    results = _results()
+    first = _wait(rag, rag.submit("cotton shirt", results))
+    stats = rag.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["llm_calls"]) == (0, 1, 1)
+
+    second = _wait(rag, rag.submit("Cotton  shirt", results))
+    assert second["html"] == first["html"]
+    stats = rag.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["llm_calls"]) == (1, 1, 1)
+
+
+def test_generate_response_looks_the_cache_up_once(rag):
+    results = _results()
+    rag.generate_response("linen shirt", results)
+    rag.generate_response("linen shirt", results)
+    stats = rag.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["llm_calls"]) == (1, 1, 1)
+
+
+def test_llm_counters_are_exact_under_concurrency():
+    rag = RAGGenerator(client=FakeGenAIClient(error=RuntimeError("quota")), timeout=10, max_workers=8)
+    try:
+        job_ids = [rag.submit(f"query {i}", _results()) for i in range(200)]
+        for job_id in job_ids:
+            _wait(rag, job_id)
+        stats = rag.cache_stats()
+        assert (stats["llm_calls"], stats["llm_errors"], stats["misses"]) == (200, 200, 200)
+    finally:
+        rag._executor.shutdown(wait=True)
+
+
+def test_manual_summary_counts_every_match_not_just_the_page(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    rag = RAGGenerator(timeout=10)
+    try:
+        page = _results(3)
+        assert "We found 3 items" in rag.manual_summary("cotton shirt", page)
+        assert "We found 57 items" in rag.manual_summary("cotton shirt", page, total=57)
+        assert "We found 57 items" in _wait(rag, rag.submit("cotton shirt", page, total=57))["html"]
+        assert "We found 57 items" in rag.generate_response("cotton shirt", page, total=57)
+    finally:
+        rag._executor.shutdown(wait=True)
+
+
+def test_timeout_fallback_counts_every_match():
+    rag = RAGGenerator(client=FakeGenAIClient(delay=0.5), timeout=0)
+    try:
+        status = rag.poll(rag.submit("cotton shirt", _results(3), total=57))
+        assert status["fallback"]
+        assert "We found 57 items" in status["html"]
+    finally:
+        rag._executor.shutdown(wait=True)
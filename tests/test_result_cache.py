@@ -0,0 +1,47 @@
+import pytest
+
+from myapp.search.search_engine import SearchEngine
+
+QUERY = "cotton shirt"
+
+
+@pytest.fixture
+def tunable_engine(corpus):
+    """Motor propio: los tests cambian sus ajustes de ranking."""
+    search_engine = SearchEngine()
+    search_engine.create_index(corpus)
+    return search_engine
+
+
+def _ranking(engine, corpus, algorithm, **kwargs):
+    page = engine.search_page(QUERY, 0, corpus, algorithm=algorithm, mode="or", limit=50, **kwargs)
+    return [(item.pid, item.ranking) for item in page.results]
+
+
+@pytest.mark.parametrize("algorithm, setting, value", [
+    ("your_score", "your_score_weights", {"bm25": 0.5, "in_stock": 0.3, "discount": 0.2}),
+    ("bm25f", "field_weights", {"title": 1.0, "description": 3.0}),
+])
+def test_changed_weights_are_not_served_from_the_cache(tunable_engine, corpus, algorithm, setting, value):
+    before = _ranking(tunable_engine, corpus, algorithm)
+    setattr(tunable_engine, setting, value)
+    after = _ranking(tunable_engine, corpus, algorithm)
+    assert after != before
+
+    tunable_engine.result_cache.clear()
+    assert _ranking(tunable_engine, corpus, algorithm) == after
+
+
+@pytest.mark.parametrize("algorithm", ["bm25", "tfidf"])
+def test_switching_the_reference_implementation_misses_the_cache(tunable_engine, corpus, algorithm):
+    vectorized = _ranking(tunable_engine, corpus, algorithm)
+    misses = tunable_engine.result_cache.stats()["misses"]
+
+    tunable_engine.vectorized = False
+    assert _ranking(tunable_engine, corpus, algorithm) == pytest.approx(vectorized)
+    assert tunable_engine.result_cache.stats()["misses"] == misses + 1
+
+    # Con los ajustes de antes vuelve a servirse de la caché
+    tunable_engine.vectorized = True
+    assert _ranking(tunable_engine, corpus, algorithm) == vectorized
+    assert tunable_engine.result_cache.stats()["misses"] == misses + 1
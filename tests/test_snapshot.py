@@ -0,0 +1,104 @@
+import pytest
+
+from myapp.search.dense import dense_available
+from myapp.search.search_engine import SearchEngine
+from myapp.search.snapshot import SnapshotError, load_snapshot
+
+QUERIES = ["cotton shirt", "slim fit jeans", "women kurta", "silk denim jacket"]
+
+
+def _rankings(engine, corpus, algorithms):
+    return {
+        (algorithm, query): [(item.pid, pytest.approx(item.ranking)) for item in
+                             engine.search_page(query, 0, corpus, algorithm=algorithm, mode="or", limit=30).results]
+        for algorithm in algorithms for query in QUERIES
+    }
+
+
+def _count_rebuilds(engine, monkeypatch):
+    calls = []
+    create_index = engine.create_index
+    monkeypatch.setattr(engine, "create_index", lambda *args, **kwargs: (calls.append(1),
+                                                                        create_index(*args, **kwargs))[1])
+    return calls
+
+
+@pytest.fixture(scope="module")
+def snapshot_path(tmp_path_factory, engine, catalog_path):
+    path = tmp_path_factory.mktemp("snapshot") / "index.bin"
+    engine.save_index(path, catalog_path)
+    return path
+
+
+def test_loaded_snapshot_ranks_like_a_fresh_index(engine, corpus, catalog_path, snapshot_path, monkeypatch):
+    loaded = SearchEngine()
+    rebuilds = _count_rebuilds(loaded, monkeypatch)
+    loaded.load_or_create_index(corpus, catalog_path, snapshot_path)
+
+    assert rebuilds == []
+    assert loaded.algorithms() == engine.algorithms()
+    expected = _rankings(engine, corpus, engine.algorithms())
+    assert all(expected.values())
+    assert _rankings(loaded, corpus, engine.algorithms()) == expected
+
+
+def test_loaded_dense_snapshot_ranks_like_a_fresh_index(tmp_path, corpus, catalog_path, monkeypatch):
+    if not dense_available():
+        pytest.skip("gensim is not installed")
+    fresh = SearchEngine(dense=True)
+    fresh.create_index(corpus)
+    fresh.save_index(tmp_path / "index.bin", catalog_path)
+
+    loaded = SearchEngine(dense=True)
+    rebuilds = _count_rebuilds(loaded, monkeypatch)
+    loaded.load_or_create_index(corpus, catalog_path, tmp_path / "index.bin")
+
+    assert rebuilds == []
+    assert _rankings(loaded, corpus, fresh.algorithms()) == _rankings(fresh, corpus, fresh.algorithms())
+
+
+def test_flipped_byte_is_detected(tmp_path, corpus, catalog_path, snapshot_path, monkeypatch):
+    corrupt = tmp_path / "index.bin"
+    data = bytearray(snapshot_path.read_bytes())
+    data[-1] ^= 0xFF
+    corrupt.write_bytes(bytes(data))
+
+    with pytest.raises(SnapshotError, match="checksum"):
+        load_snapshot(corrupt)
+
+    engine = SearchEngine()
+    rebuilds = _count_rebuilds(engine, monkeypatch)
+    engine.load_or_create_index(corpus, catalog_path, corrupt)
+    assert rebuilds == [1]
+    load_snapshot(corrupt) # reescrito y válido
+
+
+@pytest.mark.parametrize("changed", [
+    {"analyzer": "regex"},
+    pytest.param({"dense": True}, marks=pytest.mark.skipif(not dense_available(), reason="gensim is not installed")),
+])
+def test_changed_configuration_forces_a_rebuild(tmp_path, corpus, catalog_path, snapshot_path, changed, monkeypatch):
+    path = tmp_path / "index.bin"
+    path.write_bytes(snapshot_path.read_bytes())
+
+    engine = SearchEngine(**changed)
+    with pytest.raises(SnapshotError):
+        engine.load_index(path, catalog_path)
+
+    rebuilds = _count_rebuilds(engine, monkeypatch)
+    engine.load_or_create_index(corpus, catalog_path, path)
+    assert rebuilds == [1]
+    # El snapshot reescrito ya corresponde a la nueva configuración
+    SearchEngine(**changed).load_index(path, catalog_path)
+
+
+def test_changed_dense_parameters_force_a_rebuild(tmp_path, corpus, catalog_path, monkeypatch):
+    if not dense_available():
+        pytest.skip("gensim is not installed")
+    path = tmp_path / "index.bin"
+    SearchEngine(dense=True).load_or_create_index(corpus, catalog_path, path)
+
+    engine = SearchEngine(dense=True, ann_min_docs=1)
+    rebuilds = _count_rebuilds(engine, monkeypatch)
+    engine.load_or_create_index(corpus, catalog_path, path)
+    assert rebuilds == [1]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from myapp.search.algorithms import (
+    analyze_query, find_candidate_docs, rank_documents_tfidf, rank_documents_tfidf_csr,
+)
+from myapp.search.search_engine import SearchEngine
+
+QUERIES = ["cotton shirt", "shirt shirt cotton", "slim fit blue jeans", "women silk saree party wear",
+           "don't wash", "hoodie zzz", "soft"]
+
+
+def _ranking(ords, scores):
+    # Orden del motor (score descendente, ordinal); el redondeo absorbe la
+    # diferencia de último bit entre math.log10 y np.log10
+    ranked = sorted(zip(np.asarray(ords).tolist(), np.asarray(scores).tolist()),
+                    key=lambda x: (-round(x[1], 12), x[0]))
+    return [doc_ord for doc_ord, _ in ranked]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("mode", ["and", "or"])
+@pytest.mark.parametrize("by_columns", [False, True])
+def test_csr_cosine_matches_reference(engine, query, mode, by_columns):
+    query_terms = analyze_query(query, engine.analyzer)
+    docs_to_rank = find_candidate_docs(query_terms, engine.index, mode=mode)
+    reference = rank_documents_tfidf(query_terms, docs_to_rank, engine.index, engine.df, engine.N,
+                                     engine.tfidf_norms)
+    ords, scores = rank_documents_tfidf_csr(query_terms, docs_to_rank, engine.tfidf_matrix, engine.tfidf_norms,
+                                            engine.df, engine.N, engine.index if by_columns else None)
+
+    assert sorted(ords.tolist()) == sorted(doc_ord for doc_ord, _ in reference)
+    expected = dict(reference)
+    np.testing.assert_allclose(scores, [expected[doc_ord] for doc_ord in ords.tolist()], rtol=1e-12, atol=0)
+    assert _ranking(ords, scores) == _ranking(*zip(*reference)) if reference else not len(ords)
+
+
+def test_vectorized_engine_ranks_tfidf_like_the_reference(engine, corpus):
+    reference_engine = SearchEngine(vectorized=False, dense=False)
+    reference_engine.create_index(corpus)
+    for query in QUERIES:
+        for mode in ("and", "or"):
+            expected = reference_engine.search_page(query, 0, corpus, algorithm="tfidf", mode=mode, limit=50)
+            got = engine.search_page(query, 0, corpus, algorithm="tfidf", mode=mode, limit=50)
+            assert [item.pid for item in got.results] == [item.pid for item in expected.results]
+            np.testing.assert_allclose([item.ranking for item in got.results],
+                                       [item.ranking for item in expected.results], rtol=1e-12, atol=0)
@@ -0,0 +1,44 @@
+import pytest
+
+from myapp.search.algorithms import analyze_query, find_candidate_docs, rank_documents_bm25, top_k_tuples
+from myapp.search.search_engine import SearchEngine
+
+QUERIES = ["cotton shirt", "slim fit blue jeans", "women silk saree party wear", "soft", "hoodie zzz"]
+
+
+def _baseline_your_score(engine, corpus, query, mode, k):
+    """La fórmula original: 0.8 * Norm(BM25) + 0.2 * Norm(Rating), documento a documento."""
+    query_terms = analyze_query(query, engine.analyzer)
+    docs_to_rank = find_candidate_docs(query_terms, engine.index, mode=mode)
+    ranked_tuples = rank_documents_bm25(query_terms, docs_to_rank, engine.index, engine.df, engine.N,
+                                        engine.doc_lengths, engine.avg_doc_length)
+    if not ranked_tuples:
+        return []
+    max_bm25 = max(score for _, score in ranked_tuples) or 1
+    hybrid_scores = {}
+    for doc_ord, bm25_score in ranked_tuples:
+        doc_obj = corpus[engine.doc_ids[doc_ord]]
+        rating = doc_obj.average_rating if doc_obj.average_rating else 0
+        hybrid_scores[doc_ord] = (0.8 * (bm25_score / max_bm25)) + (0.2 * (rating / 5.0))
+    return [(engine.doc_ids[doc_ord], score) for doc_ord, score in top_k_tuples(hybrid_scores.items(), k)]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("mode", ["and", "or"])
+@pytest.mark.parametrize("store", [True, False], ids=["document_store", "dict"])
+def test_default_weights_reproduce_the_baseline_formula(engine, corpus, query, mode, store):
+    # FeatureStore lee las columnas del DocumentStore o los Document de un dict
+    docs = corpus if store else {pid: corpus[pid] for pid in corpus}
+    expected = _baseline_your_score(engine, docs, query, mode, k=50)
+
+    results = engine.search_page(query, 0, docs, algorithm="your_score", mode=mode, limit=50).results
+    assert [(item.pid, item.ranking) for item in results] == expected
+
+
+def test_other_weights_change_the_ranking(corpus, engine):
+    in_stock = SearchEngine(your_score_weights={"bm25": 0.5, "in_stock": 0.5})
+    in_stock.create_index(corpus)
+    results = in_stock.search_page("cotton shirt", 0, corpus, algorithm="your_score", mode="or", limit=20).results
+    default = engine.search_page("cotton shirt", 0, corpus, algorithm="your_score", mode="or", limit=20).results
+    assert [item.pid for item in results] != [item.pid for item in default]
+    assert not any(corpus[item.pid].out_of_stock for item in results)
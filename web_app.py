@@ -1,12 +1,13 @@
 import os
-from json import JSONEncoder
+from json import JSONEncoder, loads
 import uuid
 
 import httpagentparser  # for getting the user agent as json
-from flask import Flask, render_template, session, request, redirect, url_for
+from flask import Flask, Response, render_template, session, request, redirect, url_for, jsonify
 
 # Importamos tus clases (asegúrate de que los archivos existen en las carpetas correctas)
 from myapp.analytics.analytics_data import AnalyticsData, ClickedDoc
+from myapp.core.metrics import REGISTRY, SlowRequestProfiler
 from myapp.search.load_corpus import load_corpus
 from myapp.search.objects import Document, StatsDocument
 from myapp.search.search_engine import SearchEngine
@@ -31,12 +32,46 @@ app.secret_key = os.getenv("SECRET_KEY", "super_secret_key_default") # Added def
 # open browser dev tool to see the cookies
 app.session_cookie_name = os.getenv("SESSION_COOKIE_NAME", "irwa_session")
 
-# instantiate our search engine
-search_engine = SearchEngine()
-# instantiate our in memory persistence (ahora con persistencia JSON gracias a tu código)
-analytics_data = AnalyticsData()
-# instantiate RAG generator
-rag_generator = RAGGenerator()
+# instantiate our search engine ('nltk' or the faster 'regex' analyzer)
+# YOUR_SCORE_WEIGHTS: JSON, p.ej. {"bm25": 0.7, "rating": 0.2, "in_stock": 0.1}
+# BM25F_FIELD_WEIGHTS: JSON, p.ej. {"title": 2.0, "description": 1.0, "brand": 1.5}
+# HYBRID_FUSION: 'rrf' o 'weighted'; HYBRID_WEIGHTS: JSON, p.ej. {"bm25": 0.6, "word2vec": 0.4}
+# DENSE_INDEX=1 entrena word2vec al indexar (algoritmos word2vec e hybrid; necesita gensim)
+search_engine = SearchEngine(
+    analyzer=os.getenv("SEARCH_ANALYZER", "nltk"),
+    dense=os.getenv("DENSE_INDEX", "0") == "1",
+    your_score_weights=loads(os.getenv("YOUR_SCORE_WEIGHTS", "null")),
+    field_weights=loads(os.getenv("BM25F_FIELD_WEIGHTS", "null")),
+    hybrid_fusion=os.getenv("HYBRID_FUSION", "rrf"),
+    hybrid_weights=loads(os.getenv("HYBRID_WEIGHTS", "null")),
+)
+# instantiate our in memory persistence (JSON por defecto, SQLite con ANALYTICS_BACKEND=sqlite)
+analytics_data = AnalyticsData(
+    backend=os.getenv("ANALYTICS_BACKEND", "json"),
+    sqlite_path=os.getenv("ANALYTICS_SQLITE_PATH", "data/analytics.sqlite3"),
+)
+# instantiate RAG generator (con caché de respuestas persistida si RAG_CACHE_PATH está definido)
+rag_generator = RAGGenerator(cache_path=os.getenv("RAG_CACHE_PATH"))
+# /stats y /dashboard muestran solo los documentos más visitados
+TOP_CLICKED_LIMIT = 100
+# Resultados por página en /search (?page=N)
+RESULTS_PER_PAGE = 20
+
+# Métricas por etapa (ver /metrics); METRICS_ENABLED=0 las desactiva
+REGISTRY.enabled = os.getenv("METRICS_ENABLED", "1") != "0"
+# Profiler de peticiones lentas: PROFILE_SLOW_REQUESTS_MS=500 guarda el cProfile de las
+# búsquedas muestreadas (PROFILE_SAMPLE_RATE, 0.1 por defecto) que tarden más en PROFILE_DIR
+slow_request_profiler = SlowRequestProfiler.from_env()
+
+
+def _cache_gauges():
+    """Hits / misses / tamaño de las cachés de búsqueda y del RAG para /metrics."""
+    caches = {"search_results": search_engine.result_cache.stats(), "rag_responses": rag_generator.response_cache.stats()}
+    return {(cache, stat): value for cache, stats in caches.items() for stat, value in stats.items()}
+
+
+REGISTRY.collector("cache_stats", "Search and RAG cache counters (hits, misses, evictions, size, maxsize)",
+                   _cache_gauges, labels=("cache", "stat"))
 
 # load documents corpus into memory.
 # CAMBIO: Gestión más robusta de la ruta del archivo
@@ -55,9 +90,13 @@ try:
     print(f"\nCorpus loaded successfully: {len(corpus)} documents.")
     
     # CAMBIO IMPORTANTE: Crear el índice al arrancar la aplicación
-    # Esto prepara BM25 y las estructuras de datos.
+    # Esto prepara BM25 y las estructuras de datos. Si existe un snapshot del
+    # índice para este dataset se mapea en memoria en lugar de reindexar.
     print("Building Search Index... Please wait.")
-    search_engine.create_index(corpus)
+    snapshot_file = os.getenv("INDEX_SNAPSHOT_PATH", "data/index_snapshot.bin")
+    snapshot_path = os.path.join(path, snapshot_file) if not os.path.isabs(snapshot_file) else snapshot_file
+    index_workers = int(os.getenv("INDEX_WORKERS", 1))
+    search_engine.load_or_create_index(corpus, file_path, snapshot_path, workers=index_workers)
     print("Index ready!")
 
 except Exception as e:
@@ -91,10 +130,84 @@ def index():
         agent
     )
 
-    return render_template('index.html', page_title="Welcome")
+    return render_template('index.html', page_title="Welcome", algorithms=search_engine.algorithms())
+
+
+# Facetas categóricas que se pueden filtrar desde la URL (?brand=...&category=...)
+FACET_PARAMS = ("brand", "category", "sub_category", "seller")
+# campo numérico -> (parámetro mínimo, parámetro máximo)
+RANGE_PARAMS = {
+    "selling_price": ("min_price", "max_price"),
+    "average_rating": ("min_rating", None),
+    "discount": ("min_discount", None),
+}
+
+
+def _parse_filters(args):
+    """Filtros por facetas de los parámetros de la petición (ver FacetIndex)."""
+    filters = {field: args.getlist(field) for field in FACET_PARAMS if args.getlist(field)}
+    if args.get("in_stock") == "1":
+        filters["out_of_stock"] = False
+    for field, params in RANGE_PARAMS.items():
+        bounds = []
+        for param in params:
+            try:
+                bounds.append(float(args[param]) if param and args.get(param) else None)
+            except ValueError:
+                bounds.append(None) # valor no numérico: se ignora
+        if any(bound is not None for bound in bounds):
+            filters[field] = tuple(bounds)
+    return filters
+
+
+def _facet_links(args, facets):
+    """
+    Enlaces para refinar la búsqueda: por cada valor de faceta, la URL que
+    añade (o quita, si ya está activo) ese filtro.
+    """
+    links = {}
+    for field in FACET_PARAMS:
+        active = args.getlist(field)
+        entries = []
+        for value, count in facets.get(field, []):
+            if not value:
+                continue
+            params = args.to_dict(flat=False)
+            params.pop("page", None) # al cambiar filtros se vuelve a la primera página
+            selected = value in active
+            params[field] = [v for v in active if v != value] if selected else active + [value]
+            entries.append({"value": value, "count": count, "selected": selected,
+                            "url": url_for('search_form_post', **params)})
+        if entries:
+            links[field] = entries
+    params = args.to_dict(flat=False)
+    params.pop("page", None)
+    if args.get("in_stock") == "1":
+        params.pop("in_stock")
+    else:
+        params["in_stock"] = ["1"]
+    links["in_stock"] = {"selected": args.get("in_stock") == "1",
+                         "count": facets.get("out_of_stock", {}).get(False, 0),
+                         "url": url_for('search_form_post', **params)}
+    return links
+
+
+def _page_links(args, search_page):
+    """URLs de la página anterior / siguiente (None si no hay)."""
+    params = args.to_dict(flat=False)
+    page = search_page.offset // RESULTS_PER_PAGE + 1
+    links = {"page": page, "prev": None, "next": None}
+    if page > 1:
+        params["page"] = [str(page - 1)]
+        links["prev"] = url_for('search_form_post', **params)
+    if search_page.has_more:
+        params["page"] = [str(page + 1)]
+        links["next"] = url_for('search_form_post', **params)
+    return links
 
 
 @app.route('/search', methods=['GET', 'POST'])
+@slow_request_profiler.profiled
 def search_form_post():
     search_query = request.args.get('search-query') or request.form.get('search-query')
     
@@ -113,18 +226,32 @@ def search_form_post():
     # ---> CAMBIO CLAVE AQUÍ: Leer el algoritmo <---
     algorithm = request.args.get('algorithm') or request.form.get('algorithm')
     
-    # Si no viene nada, por defecto 'bm25'
-    if not algorithm: algorithm = 'bm25'
+    # Si no viene nada (o no está disponible, p.ej. word2vec sin gensim), por defecto 'bm25'
+    if algorithm not in search_engine.algorithms(): algorithm = 'bm25'
 
-    # Pasamos el algoritmo a la función search
-    results = search_engine.search(search_query, search_id, corpus, algorithm=algorithm)
+    # Filtros por facetas (marca, categoría, stock, rango de precio...), antes de puntuar
+    filters = _parse_filters(request.args)
 
-    # 3. RAG
-    rag_response = rag_generator.generate_response(search_query, results)
+    # Página pedida (?page=N, desde 1); las siguientes reutilizan el ranking ya calculado
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        page = 1
 
-    found_count = len(results)
+    # Pasamos el algoritmo a la función search
+    search_page = search_engine.search_page(search_query, search_id, corpus, algorithm=algorithm,
+                                            offset=(page - 1) * RESULTS_PER_PAGE,
+                                            limit=RESULTS_PER_PAGE, filters=filters)
+    results = search_page.results
+    facets = search_engine.facet_counts(search_query, corpus, filters=filters, algorithm=algorithm)
+
+    # Total de documentos que cumplen la query y los filtros (no solo esta página)
+    found_count = facets["total"]
     session['last_found_count'] = found_count
 
+    # 3. RAG: se genera en segundo plano y la página lo pide a /rag_summary
+    rag_job_id = rag_generator.submit(search_query, results, total=found_count)
+
     # Pasamos 'algorithm' al template también para mostrarlo en el título
     # Pasamos 'query=search_query' para que se vea en el título HTML
     return render_template(
@@ -133,9 +260,33 @@ def search_form_post():
         results_list=results, 
         page_title=f"Results for {search_query}", 
         found_counter=found_count, 
-        rag_response=rag_response, 
-        algorithm=algorithm
+        rag_job_id=rag_job_id, 
+        algorithm=algorithm,
+        facets=facets,
+        facet_links=_facet_links(request.args, facets),
+        page_links=_page_links(request.args, search_page)
     )
+
+
+@app.route('/rag_summary', methods=['GET'])
+def rag_summary():
+    """
+    Estado del resumen RAG de una búsqueda (la página de resultados lo consulta
+    hasta que está listo).
+    """
+    job_id = request.args.get("job_id")
+    summary = rag_generator.poll(job_id) if job_id else None
+    if summary is None:
+        return jsonify({"status": "unknown"}), 404
+    return jsonify(summary)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Contadores e histogramas de latencia por etapa en formato texto de Prometheus."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/doc_details', methods=['GET'])
 def doc_details():
     """
@@ -176,8 +327,8 @@ def stats():
     Show simple statistics example.
     """
     docs = []
-    # Iteramos sobre los clicks registrados
-    for doc_id, count in analytics_data.fact_clicks.items():
+    # Iteramos sobre los clicks registrados (ya ordenados por número de clicks)
+    for doc_id, count in analytics_data.top_clicked_docs(limit=TOP_CLICKED_LIMIT):
         # Buscar el doc en el corpus. Si el ID es string/int, intentar ambos
         doc_obj = corpus.get(doc_id)
         if not doc_obj:
@@ -195,8 +346,6 @@ def stats():
             )
             docs.append(doc)
     
-    # Sort by click count descending
-    docs.sort(key=lambda doc: doc.count, reverse=True)
     return render_template('stats.html', clicks_data=docs)
 
 
@@ -205,9 +354,12 @@ def dashboard():
     """
     Muestra el dashboard con la tabla de visitados y el gráfico
     """
+    # Un solo flush para toda la página: los agregados se leen con flush=False
+    analytics_data.flush()
+
     # 1. Generar lista de documentos visitados
     visited_docs = []
-    for doc_id, count in analytics_data.fact_clicks.items():
+    for doc_id, count in analytics_data.top_clicked_docs(limit=TOP_CLICKED_LIMIT, flush=False):
         doc_obj = corpus.get(doc_id)
         if not doc_obj:
             try: doc_obj = corpus.get(int(doc_id))
@@ -218,13 +370,12 @@ def dashboard():
             doc = ClickedDoc(doc_id, doc_obj.description, count)
             visited_docs.append(doc)
 
-    # Ordenar por visitas
-    visited_docs.sort(key=lambda doc: doc.counter, reverse=True)
-
     # 2. Generar el gráfico (ESTO FALTABA)
-    chart_json = analytics_data.plot_number_of_views()
+    chart_json = analytics_data.plot_number_of_views(flush=False)
+
+    sessions_chart_json = analytics_data.plot_queries_per_session(flush=False)
 
-    sessions_chart_json = analytics_data.plot_queries_per_session()
+    queries_chart_json = analytics_data.plot_queries_over_time(flush=False)
 
 
     # 3. Renderizar pasando AMBAS variables
@@ -232,7 +383,8 @@ def dashboard():
         'dashboard.html', 
         visited_docs=visited_docs, 
         chart_json=chart_json,  # <--- ¡Esta es la clave del error!
-        sessions_chart_json=sessions_chart_json
+        sessions_chart_json=sessions_chart_json,
+        queries_chart_json=queries_chart_json
     )
 
 
@@ -245,4 +397,5 @@ def plot_number_of_views():
 
 if __name__ == "__main__":
     # Ejecutar en puerto 8088 como pide el código original
-    app.run(port=8088, host="0.0.0.0", threaded=False, debug=os.getenv("DEBUG", True))
\ No newline at end of file
+    # AnalyticsData es thread-safe: el servidor puede atender peticiones en paralelo
+    app.run(port=8088, host="0.0.0.0", threaded=True, debug=os.getenv("DEBUG", True))
\ No newline at end of file